@@ -0,0 +1,86 @@
+import numpy as np
+
+#########################################################
+# Forcing of a run: the columns of weather.csv
+#########################################################
+#DOY                        Day Of Year
+#Temperature                temperature (degree celsius)
+#PARi                       photosynthetic radiation incident (MJ.m-2)
+#PP                         Precipitation (mm)
+#PET                        Potential ET (mm/day)
+#eta                        Actual ET from Remote Sensing (mm/day)
+#lai                        Leaf Area Index from Remote Sensing (cm2/cm2)
+#gcut_height                Grass cut event cutHeight (m)
+#grazing_animal_count       Grazing animal count (-)
+#grazing_avg_animal_weight  Grazing average animal weight (kg)
+
+FORCING_COLUMNS = ('DOY', 'Temperature', 'PARi', 'PP', 'PET', 'eta', 'lai', 'gcut_height', 'grazing_animal_count', 'grazing_avg_animal_weight')
+
+class Forcing:
+    """
+    Weather (and grass cut and grazing) forcing of a run
+
+    One contiguous float64 array per column of weather.csv, keyed by name,
+    of shape (ndays,) for one cell or (ndays, ncells) for a grid,
+    so the daily loop reads a plain array element instead of a record field.
+    """
+    __slots__ = FORCING_COLUMNS
+
+    def __init__(self, columns):
+        """
+        :param columns: mapping (dict, structured array, npz...) of the FORCING_COLUMNS to arrays
+        """
+        for name in FORCING_COLUMNS:
+            setattr(self, name, np.ascontiguousarray(columns[name], dtype=np.float64))
+        for name in FORCING_COLUMNS[1:]:
+            if getattr(self, name).shape != self.DOY.shape:
+                raise ValueError("Forcing column %s has shape %s instead of %s" % (name, getattr(self, name).shape, self.DOY.shape))
+
+    @classmethod
+    def stack(cls, forcings):
+        """
+        Build a grid forcing, one column per cell
+
+        :param forcings: list of single cell Forcing (or weather arrays) of the same length
+        :return the Forcing of shape (ndays, ncells)
+        """
+        forcings = [to_forcing(f) for f in forcings]
+        return cls({name: np.stack([f[name] for f in forcings], axis=1) for name in FORCING_COLUMNS})
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __len__(self):
+        return len(self.DOY)
+
+    @property
+    def shape(self):
+        """(ndays,) or (ndays, ncells)"""
+        return self.DOY.shape
+
+    def cells(self, index):
+        """
+        Return the Forcing of a subset of the cells
+
+        :param index: slice, integer array or boolean mask over the cells
+        """
+        return Forcing({name: getattr(self, name)[:, index] for name in FORCING_COLUMNS})
+
+    def days(self, index):
+        """
+        Return the Forcing of a subset of the days
+
+        :param index: slice, integer array or boolean mask over the days
+        """
+        return Forcing({name: getattr(self, name)[index] for name in FORCING_COLUMNS})
+
+def to_forcing(weather):
+    """
+    Convert the weather structured array of read_weather() into a Forcing, once
+
+    :param weather: a Forcing (returned as it is) or a weather structured array
+    :return the Forcing
+    """
+    if isinstance(weather, Forcing):
+        return weather
+    return Forcing(weather)
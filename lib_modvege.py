@@ -741,6 +741,16 @@ def defoliation(gv_biomass, dv_biomass, gr_biomass, dr_biomass, cutHeight, rhogv
 
     return(sumBiomassIngested)
 
+def getMaxAmountToIngest(grazing_animal_count, grazing_avg_animal_weight, cellSurface):
+    """
+    Daily intake capacity of the herd grazing the cell (2.5% of live weight per animal)
+    @param grazing_animal_count number of animals in the cell
+    @param grazing_avg_animal_weight average animal weight (kg)
+    @param cellSurface Surface of the pixel (Ha)
+    @return the maximum amount of biomass the herd can ingest (kg DM ha-1)
+    """
+    return(0.025 * grazing_animal_count * grazing_avg_animal_weight / cellSurface)
+
 def greenLimbsMass(gv_gamma, gv_biomass):
     """
     Calculation of mass of green limbs for the cell
@@ -789,6 +799,44 @@ def getSumTemperature(weather, doy, t0):
 
     return(sumTemperature)
 
+def getSumTemperatureSeries(weather, t0):
+    """
+    Return the sum temperature of every DOY at once (running sum of the weather)
+    getSumTemperatureSeries(weather, t0)[doy] == getSumTemperature(weather, doy, t0)
+    @param weather the weather array or Forcing, (ndays,) or (ndays, ncells)
+    @param t0 minimum temperature for growth
+    @return the sum temperature above t0 for DOY [0-ndays], (ndays+1,) or (ndays+1, ncells)
+    """
+    temperature = weather['Temperature']
+    sumTemperature = np.zeros((len(temperature)+1,) + temperature.shape[1:])
+    # cumsum adds the days one after the other, as getSumTemperature does
+    np.cumsum(np.where(temperature > t0, temperature - t0, 0), axis=0, out=sumTemperature[1:])
+    return(sumTemperature)
+
+def getMeanTenDaysTemperatureSeries(weather, previous=None):
+    """
+    Return the mean ten days temperature of every DOY at once
+    The window is the one of the daily loop: 9 days [doy-1 ... doy-9] before DOY 10
+    (wrapping to the end of the weather file, or reading the previous temperatures), [doy-10 ... doy-2] from DOY 10 on
+    @param weather the weather array or Forcing, (ndays,) or (ndays, ncells)
+    @param previous temperature of the days before the first day (the end of the previous year), 9 days at least, (n,) or (n, ncells)
+    @return the mean ten days temperature for DOY [0-ndays], (ndays+1,) or (ndays+1, ncells)
+    """
+    temperature = weather['Temperature']
+    ndays = len(temperature)
+    doy = np.arange(ndays+1)
+    offsets = np.where(doy[:, None] < 10, np.arange(1, 10, 1), np.arange(10, 1, -1))
+    if previous is None:
+        t = [temperature[(doy - offsets[:, j]) % ndays] for j in range(9)]
+    else:
+        # the days before the first one are read from the previous temperatures
+        previous = np.asarray(previous, dtype=np.float64)
+        cells = np.broadcast_shapes(previous.shape[1:], temperature.shape[1:])
+        series = np.concatenate([np.broadcast_to(previous, previous.shape[:1] + cells), np.broadcast_to(temperature, (ndays,) + cells)])
+        t = [series[doy - offsets[:, j] + len(previous)] for j in range(9)]
+    # Sum in the order np.mean() uses for 9 values, so the means are bit-identical
+    return((((t[0] + t[1]) + (t[2] + t[3])) + ((t[4] + t[5]) + (t[6] + t[7])) + t[8]) / 9)
+
 #TODO This set of functions are either not used or not useful
 
 def addNI(ni, amountToIncrease):
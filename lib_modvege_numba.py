@@ -0,0 +1,444 @@
+import importlib.util
+import warnings
+import numpy as np
+
+from lib_modvege import getSumTemperatureSeries, getMeanTenDaysTemperatureSeries
+from lib_forcing import to_forcing
+from lib_params import to_params, PARAM_NAMES
+from lib_output import ModvegeOutput, BlockOutput, DEFAULT_BLOCK_DAYS
+from lib_state import STATE_VARIABLES, run_state
+from lib_scenario import MANAGEMENT_COLUMNS, run_management
+
+# Compiled engine of Mod Vege: the daily loop of modvege.modvege() and the
+# lib_modvege functions it calls are fused into a single function, so a whole
+# simulated year of a cell (or of a batch of cells) runs as one compiled loop.
+# numba is optional, it is only imported the first time the engine is used.
+
+ENGINES = ('python', 'numba', 'auto')
+
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+
+#Define DEFAULT_CUT_HEIGHT 0.05
+DEFAULT_CUT_HEIGHT = 0.05
+
+#Define ENGINE_RTOL 1e-12 largest relative deviation of the compiled engine from the python one
+# (LLVM contracts and reorders a few floating point operations, pgro and gro differ by an ulp or so)
+ENGINE_RTOL = 1e-12
+
+def use_compiled_engine(engine):
+    """
+    Check if the compiled engine has to be used
+
+    :param engine: 'python' (the reference loop), 'numba' or 'auto' (numba if installed)
+    :return True for the compiled engine, False for the python one
+    """
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine %r, expected one of %s" % (engine, ", ".join(ENGINES)))
+    if engine == 'python':
+        return False
+    if not HAVE_NUMBA:
+        if engine == 'numba':
+            warnings.warn("numba is not installed, falling back to the python engine")
+        return False
+    return True
+
+def _modvege_cells(p, temperature, pari_in, pp, pet_in, eta_in, lai_in, cutHeight_in, animal_count, animal_weight, sumTemperature, meanTenDaysTemperature, startdoy, enddoy, state, columns, out):
+    """
+    Daily loop of modvege.modvege(), all the lib_modvege functions inlined, for every cell
+
+    :param p: parameters, (ncells, 44)
+    :param temperature...lai_in: weather columns, (ndays, 1) shared by all cells or (ndays, ncells)
+    :param cutHeight_in...animal_weight: cut and grazing columns, (ndays, 1) shared by all cells or (ndays, ncells)
+    :param sumTemperature: getSumTemperatureSeries() of the weather, (ndays+1, 1 or ncells)
+    :param meanTenDaysTemperature: getMeanTenDaysTemperatureSeries() of the weather, (ndays+1, 1 or ncells)
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param state: state of every cell, (ncells, len(lib_state.STATE_VARIABLES)), updated in place
+    :param columns: index in OUTPUT_VARIABLES of the recorded variables
+    :param out: the outputs, (enddoy-startdoy, len(columns), ncells)
+    """
+    ncells = p.shape[0]
+    day = np.empty(18)
+    for i in range(startdoy, enddoy):
+        k = i - startdoy
+        for c in range(ncells):
+            # weather column of the cell
+            w = c if temperature.shape[1] > 1 else 0
+            # management column of the cell
+            m = c if cutHeight_in.shape[1] > 1 else 0
+            st1 = p[c, 0]
+            st2 = p[c, 1]
+            waterHoldingCapacity = p[c, 3]
+            minsea = p[c, 5]
+            maxsea = p[c, 6]
+            alphapar = p[c, 8]
+            t0 = p[c, 9]
+            t1 = p[c, 10]
+            t2 = p[c, 11]
+            sla = p[c, 14]
+            lls = p[c, 15]
+            rhogv = p[c, 16]
+            pctlam = p[c, 17]
+            rhogr = p[c, 21]
+            kdv = p[c, 23]
+            kldv = p[c, 24]
+            rhodv = p[c, 25]
+            kdr = p[c, 27]
+            kldr = p[c, 28]
+            rhodr = p[c, 29]
+            ruemax = p[c, 34]
+            gv_gamma = p[c, 35]
+            gr_gamma = p[c, 36]
+            cellSurface = p[c, 43]
+
+            gv_biomass = state[c, 0]
+            dv_biomass = state[c, 1]
+            gr_biomass = state[c, 2]
+            dr_biomass = state[c, 3]
+            gv_avg_age = state[c, 4]
+            gr_avg_age = state[c, 5]
+            dv_avg_age = state[c, 6]
+            dr_avg_age = state[c, 7]
+            waterReserve = state[c, 8]
+            ni = state[c, 9]
+            isCut = state[c, 10] != 0
+            a2rFlag = state[c, 11] != 0
+            harvestedBiomass = state[c, 12]
+            ingestedBiomass = state[c, 13]
+            previousAvBiom4cut = state[c, 14]
+
+            T = temperature[i-1, w]
+            meanTenDaysT = meanTenDaysTemperature[i, w]
+            pari = pari_in[i-1, w]
+            pmm = pp[i-1, w]
+            pet = pet_in[i-1, w]
+            eta = eta_in[i-1, w]
+            lai = lai_in[i-1, w]
+            cutHeight = cutHeight_in[i-1, m]
+            grazing_animal_count = animal_count[i-1, m]
+            grazing_avg_animal_weight = animal_weight[i-1, m]
+            sumT = sumTemperature[i, w]
+
+            # fsea
+            if(sumT < 200 or sumT >= st2):
+                sea = minsea
+            elif(sumT < st1 - 200):
+                sea = minsea+(maxsea-minsea)*(sumT-200) / (st1 - 400)
+            elif(sumT < st1 - 100):
+                sea = maxsea
+            else:
+                sea = maxsea+(minsea-maxsea)*(sumT - st1 + 100) / (st2 - st1 + 100)
+            # fTemperature
+            if(meanTenDaysT < t0 or meanTenDaysT >= 40):
+                ftm = 0.0
+            elif(meanTenDaysT < t1):
+                ftm = (meanTenDaysT - t0) / (t1 - t0)
+            elif(meanTenDaysT < t2):
+                ftm = 1.0
+            else:
+                ftm = (40 - meanTenDaysT) / (40 - t2)
+
+            isHarvested = cutHeight != 0.0
+            isGrazed = grazing_animal_count != 0 and grazing_avg_animal_weight != 0
+            if(not isGrazed and not isHarvested):
+                isCut = False
+            if(ni < 0.35):
+                ni = 0.35
+
+            # fWaterStress, before the water reserve update (for aet)
+            waterStress = min(waterReserve/waterHoldingCapacity, 1.0)
+            if(pet <= 3.8):
+                if(waterStress <= 0.2):
+                    fws = 4 * waterStress
+                elif(waterStress <= 0.4):
+                    fws = 0.75 * waterStress + 0.65
+                elif(waterStress <= 0.6):
+                    fws = 0.25 * waterStress + 0.85
+                else:
+                    fws = 1.0
+            elif(pet <= 6.5):
+                if(waterStress <= 0.2):
+                    fws = 2 * waterStress
+                elif(waterStress <= 0.4):
+                    fws = 1.5 * waterStress + 0.1
+                elif(waterStress <= 0.6):
+                    fws = waterStress + 0.3
+                elif(waterStress <= 0.8):
+                    fws = 0.5 * waterStress + 0.6
+                else:
+                    fws = 1.0
+            else:
+                fws = waterStress
+            # fclai and aet
+            if(int(eta) == 0):
+                if(int(lai) == 0):
+                    lai = sla * (gv_biomass/10) * pctlam
+                aetLai = lai
+                if(int(aetLai) == 0):
+                    aetLai = sla * pctlam * (gv_biomass/10)
+                pt = pet * (1-np.exp(-0.6*aetLai))
+                pe = pet - pt
+                eta = pt * fws + pe * waterStress
+            waterReserve = min(max(0.0, waterReserve + pmm - eta), waterHoldingCapacity)
+
+            # cut and defoliation
+            ingestedBiomassPart = 0.0
+            if(sumT > st1 and sumT < st2):
+                if(isHarvested):
+                    isCut = True
+                    if(rhogv*cutHeight*10 < gv_biomass):
+                        gv_biomass = rhogv*cutHeight*10
+                    if(rhodv*cutHeight*10 < dv_biomass):
+                        dv_biomass = rhodv*cutHeight*10
+                    if(rhogr*cutHeight*10 < gr_biomass):
+                        gr_biomass = rhogr*cutHeight*10
+                    if(rhodr*cutHeight*10 < dr_biomass):
+                        dr_biomass = rhodr*cutHeight*10
+                if(isGrazed):
+                    isCut = True
+                    maxAmountToIngest = 0.025 * grazing_animal_count * grazing_avg_animal_weight / cellSurface
+                    sumAvailable = max(0.0, gv_biomass - cutHeight*rhogv*10) + max(0.0, dv_biomass - cutHeight*rhodv*10) \
+                            + max(0.0, gr_biomass - cutHeight*rhogr*10) + max(0.0, dr_biomass - cutHeight*rhodr*10)
+                    if(sumAvailable > 0):
+                        # defoliation() sums exeDefoliationByBiomass() of the 4 compartments
+                        ingestedBiomassPart = maxAmountToIngest + maxAmountToIngest + maxAmountToIngest + maxAmountToIngest
+                # rep
+                a2r = 0.25+((0.75*(ni-0.35)) / 0.65)
+            else:
+                a2r = 0.0
+            if(isCut):
+                a2rFlag = True
+            if(a2rFlag):
+                a2r = 0.0
+
+            # growth: ENV * PGRO * SEA
+            if(pari < 5):
+                fpari = 1.0
+            else:
+                fpari = max(1-alphapar*(pari - 5), 0.0)
+            waterStress = min(waterReserve/waterHoldingCapacity, 1.0)
+            if(pet <= 3.8):
+                if(waterStress <= 0.2):
+                    fws = 4 * waterStress
+                elif(waterStress <= 0.4):
+                    fws = 0.75 * waterStress + 0.65
+                elif(waterStress <= 0.6):
+                    fws = 0.25 * waterStress + 0.85
+                else:
+                    fws = 1.0
+            elif(pet <= 6.5):
+                if(waterStress <= 0.2):
+                    fws = 2 * waterStress
+                elif(waterStress <= 0.4):
+                    fws = 1.5 * waterStress + 0.1
+                elif(waterStress <= 0.6):
+                    fws = waterStress + 0.3
+                elif(waterStress <= 0.8):
+                    fws = 0.5 * waterStress + 0.6
+                else:
+                    fws = 1.0
+            else:
+                fws = waterStress
+            env = ftm * ni * fpari * fws
+            pgroLai = lai
+            if(int(pgroLai) == 0):
+                pgroLai = sla * pctlam * (gv_biomass/10)
+            pgr = pari*ruemax*(1-np.exp(-0.6*pgroLai))*10
+            gro = env * pgr * sea
+
+            # gv_update, with t0 = 0
+            if(gv_avg_age/lls < 1.0/3.0):
+                fage = 1.0
+            elif(gv_avg_age/lls < 1):
+                fage = 3 * gv_avg_age / lls
+            else:
+                fage = 3.0
+            if(T > 0):
+                gv_senescent_biomass = kdv*gv_biomass*T*fage
+            elif(T < 0):
+                gv_senescent_biomass = kdv*gv_biomass*abs(T)
+            else:
+                gv_senescent_biomass = 0.0
+            gv_biomass -= gv_senescent_biomass
+            if(T > 0):
+                growthBiomass = gro*(1-a2r)
+            else:
+                growthBiomass = 0.0
+            if(gv_biomass+growthBiomass > 0):
+                gv_avg_age = (max(0.0, T) + gv_avg_age) * (gv_biomass/(gv_biomass+growthBiomass))
+            else:
+                gv_avg_age = 0.0
+            gv_biomass += growthBiomass
+
+            # dv_update
+            if(dv_avg_age/lls < 1.0/3.0):
+                fage = 1.0
+            elif(dv_avg_age/lls < 2.0/3.0):
+                fage = 2.0
+            else:
+                fage = 3.0
+            if(T > 0):
+                dv_biomass -= kldv*dv_biomass*T*fage
+            growthBiomass = (1.0-gv_gamma) * gv_senescent_biomass
+            if(dv_biomass+growthBiomass > 0):
+                dv_avg_age = (max(0.0, T) + dv_avg_age) * (dv_biomass/(dv_biomass+growthBiomass))
+            else:
+                dv_avg_age = 0.0
+            dv_biomass += growthBiomass
+
+            # gr_update
+            if(gr_avg_age/(st2-st1) < 1.0/3.0):
+                fage = 1.0
+            elif(gr_avg_age/(st2-st1) < 1.0):
+                fage = (3*gr_avg_age/(st2-st1))
+            else:
+                fage = 3.0
+            if(T > t0):
+                gr_senescent_biomass = kdr*gr_biomass*T*fage
+            elif(T < 0):
+                gr_senescent_biomass = kdr*gr_biomass*abs(T)
+            else:
+                gr_senescent_biomass = 0.0
+            gr_biomass -= gr_senescent_biomass
+            if(T > t0):
+                growthBiomass = gro*(a2r)
+            else:
+                growthBiomass = 0.0
+            if(gr_biomass+growthBiomass > 0):
+                gr_avg_age = (max(0.0, T) + gr_avg_age) * (gr_biomass/(gr_biomass+growthBiomass))
+            else:
+                gr_avg_age = 0.0
+            gr_biomass += growthBiomass
+
+            # dr_update
+            if(dr_avg_age/(st2-st1) < 1.0/3.0):
+                fage = 1.0
+            elif(dr_avg_age/(st2-st1) < 2.0/3.0):
+                fage = 2.0
+            else:
+                fage = 3.0
+            if(T > 0):
+                dr_biomass -= kldr*dr_biomass*T*fage
+            growthBiomass = (1-gr_gamma)*gr_senescent_biomass
+            if(dr_biomass+growthBiomass > 0):
+                dr_avg_age = max(0.0, T) + dr_avg_age*dr_biomass/(dr_biomass+growthBiomass)
+            else:
+                dr_avg_age = 0.0
+            dr_biomass += growthBiomass
+
+            # getAvailableBiomassForCut
+            if(not isCut):
+                cutHeight = DEFAULT_CUT_HEIGHT
+            avBiom4cut = max(0.0, gv_biomass - cutHeight*rhogv*10) + max(0.0, dv_biomass - cutHeight*rhodv*10) \
+                    + max(0.0, gr_biomass - cutHeight*rhogr*10) + max(0.0, dr_biomass - cutHeight*rhodr*10)
+
+            if(isCut):
+                harvestedBiomass += previousAvBiom4cut
+            previousAvBiom4cut = avBiom4cut
+            ingestedBiomass += ingestedBiomassPart
+
+            state[c, 0] = gv_biomass
+            state[c, 1] = dv_biomass
+            state[c, 2] = gr_biomass
+            state[c, 3] = dr_biomass
+            state[c, 4] = gv_avg_age
+            state[c, 5] = gr_avg_age
+            state[c, 6] = dv_avg_age
+            state[c, 7] = dr_avg_age
+            state[c, 8] = waterReserve
+            state[c, 9] = ni
+            state[c, 10] = isCut
+            state[c, 11] = a2rFlag
+            state[c, 12] = harvestedBiomass
+            state[c, 13] = ingestedBiomass
+            state[c, 14] = previousAvBiom4cut
+
+            day[0] = gv_biomass
+            day[1] = dv_biomass
+            day[2] = gr_biomass
+            day[3] = dr_biomass
+            day[4] = harvestedBiomass
+            day[5] = ingestedBiomass
+            day[6] = gro
+            day[7] = avBiom4cut
+            day[8] = sumT
+            day[9] = gv_avg_age
+            day[10] = gr_avg_age
+            day[11] = dv_avg_age
+            day[12] = dr_avg_age
+            day[13] = sea
+            day[14] = ftm
+            day[15] = env
+            day[16] = pgr
+            day[17] = a2r
+            for j in range(len(columns)):
+                out[k, j, c] = day[columns[j]]
+
+_compiled_kernel = None
+
+def _kernel():
+    """
+    Return the compiled _modvege_cells, compiled (or loaded from numba's cache) on first use
+    """
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        import numba
+        _compiled_kernel = numba.njit(cache=True, error_model='numpy')(_modvege_cells)
+    return _compiled_kernel
+
+def modvege_numba(params, weather, startdoy, enddoy, outputs=None, compiled=True, sink=None, blocksize=None, state=None, management=None):
+    """
+    **Mod Vege** model as a function, with the compiled engine
+
+    :param params: ModvegeParams or array, (44,) or (ncells, 44) one row per cell
+    :param weather: Forcing or weather structured array, (ndays,) or (ndays, ncells)
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param compiled: False runs the same fused loop as plain python (slow, for checks)
+    :param sink: lib_output.OutputSink the outputs are streamed to, block by block, instead of being returned
+    :param blocksize: number of days held in memory before a block is written to the sink
+    :param state: lib_state.ModvegeState to start from (default is the initial values of params), updated in place to the state after the last day
+    :param management: lib_scenario.Management, (ndays, nscenarios) cut and grazing calendars replacing the ones of weather, one per cell
+    :return ModvegeOutput of the daily outputs, as modvege.modvege() or modvege_vec.modvege_vec() (the sink when streaming)
+    """
+    params = to_params(params)
+    forcing = to_forcing(weather)
+    management = run_management(management, forcing)
+    shape = np.broadcast_shapes(params.values.shape[:-1], forcing.shape[1:], management.shape[1:])
+    ncells = shape[0] if shape else 1
+    p = np.ascontiguousarray(np.broadcast_to(params.values, (ncells, len(PARAM_NAMES))))
+
+    def column(arr):
+        # (ndays, 1) shared by all cells or (ndays, ncells)
+        return arr.reshape(len(arr), -1)
+
+    ndays = max(0, enddoy - startdoy)
+    if sink is None:
+        out = ModvegeOutput(ndays, shape, variables=outputs, startdoy=startdoy)
+        blocksize = max(1, ndays)
+    else:
+        if blocksize is None:
+            blocksize = DEFAULT_BLOCK_DAYS
+        out = BlockOutput(sink, ndays, shape, variables=outputs, startdoy=startdoy, blocksize=blocksize)
+    kernel = _kernel() if compiled else _modvege_cells
+    weather_columns = [column(forcing[name]) for name in ('Temperature', 'PARi', 'PP', 'PET', 'eta', 'lai')]
+    weather_columns += [column(management[name]) for name in MANAGEMENT_COLUMNS]
+    sumTemperature = column(getSumTemperatureSeries(forcing, 0.55))
+    state = run_state(state, params, shape)
+    meanTenDaysTemperature = column(getMeanTenDaysTemperatureSeries(forcing, state.temperatures))
+    # one row per cell, in the order of STATE_VARIABLES
+    cells_state = np.array(state.values.reshape(ncells, len(STATE_VARIABLES)))
+    columns = np.array(out.columns, dtype=np.int64)
+    # the days are run block by block, the state carried from a block to the next
+    for first in range(startdoy, enddoy, blocksize):
+        last = min(first + blocksize, enddoy)
+        block = out.data[:last - first].reshape(last - first, len(out.variables), ncells)
+        kernel(p, *weather_columns, sumTemperature, meanTenDaysTemperature, first, last, cells_state, columns, block)
+        if sink is not None:
+            out.flush(last - first)
+    state.values[...] = cells_state.reshape(state.values.shape)
+    if sink is not None:
+        out.close(ndays)
+        return(sink)
+    return(out)
@@ -0,0 +1,603 @@
+import numpy as np
+
+# Array versions of the lib_modvege kernels.
+# Every biomass, age, flag and weather argument can be a 1-D array over cells
+# (or a scalar), the branches of the scalar functions are rewritten with
+# np.where/np.select so one call advances all the cells at once.
+# Cell by cell, the results are the ones of lib_modvege.
+
+# These ones are plain arithmetic and work on arrays as they are
+from lib_modvege import getAverageHeight, exeDefoliationByBiomass, getTotalBiomass, rep, fclai, greenLimbsMass, getMaxAmountToIngest, getSumTemperatureSeries, getMeanTenDaysTemperatureSeries
+
+def avDefoliationBiomass(biomass, cutHeight, bulkDensity):
+    """
+    Estimate av biomass for ingestion
+    @param biomass av biomass
+    @param cutHeight default cut height in cutEvent
+    @param bulkDensity bulk density
+    @return av biomass for ingestion
+    """
+    biomassAfterCut = cutHeight*bulkDensity*10
+    return np.maximum(0, biomass - biomassAfterCut)
+
+def exeDefoliation(biomass, cut_biomass, area):
+    """
+    Defoliation method
+    @param biomass av biomass
+    @param cut_biomass biomass removed by cut
+    @param area area studied (i.e. pixel area)
+    @return updated biomass after defoliation
+    """
+    biomass = biomass - cut_biomass/area
+    return np.where((biomass < 0) | np.isnan(biomass), 0, biomass)
+
+def exeCut(cutHeight, bulkDensity, biomass):
+    """
+    Realize a cut in order that the average height is under cutHeight.
+    @param cutHeight the average height after the cut in m
+    @param bulkDensity the bulk density (biomass after cut = height * 10 * bulk density)
+    @return the biomass taken in kg DM / m^2
+    @return the biomass left
+    """
+    biomassAfterCut = cutHeight*bulkDensity*10
+    isTaken = biomassAfterCut < biomass
+    return(np.where(isTaken, biomass - biomassAfterCut, 0), np.where(isTaken, biomassAfterCut, biomass))
+
+# Dry Vegetative Functions
+def dv_update(gv_gamma,gv_senescent_biomass,lls,kldv,temperature,dv_biomass,dv_avg_age):
+    """
+    Update DV
+    @param gv_gamma Respiratory C loss during senescence (DV) (1-gv_gamma=dv_gamma)
+    @param gv_senescent_biomass senescene of compartment GV
+    @param lls Leaf lifespan (degreeday)
+    @param kldv Abscission coefficient DV (degreeday)
+    @param temperature temperature
+    @param dv_biomass av DV biomass
+    @param dv_avg_age the average DV age
+    @return the Dry Vegetation biomass
+    @return the average DV age
+    """
+    abscissionBiomass = mk_dv_abscission(kldv,dv_biomass,temperature,dv_avg_age,lls)
+    dv_biomass = dv_biomass - abscissionBiomass
+    # at this point the biomass include cut, ingestion and abscission, not growth
+    growthBiomass = (1.0-gv_gamma) * gv_senescent_biomass
+    dv_avg_age = np.where(dv_biomass+growthBiomass > 0,
+            (np.maximum(0, temperature) + dv_avg_age) * (dv_biomass/(dv_biomass+growthBiomass)), 0)
+    dv_biomass = dv_biomass + growthBiomass
+    return(dv_biomass, dv_avg_age)
+
+def mk_dv_abscission(kldv,dv_biomass,temperature,dv_avg_age,lls):
+    """
+    Compute abscission biomass
+    @param lls Leaf lifespan (degreeday)
+    @param kldv Abscission coefficient DV (degreeday) (Ducroq,1996)
+    @param temperature temperature
+    @param dv_biomass av biomass
+    @param dv_avg_age the average DV age
+    @return abscissionBiomass the abscission biomass
+    """
+    age = np.select([dv_avg_age/lls < 1.0/3.0, dv_avg_age/lls < 2.0/3.0], [1, 2], 3)
+    return np.where(temperature > 0, kldv*dv_biomass*temperature*age, 0)
+
+# Dead Reproductive Functions
+def dr_update(gr_gamma,gr_senescent_biomass,st1,st2,temperature,kldr,dr_biomass,dr_avg_age):
+    """
+    Update compartment Dead Reproductive
+    @param gr_gamma a parameter to compute growth of DR (1-gr_gamma)=dr_gamma
+    @param gr_senescent_biomass Senescence of GR, computed in GR
+    @param st1 sum of temperature at the beginning
+    @param st2 sum of temperature in the end
+    @param temperature temperature
+    @param kldr basic rates of abscission in DR
+    @param dr_biomass av DR biomass
+    @param dr_avg_age the average DR age
+    @return dr_biomass updated biomass for DR
+    @return dr_avg_age the average DR age
+    """
+    abscissionBiomass = mk_dr_abscission(kldr,dr_biomass,temperature,dr_avg_age,st1,st2)
+    dr_biomass = dr_biomass - abscissionBiomass
+    # at this point the biomass include cut, ingestion and abscission, not growth
+    growthBiomass = (1-gr_gamma)*gr_senescent_biomass
+    dr_avg_age = np.where(dr_biomass+growthBiomass > 0,
+            np.maximum(0, temperature) + dr_avg_age*dr_biomass/(dr_biomass+growthBiomass), 0)
+    dr_biomass = dr_biomass + growthBiomass
+    return(dr_biomass, dr_avg_age)
+
+def mk_dr_abscission(kldr,dr_biomass,temperature,dr_avg_age,st1,st2):
+    """
+    Compute abscission biomass
+    @param kldr basic rates of abscission in DR (Ducroq,1996)
+    @param biomass av biomass
+    @param temperature temperature
+    @param dr_avg_age the average DR age
+    @param st1 sum of temperature at the beginning
+    @param st2 sum of temperature in the end
+    @return abscissionBiomass the abscission biomass
+    """
+    age = np.select([dr_avg_age/(st2-st1) < 1.0/3.0, dr_avg_age/(st2-st1) < 2.0/3.0], [1, 2], 3)
+    return np.where(temperature > 0, kldr*dr_biomass*temperature*age, 0)
+
+# Green Vegetative Functions
+def gv_update(gro, a2r, lls, temperature, kdv, t0, gv_biomass, gv_avg_age):
+    """
+    Update Green Vegetation
+    @param GRO in Jouven_2006a.pdf, total growth
+    @param a2r Allocate to reproductive (REP in Jouven_2006a.pdf, reproductive function)
+    @param lls Leaf lifespan (degreeday)
+    @param temperature Temperature
+    @param kdv Senescence coefficient DV (degreeday)
+    @param t0 minimum temperature for growth
+    @param gv_avg_age the average GV age
+    @return biomass Updated biomass
+    @return gv_avg_age average GV age
+    @return the senescent biomass
+    """
+    senescentBiomass = mk_gv_senescence(kdv, gv_biomass, temperature, t0, lls, gv_avg_age)
+    gv_biomass = gv_biomass - senescentBiomass
+    # at this point the biomass include cut, ingestion and scenescence, not growth
+    growthBiomass = np.where(temperature > t0, gro*(1-a2r), 0)
+    gv_avg_age = np.where(gv_biomass+growthBiomass > 0,
+            (np.maximum(0, temperature) + gv_avg_age) * (gv_biomass/(gv_biomass+growthBiomass)), 0)
+    gv_biomass = gv_biomass + growthBiomass
+    return(gv_biomass, gv_avg_age, senescentBiomass)
+
+def mk_gv_senescence(kgv,gv_biomass,temperature,t0,lls,gv_avg_age):
+    """
+    Extract about 2-6% (kDV=0.002, T=10C, gv_fAge=[1-3]) of gv_biomass as senescent
+    @param kGV Senescence coefficient (degreeday) (Ducroq,1996)
+    @param gv_biomass the Green Vegetation biomass
+    @param temperature Temperature
+    @param t0 minimum temperature for growth
+    @param lls Leaf lifespan (degreeday)
+    @param gv_avg_age the average GV age
+    @return senescentBiomass the biomass that is senescent
+    """
+    age = np.select([gv_avg_age/lls < 1.0/3.0, gv_avg_age/lls < 1], [1, 3 * gv_avg_age / lls], 3)
+    return np.select([temperature > t0, temperature < 0],
+            [kgv*gv_biomass*temperature*age, kgv*gv_biomass*np.abs(temperature)], 0)
+
+# Green Reproductive Functions
+def gr_update(temperature, a2r, gro, st1, st2, kdr, lls, rhogr, t0, gr_biomass, gr_avg_age):
+    """
+    Update Green Reproductive
+    @param temperature temperature
+    @param a2r allocate to reproductive (REP in Jouven_2006a.pdf, reproductive function)
+    @param GRO in Jouven_2006a.pdf, total growth
+    @param st1 Onset of reproductive growth (degreeday)
+    @param st2 End of reproductive growth (degreeday)
+    @param kdr basic rates of  in compartment GR
+    @param lls Leaf lifespan (degreeday)
+    @param rhogr Volume GR (g m-3)
+    @param t0 minimum temperature for growth
+    @param gr_biomass the av GR biomass
+    @param gr_avg_age the average GR age
+    @return gr_biomass Updated GR biomass
+    @return gr_avg_age the average GR age
+    @return the senescent biomass
+    """
+    senescentBiomass = mk_gr_senescence(kdr,gr_biomass,temperature,t0,lls,gr_avg_age,st1,st2)
+    gr_biomass = gr_biomass - senescentBiomass
+    # at this point the biomass include cut, ingestion and scenescence, not growth
+    growthBiomass = np.where(temperature > t0, gro*(a2r), 0)
+    gr_avg_age = np.where(gr_biomass+growthBiomass > 0,
+            (np.maximum(0, temperature) + gr_avg_age) * (gr_biomass/(gr_biomass+growthBiomass)), 0)
+    gr_biomass = gr_biomass + growthBiomass
+    return(gr_biomass, gr_avg_age, senescentBiomass)
+
+def mk_gr_senescence(kdr,gr_biomass,temperature,t0,lls,gr_avg_age,st1,st2):
+    """
+    @param kGV Senescence coefficient DV (degreeday)
+    @param temperature Temperature
+    @param lls Leaf lifespan (degreeday)
+    @param t0 minimum temperature for growth
+    @param gr_avg_age the average GR age
+    @param gr_biomass the biomass available for GR
+    @param st1 Onset of reproductive growth (degreeday)
+    @param st2 End of reproductive growth (degreeday)
+    @return senescentBiomass the senescent biomass
+    """
+    age = np.select([gr_avg_age/(st2-st1) < 1.0/3.0, gr_avg_age/(st2-st1) < 1.0], [1, (3*gr_avg_age/(st2-st1))], 3)
+    return np.select([temperature > t0, temperature < 0],
+            [kdr*gr_biomass*temperature*age, kdr*gr_biomass*np.abs(temperature)], 0)
+
+def getHeight(gv_avg_h, gr_avg_h, dv_avg_h, dr_avg_h):
+    """
+    Return the height of this cell
+    @return the maximum height of the 4 cs
+    """
+    return np.maximum(np.maximum(gv_avg_h, gr_avg_h), np.maximum(dv_avg_h, dr_avg_h))
+
+def cut(cutHeight, rhogv, rhodv, rhogr, rhodr, gvb, dvb, grb, drb, cellSurface, isHarvested):
+    """
+    Realize the harvest on each c. Where the amount of cut biomass is not null, the flag isHarvested is set to True
+    @param cutHeight the height of the cut (m)
+    @param rhogv rho green vegetation
+    @param rhodv rho dry vegetation
+    @param rhogr rho green reproduction
+    @param rhodr rho dry reproduction
+    @param gvb  the biomass of Green Vegetation
+    @param dvb  the biomass of Dry Vegetation
+    @param grb  the biomass of Green Reproductive
+    @param drb  the biomass of Dry Reproductive
+    @param cellSurface Surface of the pixel (Ha)
+    @param isHarvested Status flag indicating harvest happened
+    @return isHarvested Status flag indicating harvest happened
+    @return the total amount of biomass cut (in kg DM)
+    @return the GV biomass left after the cut
+    @return the DV biomass left after the cut
+    @return the GR biomass left after the cut
+    @return the DR biomass left after the cut
+    """
+    # exeCut returns harvested biomass in [kg DM m-2]
+    gv_h, gv_b = exeCut(rhogv, cutHeight, gvb)
+    dv_h, dv_b = exeCut(rhodv, cutHeight, dvb)
+    gr_h, gr_b = exeCut(rhogr, cutHeight, grb)
+    dr_h, dr_b = exeCut(rhodr, cutHeight, drb)
+
+    # sum of harvested biomass [kg DM m-2]
+    sumBiomassHarvested = gv_h + dv_h + gr_h + dr_h
+    isHarvested = isHarvested | (sumBiomassHarvested > 0)
+
+    return(isHarvested,sumBiomassHarvested*cellSurface, gv_b, dv_b, gr_b, dr_b)
+
+def mk_env(meanTenDaysT, t0, t1, t2, sumT, ni, pari, alphapar, pet, waterReserve, waterHoldingCapacity):
+    """
+    Environemental stress
+    @param meanTenDaysT the mean of the ten days of temperature
+    @param t0 minimum temperature for growth
+    @param t1 sum of temperature at the beginning (growth activation threshold)
+    @param t2 sum of temperature in the end (growth decline threshold)
+    @param sumT sum of temperatures
+    @param ni Nutritional index of pixel -NNI
+    @param pari Photosynthetic radiation incident (PARi)
+    @param alphapar the Light Use Interception
+    @param pet potential evapotranspiration
+    @param waterReserve reserve of water in the soil
+    @param waterHoldingCapacity capacity of the soil to hold a certain volume of water
+    @return the environmental stress
+    """
+    return(fTemperature(meanTenDaysT, t0, t1, t2, sumT) * ni * fPARi(pari, alphapar) * fWaterStress(waterReserve, waterHoldingCapacity, pet))
+
+def fTemperature(meanTenDaysT, t0, t1, t2, sumT):
+    """
+    f of temperature to compute ENV
+    @param meanTenDaysT the mean of the ten days of temperature
+    @param t0 minimum temperature for growth
+    @param t1 sum of temperature at the beginning (growth activation threshold)
+    @param t2 sum of temperature in the end (growth decline threshold)
+    @param sumT sum of temperatures
+    @return the value given by the temperature f
+    """
+    return np.select([(meanTenDaysT < t0) | (meanTenDaysT >= 40), meanTenDaysT < t1, meanTenDaysT < t2],
+            [0, (meanTenDaysT - t0) / (t1 - t0), 1], (40 - meanTenDaysT) / (40 - t2))
+
+def fsea(maxsea, minsea, sumT, st2, st1):
+    """
+    Function for seasonality (SEA) to compute the Potential Growth
+    @param maxsea growth increase in summer
+    @param minsea growth increase in winter
+    @param sumT sum of temperature
+    @param st1 sum of temperature at the beginning of growth
+    @param st2 sum of temperature in the end of growth
+    @return the value given by the sea f
+    """
+    return np.select([(sumT < 200) | (sumT >= st2), sumT < st1 - 200, sumT < st1 - 100],
+            [minsea, minsea+(maxsea-minsea)*(sumT-200) / (st1 - 400), maxsea],
+            maxsea+(minsea-maxsea)*(sumT - st1 + 100) / (st2 - st1 + 100))
+
+def fPARi(pari, alphapar):
+    """
+    Function of PAR insterception (PARi) to compute ENV
+    @param pari Photosynthetic radiation incident (PARi)
+    @param alphapar the Light Use Interception
+    @return the value given by the PARi [0-1]
+    """
+    return np.where(pari < 5, 1, np.maximum(1-alphapar*(pari - 5), 0))
+
+def fWaterStress(waterReserve, waterHoldingCapacity, pet):
+    """
+    f of water stess to compute ENV
+    @param waterReserve reserve of water in the soil
+    @param waterHoldingCapacity capacity of the soil to hold a certain volume of water
+    @param pet potential evapotranspiration
+    @return the value given by the waterstress f
+    """
+    waterStress = np.minimum(waterReserve/waterHoldingCapacity, 1)
+    lowPET = np.select([waterStress <= 0.2, waterStress <= 0.4, waterStress <= 0.6],
+            [4 * waterStress, 0.75 * waterStress + 0.65, 0.25 * waterStress + 0.85], 1)
+    midPET = np.select([waterStress <= 0.2, waterStress <= 0.4, waterStress <= 0.6, waterStress <= 0.8],
+            [2 * waterStress, 1.5 * waterStress + 0.1, waterStress + 0.3, 0.5 * waterStress + 0.6], 1)
+    return np.select([pet <= 3.8, pet <= 6.5], [lowPET, midPET], waterStress)
+
+def pgro(pari, ruemax, pctlam, sla, gv_biomass, lai):
+    """
+    Compute and return potential growth
+    @param pari the incident PAR
+    @param ruemax the maximum Radiation Use Efficiency
+    @param pctlam % leaf of laminae in Green Vegetation
+    @param sla the specific leaf area (m2 g-1)
+    @param gv_biomass the Green Vegetation biomass
+    @param lai the LAI from remote sensing (if available)
+    @return the calculated pGRO (kg DM ha-1)
+    """
+    lai = np.where(np.trunc(lai) == 0, sla * pctlam * (gv_biomass/10), lai)
+    lightInterceptionByPlant = (1-np.exp(-0.6*lai))
+    return(pari*ruemax*lightInterceptionByPlant*10)
+
+def aet(pet, pctlam, sla, gv_biomass, waterReserve, waterHoldingCapacity, lai):
+    """
+    Return the actual evapotranspiration (AET)
+    @param pet the daily potential evapotranspiration (PET)
+    @param pctlam % leaf of laminae in Green Vegetation
+    @param sla the specific leaf area (m2 g-1)
+    @param gv_biomass the Green Vegetation biomass
+    @param waterReserve reserve of water in the soil
+    @param waterHoldingCapacity capacity of the soil to hold a certain volume of water
+    @return the actual evapotranspiration (AET)
+    """
+    lai = np.where(np.trunc(lai) == 0, sla * pctlam * (gv_biomass/10), lai)
+    lightInterceptionByPlant = (1-np.exp(-0.6*lai))
+    pt = pet * lightInterceptionByPlant
+    pe = pet - pt
+    ta = pt * fWaterStress(waterReserve, waterHoldingCapacity, pet)
+    ea = pe * np.minimum(waterReserve/waterHoldingCapacity, 1)
+    return(ta+ea)
+
+def updateSumTemperature(temperature, t0, sumT, tbase):
+    """
+    Add the daily temperature to the sum temperature if the daily one is positive
+    @param temperature
+    @param t0 minimum temperature for growth
+    @param sumT actual sum of temperature
+    @param tbase base temperature (substracted each day for the calculation of the ST)
+    """
+    return np.where(temperature >= t0, sumT + np.maximum(temperature - tbase, 0), sumT)
+
+def getAvailableBiomassForCut(gv_biomass, dv_biomass, gr_biomass, dr_biomass, cutHeight, rhogv, rhodv, rhogr, rhodr):
+    """
+    Return the amount of biomass av for cut
+    @param gv_biomass biomass of Green Vegetation
+    @param dv_biomass biomass of Dry Vegetation
+    @param gr_biomass biomass of Green Reproduction
+    @param dr_biomass biomass of Dry Reproduction
+    @param cutHeight height of the cut
+    @param rhogv Volume VV (g m-3)
+    @param rhodv Volume DV (g m-3)
+    @param rhogr Volume GR (g m-3)
+    @param rhodr Volume DR (g m-3)
+    @return the amount of biomass av for cut
+    """
+    avDefoliationBiomassGV = avDefoliationBiomass(gv_biomass, cutHeight, rhogv)
+    avDefoliationBiomassDV = avDefoliationBiomass(dv_biomass, cutHeight, rhodv)
+    avDefoliationBiomassGR = avDefoliationBiomass(gr_biomass, cutHeight, rhogr)
+    avDefoliationBiomassDR = avDefoliationBiomass(dr_biomass, cutHeight, rhodr)
+    return(avDefoliationBiomassGV + avDefoliationBiomassDV + avDefoliationBiomassGR + avDefoliationBiomassDR)
+
+def defoliation(gv_biomass, dv_biomass, gr_biomass, dr_biomass, cutHeight, rhogv, rhodv, rhogr, rhodr, maxAmountToIngest):
+    """
+    Defoliation method
+    @param gv_biomass biomass of Green Vegetation
+    @param dv_biomass biomass of Dry Vegetation
+    @param gr_biomass biomass of Green Reproduction
+    @param dr_biomass biomass of Dry Reproduction
+    @param cutHeight height of the cut
+    @param rhogv Volume VV (g m-3)
+    @param rhodv Volume DV (g m-3)
+    @param rhogr Volume GR (g m-3)
+    @param rhodr Volume DR (g m-3)
+    @param maxAmountToIngest The maximum amount of ingest
+    @return the sum of ingested biomass
+    """
+    avDefoliationBiomassGV = avDefoliationBiomass(gv_biomass, cutHeight, rhogv)
+    avDefoliationBiomassDV = avDefoliationBiomass(dv_biomass, cutHeight, rhodv)
+    avDefoliationBiomassGR = avDefoliationBiomass(gr_biomass, cutHeight, rhogr)
+    avDefoliationBiomassDR = avDefoliationBiomass(dr_biomass, cutHeight, rhodr)
+
+    sumAvailable = avDefoliationBiomassGV + avDefoliationBiomassDV + avDefoliationBiomassGR + avDefoliationBiomassDR
+    ingestAll = exeDefoliationByBiomass(avDefoliationBiomassGV, maxAmountToIngest) + exeDefoliationByBiomass(avDefoliationBiomassDV, maxAmountToIngest) + exeDefoliationByBiomass(avDefoliationBiomassGR, maxAmountToIngest) + exeDefoliationByBiomass(avDefoliationBiomassDR, maxAmountToIngest)
+    ingestShare = exeDefoliationByBiomass(maxAmountToIngest * avDefoliationBiomassGV/sumAvailable, maxAmountToIngest) + exeDefoliationByBiomass(maxAmountToIngest * avDefoliationBiomassDV/sumAvailable, maxAmountToIngest) + exeDefoliationByBiomass(maxAmountToIngest * avDefoliationBiomassGR/sumAvailable, maxAmountToIngest) + exeDefoliationByBiomass(maxAmountToIngest * avDefoliationBiomassDR/sumAvailable, maxAmountToIngest)
+    return np.select([sumAvailable <= 0, sumAvailable <= maxAmountToIngest], [0, ingestAll], ingestShare)
+
+def getOMDgv(gv_min_omd, gv_max_omd, gv_avg_age, lls):
+    """
+    Compute the Green Vegetation actual Organic Matter Digestibility
+    @param gv_min_omd The minimum Green Vegetation Org. Mat. Digestibility
+    @param gv_max_omd The maximum Green Vegetation Org. Mat. Digestibility
+    @param gv_avg_age The average age of the Green Vegetation
+    @param lls the leaf lifespan (degree Celsius per day-1)
+    @return the Green Vegetation Organic Matter Digestibility
+    """
+    return np.maximum(gv_min_omd, gv_max_omd - gv_avg_age * (gv_max_omd - gv_min_omd) / lls)
+
+def getOMDgr(gr_min_omd, gr_max_omd, gr_avg_age, st1, st2):
+    """
+    Compute the Green Reproduction actual Organic Matter Digestibility
+    @param gr_min_omd The minimum Green Reproduction Org. Mat. Digestibility
+    @param gr_max_omd The maximum Green Reproduction Org. Mat. Digestibility
+    @param gr_avg_age The average age of the Green Reproduction
+    @param st1 sum of temperature to begin vegeative activity
+    @param st2 sum of temperature to end vegetative activity
+    @return the Green Vegetation Organic Matter Digestibility
+    """
+    return np.maximum(gr_min_omd, gr_max_omd - gr_avg_age * (gr_max_omd - gr_min_omd) / (st2 - st1))
+
+def getSumTemperature(weather, doy, t0):
+    """
+    Return the sum temperature corresponding to the DOY
+    @param weather the weather array or Forcing, (ndays,) or (ndays, ncells)
+    @param doy the day of year wanted [1-366]
+    @param t0 minimum temperature for growth
+    @return the sum temperature above t0 corresponding to the DOY, per cell
+    """
+    return(getSumTemperatureSeries(weather, t0)[doy])
+
+def addNI(ni, amountToIncrease):
+    return(np.maximum(0, np.minimum(amountToIncrease+ni, 1.2)))
+
+def dormantRun(temperature, kdv, kldv, kdr, kldr, lls, st1, st2, t0, gv_gamma, gr_gamma, gv_biomass, dv_biomass, gr_biomass, dr_biomass, gv_avg_age, dv_avg_age, gr_avg_age, dr_avg_age):
+    """
+    Advance the compartments over a run of dormant days (no growth, no cut, no grazing) without a daily loop
+
+    The ages of GV and GR add up the degree days, their senescence is a product of daily decays,
+    and DV and DR (biomass and biomass*age) are linear recurrences, solved with cumulative products
+    and sums while the age class of their abscission does not change. The run stops the day before
+    it changes (or before a decay would empty a compartment), the days after are left to the daily loop.
+    The result matches the daily updates (gv_update(), dv_update(), gr_update(), dr_update()) to rounding.
+    @param temperature temperature of the days of the run, (ndays,) or (ndays, ncells)
+    @param kdv Senescence coefficient of GV (degreeday)
+    @param kldv Abscission coefficient DV (degreeday)
+    @param kdr Senescence coefficient of GR (degreeday)
+    @param kldr Abscission coefficient DR (degreeday)
+    @param lls Leaf lifespan (degreeday)
+    @param st1 Onset of reproductive growth (degreeday)
+    @param st2 End of reproductive growth (degreeday)
+    @param t0 minimum temperature for growth (of GR senescence, GV uses 0 as in the daily loop)
+    @param gv_gamma Respiratory C loss during senescence of GV
+    @param gr_gamma Respiratory C loss during senescence of GR
+    @param gv_biomass...dr_avg_age the state before the run
+    @return the number of days advanced
+    @return the biomass and ages at the end of each day advanced, (ndays, ...) each: gv, dv, gr, dr biomass, gv, dv, gr, dr ages
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        return(_dormantRun(temperature, kdv, kldv, kdr, kldr, lls, st1, st2, t0, gv_gamma, gr_gamma, gv_biomass, dv_biomass, gr_biomass, dr_biomass, gv_avg_age, dv_avg_age, gr_avg_age, dr_avg_age))
+
+def _dormantRun(temperature, kdv, kldv, kdr, kldr, lls, st1, st2, t0, gv_gamma, gr_gamma, gv_biomass, dv_biomass, gr_biomass, dr_biomass, gv_avg_age, dv_avg_age, gr_avg_age, dr_avg_age):
+    temperature = np.asarray(temperature, dtype=np.float64)
+    shape = (len(temperature),) + np.broadcast_shapes(temperature.shape[1:], np.shape(gv_biomass), np.shape(lls))
+    temperature = np.broadcast_to(temperature.reshape(temperature.shape + (1,) * (len(shape) - temperature.ndim)), shape)
+    warm = np.maximum(0, temperature)
+
+    def ages(age0):
+        # sequential sums, as the daily loop adds the degree days to the age
+        return(np.cumsum(np.concatenate([np.broadcast_to(age0, shape[1:])[np.newaxis], warm]), axis=0))
+
+    def decay(biomass0, rate):
+        # biomass at the end of every day, and the biomass lost every day
+        biomass = biomass0 * np.cumprod(1 - rate, axis=0)
+        before = np.concatenate([np.broadcast_to(biomass0, shape[1:])[np.newaxis], biomass[:-1]])
+        return(biomass, before * rate)
+
+    def deadRun(biomass0, age0, inflow, rate, dilutedAge):
+        # dead compartment: abscission at a constant class, the senescence of the green one flowing in
+        factor = np.cumprod(1 - rate, axis=0)
+        biomass = factor * (biomass0 + np.cumsum(inflow / factor, axis=0))
+        before = np.concatenate([np.broadcast_to(biomass0, shape[1:])[np.newaxis], biomass[:-1]])
+        factorBefore = np.concatenate([np.ones((1,) + shape[1:]), factor[:-1]])
+        if dilutedAge:
+            # dv_update(): (T + age) * remaining / total
+            mass = factor * (biomass0 * age0 + np.cumsum(warm * before / factorBefore, axis=0))
+        else:
+            # dr_update(): T + age * remaining / total
+            mass = factor * (biomass0 * age0 + np.cumsum(warm * biomass / factor, axis=0))
+        age = np.where(biomass > 0, mass / biomass, 0)
+        return(biomass, age)
+
+    # Green compartments, their ages known in advance
+    gv_ages = ages(gv_avg_age)
+    gv_class = np.select([gv_ages[:-1]/lls < 1.0/3.0, gv_ages[:-1]/lls < 1], [1, 3 * gv_ages[:-1] / lls], 3)
+    gv_rate = np.select([temperature > 0, temperature < 0], [kdv*temperature*gv_class, kdv*np.abs(temperature)], 0)
+    gv_run, gv_senescent = decay(gv_biomass, gv_rate)
+    gr_ages = ages(gr_avg_age)
+    gr_class = np.select([gr_ages[:-1]/(st2-st1) < 1.0/3.0, gr_ages[:-1]/(st2-st1) < 1.0], [1, 3*gr_ages[:-1]/(st2-st1)], 3)
+    gr_rate = np.select([temperature > t0, temperature < 0], [kdr*temperature*gr_class, kdr*np.abs(temperature)], 0)
+    gr_run, gr_senescent = decay(gr_biomass, gr_rate)
+
+    # Dead compartments, at the abscission class of the first day
+    dv_class = np.select([dv_avg_age/lls < 1.0/3.0, dv_avg_age/lls < 2.0/3.0], [1, 2], 3)
+    dv_rate = kldv * warm * dv_class
+    dv_run, dv_ages = deadRun(dv_biomass, dv_avg_age, (1.0-gv_gamma) * gv_senescent, dv_rate, True)
+    dr_class = np.select([dr_avg_age/(st2-st1) < 1.0/3.0, dr_avg_age/(st2-st1) < 2.0/3.0], [1, 2], 3)
+    dr_rate = kldr * warm * dr_class
+    dr_run, dr_ages = deadRun(dr_biomass, dr_avg_age, (1-gr_gamma) * gr_senescent, dr_rate, False)
+
+    # Days that keep the classes of the first day and decay less than the whole compartment
+    dv_classes = np.select([dv_ages[:-1]/lls < 1.0/3.0, dv_ages[:-1]/lls < 2.0/3.0], [1, 2], 3)
+    dr_classes = np.select([dr_ages[:-1]/(st2-st1) < 1.0/3.0, dr_ages[:-1]/(st2-st1) < 2.0/3.0], [1, 2], 3)
+    valid = np.ones(shape, dtype=bool)
+    valid[1:] = (dv_classes == dv_class) & (dr_classes == dr_class)
+    valid &= (gv_rate < 1) & (gr_rate < 1) & (dv_rate < 1) & (dr_rate < 1)
+    valid = valid.reshape(len(valid), -1).all(axis=1)
+    ndays = len(valid) if valid.all() else int(np.argmin(valid))
+
+    gv_ages = np.where(gv_run > 0, gv_ages[1:], 0)
+    gr_ages = np.where(gr_run > 0, gr_ages[1:], 0)
+    return(ndays, [arr[:ndays] for arr in (gv_run, dv_run, gr_run, dr_run, gv_ages, dv_ages, gr_ages, dr_ages)])
+
+# Linear pieces (slope, intercept) of the water stress of fWaterStress() below capacity, for PET <= 3.8,
+# 3.8 < PET <= 6.5 and PET > 6.5, piece k starting above the k-th of WATER_STRESS_THRESHOLDS
+WATER_STRESS_THRESHOLDS = (0.2, 0.4, 0.6, 0.8)
+WATER_STRESS_SLOPES = np.array([[4, 0.75, 0.25, 0, 0], [2, 1.5, 1, 0.5, 0], [1, 1, 1, 1, 1]], dtype=np.float64)
+WATER_STRESS_INTERCEPTS = np.array([[0, 0.65, 0.85, 1, 1], [0, 0.1, 0.3, 0.6, 1], [0, 0, 0, 0, 0]], dtype=np.float64)
+
+def waterStressPiece(waterStress, petClass):
+    """
+    Linear piece of fWaterStress() (its index, slope and intercept) at a relative water reserve
+    @param waterStress the water reserve relative to the water holding capacity, at most 1
+    @param petClass 0 for PET <= 3.8, 1 for PET <= 6.5, 2 above
+    @return the index of the piece, its slope and its intercept
+    """
+    piece = sum((waterStress > threshold).astype(np.int64) for threshold in WATER_STRESS_THRESHOLDS)
+    return(piece, WATER_STRESS_SLOPES[petClass, piece], WATER_STRESS_INTERCEPTS[petClass, piece])
+
+def dormantWaterReserve(pp, pet, eta, lai, gv_biomass, waterReserve, waterHoldingCapacity, pctlam, sla):
+    """
+    Soil water reserve over a run of dormant days, as the daily loop computes it with aet()
+
+    While the reserve stays within (0, waterHoldingCapacity) and the water stress on the same linear
+    piece (waterStressPiece()), a day is an affine map of the reserve (with ETA from remote sensing, a translation), so
+    the days are solved at once with cumulative products and sums. The run is cut where the reserve
+    is clipped or changes piece, and solved again from there; a day that is clipped at once is
+    computed alone. The result matches the daily loop to rounding.
+    @param pp Precipitation of the days (mm), (ndays, ...)
+    @param pet Potential ET of the days (mm/day)
+    @param eta Actual ET from Remote Sensing of the days (mm/day), computed when it is 0
+    @param lai Leaf Area Index from Remote Sensing of the days, computed when it is 0
+    @param gv_biomass the GV biomass at the start of every day, (ndays, ...)
+    @param waterReserve reserve of water in the soil before the run
+    @param waterHoldingCapacity capacity of the soil to hold a certain volume of water
+    @param pctlam % leaf of laminae in Green Vegetation
+    @param sla the specific leaf area (m2 g-1)
+    @return the water reserve at the end of every day, and the LAI of every day, (ndays, ...)
+    """
+    shape = np.shape(gv_biomass)
+    noEta = np.broadcast_to(np.trunc(eta) == 0, shape)
+    lai = np.where(noEta & (np.trunc(lai) == 0), fclai(pctlam, sla, gv_biomass), lai)
+    # aet(): transpiration and evaporation shares of PET
+    lightInterceptionByPlant = 1 - np.exp(-0.6*np.where(np.trunc(lai) == 0, sla * pctlam * (gv_biomass/10), lai))
+    pet = np.broadcast_to(pet, shape)
+    pt = pet * lightInterceptionByPlant
+    pe = pet - pt
+    petClass = np.where(pet <= 3.8, 0, np.where(pet <= 6.5, 1, 2))
+    eta = np.broadcast_to(eta, shape)
+    pp = np.broadcast_to(pp, shape)
+    capacity = np.broadcast_to(waterHoldingCapacity, shape[1:])
+    waterReserve = np.broadcast_to(waterReserve, shape[1:])
+    reserves = np.empty(shape)
+    j = 0
+    while j < len(reserves):
+        # the pieces of the reserve at the start of the remaining days
+        waterStress = np.minimum(waterReserve/capacity, 1)
+        piece, slope, intercept = waterStressPiece(waterStress, petClass[j:])
+        # reserve at the end of day = a * reserve at its start + b
+        a = np.where(noEta[j:], 1 - (pt[j:] * slope + pe[j:]) / capacity, 1)
+        b = np.where(noEta[j:], pp[j:] - pt[j:] * intercept, pp[j:] - eta[j:])
+        factor = np.cumprod(a, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            run = factor * (waterReserve + np.cumsum(b / factor, axis=0))
+        before = np.concatenate([waterReserve[np.newaxis], run[:-1]])
+        # days not clipped, on the piece taken, below capacity at their start (the stress is not capped)
+        valid = (run > 0) & (run < capacity) & (a > 0)
+        valid &= ~noEta[j:] | ((before < capacity) & (waterStressPiece(before/capacity, petClass[j:])[0] == piece))
+        valid = valid.reshape(len(valid), -1).all(axis=1)
+        n = len(valid) if valid.all() else int(np.argmin(valid))
+        if n > 0:
+            reserves[j:j+n] = run[:n]
+            waterReserve = run[n-1]
+            j += n
+            continue
+        # a clipped day (or a change of piece at once), as the daily loop computes it
+        dayEta = np.where(noEta[j], pt[j] * fWaterStress(waterReserve, capacity, pet[j]) + pe[j] * waterStress, eta[j])
+        waterReserve = np.minimum(np.maximum(0, waterReserve + pp[j] - dayEta), capacity)
+        reserves[j] = waterReserve
+        j += 1
+    return(reserves, lai)
@@ -0,0 +1,431 @@
+import os
+import numpy as np
+
+#########################################################
+# Definition of the outputs of a run, in the order modvege() returns them
+#########################################################
+OUTPUT_VARIABLES = (
+    'gv_biomass',                   # Green Vegetative biomass (kg DM ha-1)
+    'dv_biomass',                   # Dead Vegetative biomass (kg DM ha-1)
+    'gr_biomass',                   # Green Reproductive biomass (kg DM ha-1)
+    'dr_biomass',                   # Dead Reproductive biomass (kg DM ha-1)
+    'harvested_biomass',            # Harvested biomass, cumulated (kg DM ha-1)
+    'ingested_biomass',             # Ingested biomass, cumulated (kg DM ha-1)
+    'gro',                          # GRO biomass (kg DM ha-1)
+    'available_biomass_for_cut',    # Available Biomass for cut (kg DM ha-1)
+    'sumT',                         # Sum of temperature (degreeday)
+    'gv_avg_age',                   # Average age of GV (degreeday)
+    'gr_avg_age',                   # Average age of GR (degreeday)
+    'dv_avg_age',                   # Average age of DV (degreeday)
+    'dr_avg_age',                   # Average age of DR (degreeday)
+    'fsea',                         # Seasonality function SEA
+    'fTemperature',                 # Temperature function of ENV
+    'env',                          # Environmental stress ENV
+    'pgro',                         # Potential growth PGRO (kg DM ha-1)
+    'a2r',                          # Allocation to reproductive
+)
+OUTPUT_INDEX = dict((name, j) for j, name in enumerate(OUTPUT_VARIABLES))
+
+class ModvegeOutput:
+    """
+    Daily outputs of a run, preallocated and written in place
+
+    The values are stored in a single float64 array of shape
+    (ndays, nvariables) for a cell or (ndays, nvariables, ncells) for a grid,
+    only for the variables asked for. out['gv_biomass'] (or out.gv_biomass)
+    is the daily series of a variable, and when all the variables are recorded
+    the object unpacks like the tuple modvege() used to return.
+    """
+    __slots__ = ('variables', 'columns', 'data', 'startdoy')
+
+    def __init__(self, ndays, shape=(), variables=None, startdoy=1):
+        """
+        :param ndays: number of simulated days
+        :param shape: () for a cell, (ncells,) for a grid
+        :param variables: names of the variables to record, default is all of OUTPUT_VARIABLES
+        :param startdoy: day of year of the first row
+        """
+        if variables is None:
+            variables = OUTPUT_VARIABLES
+        unknown = [name for name in variables if name not in OUTPUT_INDEX]
+        if unknown:
+            raise ValueError("Unknown output variables: %s" % (", ".join(unknown)))
+        self.variables = tuple(variables)
+        # Column of each recorded variable in the tuple of values of a day
+        self.columns = [OUTPUT_INDEX[name] for name in self.variables]
+        self.data = np.empty((ndays, len(self.variables)) + tuple(shape))
+        self.startdoy = startdoy
+
+    def record(self, k, values):
+        """
+        Write the outputs of a day
+
+        :param k: row of the day (doy - startdoy)
+        :param values: the values of a day, in the order of OUTPUT_VARIABLES
+        """
+        row = self.data[k]
+        for c, j in enumerate(self.columns):
+            # a grid row is broadcast from the values shared by all cells
+            row[c] = values[j]
+
+    def record_days(self, k, ndays, values):
+        """
+        Write the outputs of consecutive days at once
+
+        :param k: row of the first day (doy - startdoy)
+        :param ndays: number of days
+        :param values: the values of the days, in the order of OUTPUT_VARIABLES, each (ndays,) for a cell,
+                       (ndays, ncells) or (ndays, 1) for a grid, or a float shared by all the days and cells
+        """
+        rows = self.data[k:k+ndays]
+        for c, j in enumerate(self.columns):
+            rows[:, c] = values[j]
+
+    def wants(self, name):
+        """
+        Check if a variable is recorded
+        """
+        return name in self.variables
+
+    @property
+    def doy(self):
+        """Day of year of every row"""
+        return np.arange(self.startdoy, self.startdoy + len(self.data))
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.data[:, self.variables.index(key)]
+        return self.data[:, key]
+
+    def __getattr__(self, name):
+        if name in OUTPUT_INDEX:
+            try:
+                return self.data[:, self.variables.index(name)]
+            except ValueError:
+                raise AttributeError("%s was not recorded" % (name))
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __iter__(self):
+        for j in range(len(self.variables)):
+            yield self.data[:, j]
+
+    def __array__(self, dtype=None, copy=None):
+        # (nvariables, ndays[, ncells]) as np.array() of the former tuple of lists
+        arr = np.moveaxis(self.data, 1, 0)
+        if dtype is not None:
+            arr = arr.astype(dtype)
+        return arr
+
+    def as_dict(self):
+        """
+        Return the outputs as a dictionary of name: daily series
+        """
+        return dict((name, self.data[:, j]) for j, name in enumerate(self.variables))
+
+    def to_csv(self, file):
+        """
+        Write the outputs as csv, one row per day (and per cell for a grid)
+
+        :param file: the output csv file
+        """
+        write_sink(self, CsvSink(file))
+
+    def to_npz(self, file):
+        """
+        Write the outputs as a numpy .npz, one (ndays[, ncells]) array per variable and doy
+
+        :param file: the output .npz file
+        """
+        np.savez(file, doy=self.doy, **self.as_dict())
+
+class BlockOutput(ModvegeOutput):
+    """
+    Daily outputs of a run streamed to an OutputSink
+
+    Only a block of blocksize days is held in memory, it is written to the
+    sink each time it is full, and the last (partial) one by close().
+    """
+    __slots__ = ('sink', 'first')
+
+    def __init__(self, sink, ndays, shape=(), variables=None, startdoy=1, blocksize=None):
+        """
+        :param sink: the OutputSink receiving the blocks
+        :param ndays: number of simulated days
+        :param shape: () for a cell, (ncells,) for a grid
+        :param variables: names of the variables to record, default is all of OUTPUT_VARIABLES
+        :param startdoy: day of year of the first day
+        :param blocksize: number of days of a block, default is DEFAULT_BLOCK_DAYS
+        """
+        if blocksize is None:
+            blocksize = DEFAULT_BLOCK_DAYS
+        ModvegeOutput.__init__(self, min(blocksize, ndays), shape, variables, startdoy)
+        self.sink = sink
+        # row k of the run is row k - first of the block
+        self.first = 0
+        sink.open(self.variables, tuple(shape), startdoy, ndays)
+
+    def record(self, k, values):
+        if k - self.first >= len(self.data):
+            self.flush(len(self.data))
+        ModvegeOutput.record(self, k - self.first, values)
+
+    def record_days(self, k, ndays, values):
+        # the days are split at the ends of the blocks
+        done = 0
+        while done < ndays:
+            if k + done - self.first >= len(self.data):
+                self.flush(len(self.data))
+            n = min(ndays - done, self.first + len(self.data) - (k + done))
+            days = slice(done, done + n)
+            ModvegeOutput.record_days(self, k + done - self.first, n, [value[days] if np.ndim(value) else value for value in values])
+            done += n
+
+    def flush(self, nrows):
+        """
+        Write the first nrows days of the block to the sink
+        """
+        if nrows > 0:
+            self.sink.write(self.startdoy + self.first, self.data[:nrows])
+        self.first += nrows
+
+    def close(self, ndays):
+        """
+        Write the last block and close the sink
+
+        :param ndays: number of simulated days
+        """
+        self.flush(ndays - self.first)
+        self.sink.close()
+
+#########################################################
+# Output sinks: where BlockOutput writes its blocks
+#########################################################
+#Define DEFAULT_BLOCK_DAYS 30 days held in memory
+DEFAULT_BLOCK_DAYS = 30
+
+class OutputSink:
+    """
+    Destination of the daily outputs of a run, written block by block
+
+    open() is called once before the first block, write() for every block of
+    days (ndays_block, nvariables) for a cell or (ndays_block, nvariables, ncells)
+    for a grid, close() after the last one.
+    """
+    __slots__ = ('variables', 'shape')
+
+    def open(self, variables, shape, startdoy, ndays):
+        """
+        :param variables: names of the recorded variables
+        :param shape: () for a cell, (ncells,) for a grid
+        :param startdoy: day of year of the first day
+        :param ndays: number of simulated days
+        """
+        self.variables = tuple(variables)
+        self.shape = tuple(shape)
+
+    def write(self, doy, block):
+        """
+        :param doy: day of year of the first day of the block
+        :param block: the block of outputs
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class CsvSink(OutputSink):
+    """
+    csv file, one row per day (and per cell for a grid), flushed after every block
+
+    file can also be an open text stream (sys.stdout), it is left open by close().
+    """
+    __slots__ = ('file', 'fp')
+
+    def __init__(self, file):
+        self.file = file
+        self.fp = None
+
+    def open(self, variables, shape, startdoy, ndays):
+        OutputSink.open(self, variables, shape, startdoy, ndays)
+        if hasattr(self.file, 'write'):
+            self.fp = self.file
+        else:
+            self.fp = open(self.file, 'w')
+        if self.shape:
+            self.fp.write(",".join(('doy', 'cell') + self.variables) + "\n")
+        else:
+            self.fp.write(",".join(('doy',) + self.variables) + "\n")
+
+    def write(self, doy, block):
+        ndays = len(block)
+        ncells = int(np.prod(self.shape))
+        # (ndays, nvariables, ncells) -> one row per day and cell
+        rows = np.moveaxis(block.reshape(ndays, len(self.variables), ncells), 1, 2).reshape(-1, len(self.variables))
+        days = np.repeat(np.arange(doy, doy + ndays), ncells)
+        if self.shape:
+            table = np.column_stack([days, np.tile(np.arange(ncells), ndays), rows])
+        else:
+            table = np.column_stack([days, rows])
+        np.savetxt(self.fp, table, delimiter=",", fmt="%.10g")
+        self.fp.flush()
+
+    def close(self):
+        if self.fp is not None and self.fp is not self.file:
+            self.fp.close()
+        self.fp = None
+
+class NpySink(OutputSink):
+    """
+    Directory of one .npy file per variable, (ndays[, ncells]), and doy.npy
+
+    The files are created at their full size and memory-mapped, every block is
+    flushed to disk, so they can be read (np.load(mmap_mode='r')) during the run.
+    With resume, files of the same size are opened as they are, keeping the days
+    written before a run was stopped (a run restarted from a checkpoint).
+    """
+    __slots__ = ('directory', 'arrays', 'startdoy', 'resume')
+
+    def __init__(self, directory, resume=False):
+        self.directory = directory
+        self.arrays = None
+        self.resume = resume
+
+    def _open_array(self, name, shape):
+        file = os.path.join(self.directory, name + '.npy')
+        if self.resume and os.path.exists(file):
+            arr = np.lib.format.open_memmap(file, mode='r+')
+            if arr.shape == shape and arr.dtype == np.float64:
+                return(arr)
+            arr = None
+        return(np.lib.format.open_memmap(file, mode='w+', dtype=np.float64, shape=shape))
+
+    def open(self, variables, shape, startdoy, ndays):
+        OutputSink.open(self, variables, shape, startdoy, ndays)
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(os.path.join(self.directory, 'doy.npy'), np.arange(startdoy, startdoy + ndays))
+        self.startdoy = startdoy
+        self.arrays = [self._open_array(name, (ndays,) + self.shape) for name in self.variables]
+
+    def write(self, doy, block):
+        k = doy - self.startdoy
+        for j, arr in enumerate(self.arrays):
+            arr[k:k + len(block)] = block[:, j]
+            arr.flush()
+
+    def close(self):
+        # dropping the memmaps closes the files
+        self.arrays = None
+
+class ParquetSink(OutputSink):
+    """
+    Parquet file (pyarrow), one row per day (and per cell for a grid), one row group per block
+    """
+    __slots__ = ('file', 'writer', 'pa')
+
+    def __init__(self, file):
+        self.file = file
+        self.writer = None
+
+    def open(self, variables, shape, startdoy, ndays):
+        OutputSink.open(self, variables, shape, startdoy, ndays)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("ParquetSink needs pyarrow")
+        self.pa = pyarrow
+        fields = [pyarrow.field('doy', pyarrow.int32())]
+        if self.shape:
+            fields.append(pyarrow.field('cell', pyarrow.int32()))
+        fields += [pyarrow.field(name, pyarrow.float64()) for name in self.variables]
+        self.writer = pyarrow.parquet.ParquetWriter(self.file, pyarrow.schema(fields))
+
+    def write(self, doy, block):
+        ndays = len(block)
+        ncells = int(np.prod(self.shape))
+        rows = np.moveaxis(block.reshape(ndays, len(self.variables), ncells), 1, 2).reshape(-1, len(self.variables))
+        columns = {'doy': np.repeat(np.arange(doy, doy + ndays, dtype=np.int32), ncells)}
+        if self.shape:
+            columns['cell'] = np.tile(np.arange(ncells, dtype=np.int32), ndays)
+        for j, name in enumerate(self.variables):
+            columns[name] = rows[:, j]
+        self.writer.write_table(self.pa.table(columns, schema=self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+class NetCDFSink(OutputSink):
+    """
+    NetCDF4/HDF5 file (netCDF4), one (time[, cell]) variable per output, chunked
+    by block of days and by cell, synced after every block
+    """
+    __slots__ = ('file', 'dataset', 'startdoy', 'chunkdays', 'chunkcells')
+
+    def __init__(self, file, chunkdays=DEFAULT_BLOCK_DAYS, chunkcells=1024):
+        self.file = file
+        self.dataset = None
+        self.chunkdays = chunkdays
+        self.chunkcells = chunkcells
+
+    def open(self, variables, shape, startdoy, ndays):
+        OutputSink.open(self, variables, shape, startdoy, ndays)
+        try:
+            import netCDF4
+        except ImportError:
+            raise ImportError("NetCDFSink needs netCDF4")
+        self.startdoy = startdoy
+        self.dataset = netCDF4.Dataset(self.file, 'w')
+        self.dataset.createDimension('time', None)
+        dimensions = ('time',)
+        chunks = [self.chunkdays]
+        if self.shape:
+            self.dataset.createDimension('cell', self.shape[0])
+            dimensions += ('cell',)
+            chunks.append(min(self.chunkcells, self.shape[0]))
+        self.dataset.createVariable('doy', 'i4', ('time',))
+        for name in self.variables:
+            self.dataset.createVariable(name, 'f8', dimensions, chunksizes=chunks, zlib=True)
+
+    def write(self, doy, block):
+        k = doy - self.startdoy
+        self.dataset['doy'][k:k + len(block)] = np.arange(doy, doy + len(block))
+        for j, name in enumerate(self.variables):
+            self.dataset[name][k:k + len(block)] = block[:, j]
+        self.dataset.sync()
+
+    def close(self):
+        if self.dataset is not None:
+            self.dataset.close()
+            self.dataset = None
+
+# Sink of each output file format
+SINKS = {'csv': CsvSink, 'npy': NpySink, 'parquet': ParquetSink, 'nc': NetCDFSink}
+
+def make_sink(file, format=None):
+    """
+    Return the OutputSink of an output file
+
+    :param file: the output file (a directory for 'npy')
+    :param format: one of SINKS, default is the extension of file
+    """
+    if format is None:
+        format = os.path.splitext(file)[1].lstrip('.').lower()
+    if format not in SINKS:
+        raise ValueError("Unknown output format %r, expected one of %s" % (format, ", ".join(SINKS)))
+    return(SINKS[format](file))
+
+def write_sink(output, sink):
+    """
+    Write a whole ModvegeOutput into a sink, as a single block
+
+    :param output: the ModvegeOutput
+    :param sink: the OutputSink
+    """
+    sink.open(output.variables, output.data.shape[2:], output.startdoy, len(output.data))
+    sink.write(output.startdoy, output.data)
+    sink.close()
@@ -0,0 +1,188 @@
+import sys
+import numpy as np
+
+#########################################################
+# Definition of input parameters (see lib_read_input_files.py)
+#########################################################
+# Name in params.csv, and how it is logged (with its reference value)
+PARAMS = (
+    ('ST1',         'st1=%.2f (=600)'),         # Onset of reproductive growth (degreeday)
+    ('ST2',         'st2=%.2f (=1200)'),        # End of reproductive growth (degreeday)
+    ('NI',          'ni=%.2f (=0.9)'),          # Initial Nutritional index of cell
+    ('WHC',         'whc=%.2f (=200)'),         # Soil water-holding capacity (mm)
+    ('WR',          'wr=%.2f (=60)'),           # Soil water reserve (mm)
+    ('minSEA',      'minsea=%.2f (=0.8)'),      # Growth increase in winter
+    ('maxSEA',      'maxsea=%.2f (=1.2)'),      # Growth increase in summer
+    ('W_GV',        'ibgv=%.2f (=750)'),        # Biomass of GV (kg ha-1)
+    ('alpha_PAR',   'alphapar=%.2f (=0.044)'),  # Light Use Interception
+    ('T0',          't0=%.2f (=4)'),            # Temperature threshold: photosynthesis activation (degC)
+    ('T1',          't1=%.2f (=10)'),           # Temp threshold: stable growth (degC)
+    ('T2',          't2=%.2f (=20)'),           # Temp threshold: growth decline (degC)
+    ('beta_T',      'betaT=%.2f (=0.05)'),      # beta_T
+    ('b_IN',        'b_IN=%.2f (=0.025)'),      # b_IN
+    ('SLA',         'sla=%.2f (=0.033)'),       # Specific leaf area (m2 g-1)
+    ('LLS',         'lls=%.2f (=500)'),         # Leaf lifespan (degreeday)
+    ('rho_GV',      'rhogv=%.2f (=850)'),       # Volume GV (g m-3)
+    ('percentLAM',  'pctlam=%.2f (=0.68)'),     # % leaf of laminae in GV
+    ('W_GR',        'wgr=%.2f (=0)'),           # Biomass of GR (kg ha-1)
+    ('a_IN',        'allocni=%.2f (=0.2)'),     # Value of ALLOC at NI=0
+    ('max_fIN',     'maxFNI=%.2f (=0.9)'),      # max of fNI
+    ('rho_GR',      'rhogr=%.2f (=300)'),       # Volume GR (g m-3)
+    ('W_DV',        'wdv=%.2f (=1200)'),        # Biomass of DV (kg ha-1)
+    ('K_DV',        'kdv=%.3f (=0.002)'),       # Senescence coefficient DV (degreeday)
+    ('Kl_DV',       'kldv=%.3f (=0.001)'),      # Abscission coefficient DV (degreeday)
+    ('rho_DV',      'rhodv=%.2f (=500)'),       # Volume DV (g m-3)
+    ('W_DR',        'wdr=%.2f (=500)'),         # Biomass of DR (kg ha-1)
+    ('K_DR',        'kdr=%.3f (=0.001)'),       # Senescence coefficient DR (degreeday)
+    ('Kl_DR',       'kldr=%.4f (=0.0005)'),     # Abscission coefficient DR (degreeday)
+    ('rho_DR',      'rhodr=%.2f (=150)'),       # Volume DR (g m-3)
+    ('init_AGE_GV', 'initagegv=%.2f (=100)'),   # Initial value of age of compartment GV
+    ('init_AGE_GR', 'initagegr=%.2f (=2000)'),  # Initial value of age of compartment GR
+    ('init_AGE_DV', 'initagedv=%.2f (=300)'),   # Initial value of age of compartment DV
+    ('init_AGE_DR', 'initagedr=%.2f (=500)'),   # Initial value of age of compartment DR
+    ('RUEmax',      'ruemax=%.2f (=3)'),        # Max of R.U.E.
+    ('gammaGV',     'gv_gamma=%.2f (=0.4)'),    # Respiration of green vegetative
+    ('gammaGR',     'gr_gamma=%.2f (=0.2)'),    # Respiration of green reproductive
+    ('maxOMDgv',    'maxOMDgv=%.2f (=0.9)'),    # maximum OMD green veg
+    ('minOMDgv',    'minOMDgv=%.2f (=0.75)'),   # minimum OMD green veg
+    ('maxOMDgr',    'maxOMDgr=%.2f (=0.9)'),    # maximum OMD green rep
+    ('minOMDgr',    'minOMDgr=%.2f (=0.65)'),   # minimum OMD green rep
+    ('meanOMDdv',   'meanOMDdv=%.2f (=0.45)'),  # mean OMD dry veg
+    ('meanOMDdr',   'meanOMDdr=%.2f (=0.4)'),   # mean OMD dry rep
+    ('cellSurface', 'cellSurface=%.2f (=0.01)'),# Pixel area [Ha]
+)
+
+PARAM_NAMES = tuple(name for name, fmt in PARAMS)
+PARAM_INDEX = dict((name, k) for k, name in enumerate(PARAM_NAMES))
+
+class ModvegeParams:
+    """
+    Named parameter set of Mod Vege
+
+    Backed by one float64 array, (44,) for a cell or (ncells, 44) for a grid
+    where each cell has its own parameters. params.ST1 is a float for a cell
+    and a (ncells,) array for a grid, params[0] still reads the columns by position.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        """
+        :param values: the 44 parameters, in the order of params.csv, (44,) or (ncells, 44)
+        """
+        self.values = np.asarray(values, dtype=np.float64)
+        if self.values.ndim not in (1, 2) or self.values.shape[-1] != len(PARAM_NAMES):
+            raise ValueError("Expected (%d,) or (ncells, %d) parameters, got %s" % (len(PARAM_NAMES), len(PARAM_NAMES), self.values.shape))
+
+    @classmethod
+    def from_csv(cls, file):
+        """
+        Read a params.csv file (name,value per line), by name
+
+        :param file: the input file named param.csv
+        """
+        arr = np.genfromtxt(file, delimiter=",", dtype=None, encoding=None)
+        values = dict((str(name), float(value)) for name, value in arr)
+        missing = [name for name in PARAM_NAMES if name not in values]
+        if missing:
+            raise ValueError("Missing parameters in %s: %s" % (file, ", ".join(missing)))
+        return cls([values[name] for name in PARAM_NAMES])
+
+    @classmethod
+    def from_table(cls, file):
+        """
+        Read a table of parameters, one column per parameter name and one row per cell
+
+        :param file: csv file with a header line of the parameter names
+        """
+        arr = np.atleast_1d(np.genfromtxt(file, delimiter=",", names=True))
+        missing = [name for name in PARAM_NAMES if name not in arr.dtype.names]
+        if missing:
+            raise ValueError("Missing parameters in %s: %s" % (file, ", ".join(missing)))
+        return cls(np.stack([arr[name] for name in PARAM_NAMES], axis=-1))
+
+    @classmethod
+    def stack(cls, params):
+        """
+        Build the parameters of a grid, one row per cell
+
+        :param params: list of single cell parameters
+        """
+        return cls(np.stack([to_params(p).values for p in params], axis=0))
+
+    def __getattr__(self, name):
+        try:
+            k = PARAM_INDEX[name]
+        except KeyError:
+            raise AttributeError(name)
+        if self.values.ndim == 1:
+            return self.values[k]
+        return self.values[:, k]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.__getattr__(key)
+        return self.values[..., key]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.values
+        return self.values.astype(dtype)
+
+    @property
+    def ncells(self):
+        """Number of cells, None for a single cell"""
+        if self.values.ndim == 1:
+            return None
+        return self.values.shape[0]
+
+    def cells(self, index):
+        """
+        Return the parameters of a subset of the cells
+
+        :param index: slice, integer array or boolean mask over the cells
+        """
+        return ModvegeParams(self.values[index])
+
+    def replace(self, **values):
+        """
+        Return a copy with some parameters changed
+
+        :param values: parameter name = value (a float, or an array over cells)
+        :return the new ModvegeParams, a grid if any value is an array over cells
+        """
+        ncells = [np.shape(v)[0] for v in values.values() if np.ndim(v) > 0]
+        shape = self.values.shape
+        if self.values.ndim == 1 and ncells:
+            shape = (ncells[0],) + shape
+        new = np.array(np.broadcast_to(self.values, shape))
+        for name, value in values.items():
+            if name not in PARAM_INDEX:
+                raise KeyError(name)
+            new[..., PARAM_INDEX[name]] = value
+        return ModvegeParams(new)
+
+    def log(self, file=None):
+        """
+        Print the parameters, for a grid the range over the cells
+
+        :param file: where to print, default is sys.stdout
+        """
+        if file is None:
+            file = sys.stdout
+        for k, (name, fmt) in enumerate(PARAMS):
+            if self.values.ndim == 1:
+                print(fmt % (self.values[k]), file=file)
+            else:
+                column = self.values[:, k]
+                print("%s [min=%g max=%g]" % (fmt.split('=')[0], column.min(), column.max()), file=file)
+
+def to_params(params):
+    """
+    Convert the array of read_params() into a ModvegeParams
+
+    :param params: a ModvegeParams (returned as it is) or an array of the 44 parameters
+    :return the ModvegeParams
+    """
+    if isinstance(params, ModvegeParams):
+        return params
+    return ModvegeParams(params)
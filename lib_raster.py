@@ -0,0 +1,471 @@
+import os
+import numpy as np
+from multiprocessing import shared_memory
+
+from lib_forcing import Forcing, FORCING_COLUMNS
+from lib_params import to_params, PARAM_INDEX
+
+#########################################################
+# Raster layers of a pixel grid: forcing stacks (one band
+# per day), parameter layers (one band), output series
+#########################################################
+# A window is (row, col, height, width) of the raster, its
+# cells are its pixels in row-major order: cell = r*width + c
+
+#Define DEFAULT_BLOCK_SHAPE 256 x 256 pixels read at once
+DEFAULT_BLOCK_SHAPE = (256, 256)
+
+def block_windows(shape, blockshape=DEFAULT_BLOCK_SHAPE):
+    """
+    Cut a raster into windows
+
+    :param shape: (height, width) of the raster
+    :param blockshape: (height, width) of a window, the last ones of a row/column may be smaller
+    :return generator of (row, col, height, width)
+    """
+    for row in range(0, shape[0], blockshape[0]):
+        for col in range(0, shape[1], blockshape[1]):
+            yield((row, col, min(blockshape[0], shape[0] - row), min(blockshape[1], shape[1] - col)))
+
+class RasterLayer:
+    """
+    A raster of one or more bands, read a window at a time
+
+    Layers of files are pickled as their file, and opened again by the worker processes.
+    """
+    __slots__ = ('shape', 'nbands')
+
+    def read(self, window):
+        """
+        :param window: (row, col, height, width)
+        :return the pixels of the window, (nbands, height, width) float64
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class ArrayLayer(RasterLayer):
+    """
+    Raster held by an array (nbands, height, width) or (height, width), a .npy file is memory-mapped
+    """
+    __slots__ = ('array', 'file')
+
+    def __init__(self, array):
+        self.file = None
+        if isinstance(array, str):
+            self.file = array
+            array = np.load(array, mmap_mode='r')
+        if array.ndim == 2:
+            array = array[np.newaxis]
+        self.array = array
+        self.nbands = array.shape[0]
+        self.shape = array.shape[1:]
+
+    def __reduce__(self):
+        return((ArrayLayer, (self.array if self.file is None else self.file,)))
+
+    def read(self, window):
+        row, col, height, width = window
+        return(np.asarray(self.array[:, row:row + height, col:col + width], dtype=np.float64))
+
+class SharedArrayLayer(ArrayLayer):
+    """
+    Raster held by an array in shared memory, pickled as the name of its block, so the worker
+    processes attach to the array instead of receiving a copy of it with every task
+    """
+    __slots__ = ('block', 'shm')
+
+    def __init__(self, block):
+        """
+        :param block: (name, shape, dtype) of the shared memory block
+        """
+        name, shape, dtype = block
+        self.block = block
+        self.shm = shared_memory.SharedMemory(name=name)
+        ArrayLayer.__init__(self, np.ndarray(shape, dtype=dtype, buffer=self.shm.buf))
+
+    @classmethod
+    def create(cls, array):
+        """
+        Copy an array into a new shared memory block, to be removed with unlink() once the workers are done
+
+        :param array: the array (nbands, height, width)
+        :return the SharedArrayLayer
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        layer = cls((shm.name, array.shape, array.dtype.str))
+        shm.close()
+        return(layer)
+
+    def __reduce__(self):
+        return((SharedArrayLayer, (self.block,)))
+
+    def close(self):
+        # the view on the block is released before closing it
+        self.array = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+def share_layer(layer, shared):
+    """
+    Move an in-memory ArrayLayer into shared memory, the layers of files are opened by the workers
+
+    :param layer: a RasterLayer, a float or None
+    :param shared: list the SharedArrayLayer created is appended to (to be unlinked)
+    :return the SharedArrayLayer, or layer itself
+    """
+    if type(layer) is not ArrayLayer or layer.file is not None:
+        return(layer)
+    layer = SharedArrayLayer.create(layer.array)
+    shared.append(layer)
+    return(layer)
+
+class GeoTiffLayer(RasterLayer):
+    """
+    GeoTIFF file (rasterio), read by windows, one band per day for a forcing stack
+    """
+    __slots__ = ('file', 'dataset')
+
+    def __init__(self, file):
+        try:
+            import rasterio
+        except ImportError:
+            raise ImportError("GeoTiffLayer needs rasterio")
+        self.file = file
+        self.dataset = rasterio.open(file)
+        self.nbands = self.dataset.count
+        self.shape = (self.dataset.height, self.dataset.width)
+
+    def __reduce__(self):
+        return((GeoTiffLayer, (self.file,)))
+
+    @property
+    def profile(self):
+        """Georeferencing (crs, transform...) of the file, for GeoTiffWriter"""
+        return(self.dataset.profile)
+
+    def read(self, window):
+        from rasterio.windows import Window
+        row, col, height, width = window
+        arr = self.dataset.read(window=Window(col, row, width, height), masked=True)
+        return(np.ma.filled(arr.astype(np.float64), np.nan))
+
+    def close(self):
+        self.dataset.close()
+
+class NetCDFLayer(RasterLayer):
+    """
+    Variable of a NetCDF file (netCDF4), (time, y, x) or (y, x), read by windows
+    """
+    __slots__ = ('file', 'variable', 'dataset')
+
+    def __init__(self, file, variable):
+        try:
+            import netCDF4
+        except ImportError:
+            raise ImportError("NetCDFLayer needs netCDF4")
+        self.file = file
+        self.dataset = netCDF4.Dataset(file, 'r')
+        self.variable = self.dataset[variable]
+        if self.variable.ndim not in (2, 3):
+            raise ValueError("%s:%s is not a (time, y, x) or (y, x) variable" % (file, variable))
+        self.nbands = self.variable.shape[0] if self.variable.ndim == 3 else 1
+        self.shape = self.variable.shape[-2:]
+
+    def __reduce__(self):
+        return((NetCDFLayer, (self.file, self.variable.name)))
+
+    def read(self, window):
+        row, col, height, width = window
+        arr = self.variable[..., row:row + height, col:col + width]
+        arr = np.ma.filled(np.ma.asarray(arr).astype(np.float64), np.nan)
+        if arr.ndim == 2:
+            arr = arr[np.newaxis]
+        return(arr)
+
+    def close(self):
+        self.dataset.close()
+
+def open_layer(layer):
+    """
+    Open a raster layer
+
+    :param layer: a RasterLayer, an array, a .npy/.tif/.tiff file, or 'file.nc:variable'
+    :return the RasterLayer
+    """
+    if isinstance(layer, RasterLayer):
+        return(layer)
+    if not isinstance(layer, str):
+        return(ArrayLayer(np.asarray(layer)))
+    file, sep, variable = layer.rpartition(':')
+    if sep and file.lower().endswith('.nc'):
+        return(NetCDFLayer(file, variable))
+    extension = os.path.splitext(layer)[1].lower()
+    if extension in ('.tif', '.tiff'):
+        return(GeoTiffLayer(layer))
+    if extension == '.npy':
+        return(ArrayLayer(layer))
+    raise ValueError("Unknown raster layer %r, expected a .tif, .npy or file.nc:variable" % (layer))
+
+class RasterForcing:
+    """
+    Forcing of a pixel grid, one raster stack (a band per day) or constant per FORCING_COLUMNS
+
+    Columns not given are 0 (no cut, no grazing, eta and lai computed by the model),
+    DOY is the band number, a one band layer is the same every day.
+    """
+    __slots__ = ('layers', 'shape', 'ndays')
+
+    def __init__(self, layers):
+        """
+        :param layers: dictionary of FORCING_COLUMNS name: layer (see open_layer()) or float
+        """
+        unknown = [name for name in layers if name not in FORCING_COLUMNS]
+        if unknown:
+            raise ValueError("Unknown forcing columns: %s" % (", ".join(unknown)))
+        self.layers = dict((name, layer if isinstance(layer, (int, float)) else open_layer(layer)) for name, layer in layers.items())
+        rasters = [layer for layer in self.layers.values() if isinstance(layer, RasterLayer)]
+        if not rasters:
+            raise ValueError("RasterForcing needs at least one raster layer")
+        self.shape = tuple(rasters[0].shape)
+        self.ndays = max(layer.nbands for layer in rasters)
+        for name, layer in self.layers.items():
+            if isinstance(layer, RasterLayer) and (tuple(layer.shape) != self.shape or layer.nbands not in (1, self.ndays)):
+                raise ValueError("Forcing layer %s is %d x %s, expected %d (or 1) x %s" % (name, layer.nbands, tuple(layer.shape), self.ndays, self.shape))
+
+    def read(self, window):
+        """
+        Read the forcing of the pixels of a window
+
+        :param window: (row, col, height, width)
+        :return the Forcing, (ndays, height*width)
+        """
+        ncells = window[2] * window[3]
+        columns = {}
+        for name in FORCING_COLUMNS:
+            layer = self.layers.get(name)
+            if name == 'DOY' and layer is None:
+                arr = np.broadcast_to(np.arange(1, self.ndays + 1, dtype=np.float64)[:, np.newaxis], (self.ndays, ncells))
+            elif isinstance(layer, RasterLayer):
+                arr = np.broadcast_to(layer.read(window).reshape(layer.nbands, ncells), (self.ndays, ncells))
+            else:
+                arr = np.full((self.ndays, ncells), 0.0 if layer is None else layer)
+            columns[name] = arr
+        return(Forcing(columns))
+
+    def close(self):
+        for layer in self.layers.values():
+            if isinstance(layer, RasterLayer):
+                layer.close()
+
+    def shared(self, shared):
+        """
+        Return the forcing with its in-memory layers moved into shared memory (see share_layer())
+        """
+        return(RasterForcing(dict((name, share_layer(layer, shared)) for name, layer in self.layers.items())))
+
+class RasterParams:
+    """
+    Parameters of a pixel grid: the parameters of params.csv, some of them replaced by one band raster layers
+    """
+    __slots__ = ('params', 'layers')
+
+    def __init__(self, params, layers=None):
+        """
+        :param params: ModvegeParams or array of 44 values, shared by all pixels
+        :param layers: dictionary of parameter name: layer (see open_layer()) with the value of every pixel
+        """
+        self.params = to_params(params)
+        layers = {} if layers is None else layers
+        unknown = [name for name in layers if name not in PARAM_INDEX]
+        if unknown:
+            raise KeyError(", ".join(unknown))
+        self.layers = dict((name, open_layer(layer)) for name, layer in layers.items())
+
+    def read(self, window):
+        """
+        Read the parameters of the pixels of a window
+
+        :param window: (row, col, height, width)
+        :return the ModvegeParams, (height*width, 44), or (44,) without layers
+        """
+        if not self.layers:
+            return(self.params)
+        return(self.params.replace(**dict((name, layer.read(window)[0].ravel()) for name, layer in self.layers.items())))
+
+    def close(self):
+        for layer in self.layers.values():
+            layer.close()
+
+    def shared(self, shared):
+        """
+        Return the parameters with their in-memory layers moved into shared memory (see share_layer())
+        """
+        return(RasterParams(self.params, dict((name, share_layer(layer, shared)) for name, layer in self.layers.items())))
+
+class RasterWriter:
+    """
+    Writes daily outputs as raster time series, a window at a time
+    """
+    __slots__ = ('variables', 'shape', 'startdoy', 'ndays')
+
+    def open(self, variables, shape, startdoy, ndays):
+        """
+        Start the series
+
+        :param variables: names of the outputs
+        :param shape: (height, width) of the raster
+        :param startdoy: day of year of the first day
+        :param ndays: number of days
+        """
+        self.variables = tuple(variables)
+        self.shape = tuple(shape)
+        self.startdoy = startdoy
+        self.ndays = ndays
+
+    def write(self, window, data):
+        """
+        Write the outputs of the pixels of a window
+
+        :param window: (row, col, height, width)
+        :param data: (ndays, len(variables), height*width), as ModvegeOutput.data
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class NpyRasterWriter(RasterWriter):
+    """
+    Directory of one memory-mapped .npy file per output, (ndays, height, width)
+    """
+    __slots__ = ('directory', 'arrays')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.arrays = None
+
+    def open(self, variables, shape, startdoy, ndays):
+        RasterWriter.open(self, variables, shape, startdoy, ndays)
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(os.path.join(self.directory, 'doy.npy'), np.arange(startdoy, startdoy + ndays))
+        self.arrays = [np.lib.format.open_memmap(os.path.join(self.directory, name + '.npy'), mode='w+', dtype=np.float64, shape=(ndays,) + self.shape)
+                       for name in self.variables]
+
+    def write(self, window, data):
+        row, col, height, width = window
+        for j, arr in enumerate(self.arrays):
+            arr[:, row:row + height, col:col + width] = data[:, j].reshape(-1, height, width)
+            arr.flush()
+
+    def close(self):
+        self.arrays = None
+
+class GeoTiffWriter(RasterWriter):
+    """
+    Directory of one GeoTIFF file per output (rasterio), one band per day, tiled
+    """
+    __slots__ = ('directory', 'profile', 'datasets')
+
+    def __init__(self, directory, profile=None):
+        """
+        :param directory: the output directory
+        :param profile: rasterio profile (crs, transform...) of the input rasters, see GeoTiffLayer.profile
+        """
+        self.directory = directory
+        self.profile = {} if profile is None else dict(profile)
+        self.datasets = None
+
+    def open(self, variables, shape, startdoy, ndays):
+        RasterWriter.open(self, variables, shape, startdoy, ndays)
+        try:
+            import rasterio
+        except ImportError:
+            raise ImportError("GeoTiffWriter needs rasterio")
+        os.makedirs(self.directory, exist_ok=True)
+        profile = dict(self.profile)
+        profile.update(driver='GTiff', height=shape[0], width=shape[1], count=ndays, dtype='float64',
+                       nodata=np.nan, tiled=True, blockxsize=256, blockysize=256, compress='deflate')
+        self.datasets = [rasterio.open(os.path.join(self.directory, name + '.tif'), 'w', **profile) for name in self.variables]
+        for dataset in self.datasets:
+            for band in range(ndays):
+                dataset.set_band_description(band + 1, 'doy %d' % (startdoy + band))
+
+    def write(self, window, data):
+        from rasterio.windows import Window
+        row, col, height, width = window
+        for j, dataset in enumerate(self.datasets):
+            dataset.write(data[:, j].reshape(-1, height, width), window=Window(col, row, width, height))
+
+    def close(self):
+        if self.datasets is not None:
+            for dataset in self.datasets:
+                dataset.close()
+            self.datasets = None
+
+class NetCDFRasterWriter(RasterWriter):
+    """
+    NetCDF4 file (netCDF4), one (time, y, x) variable per output, chunked by window
+    """
+    __slots__ = ('file', 'chunkshape', 'coordinates', 'dataset')
+
+    def __init__(self, file, chunkshape=DEFAULT_BLOCK_SHAPE, coordinates=None):
+        """
+        :param file: the output file
+        :param chunkshape: (height, width) of a chunk, the block shape of the run
+        :param coordinates: dictionary of y and x: 1-D coordinates of the rows and columns
+        """
+        self.file = file
+        self.chunkshape = chunkshape
+        self.coordinates = coordinates
+        self.dataset = None
+
+    def open(self, variables, shape, startdoy, ndays):
+        RasterWriter.open(self, variables, shape, startdoy, ndays)
+        try:
+            import netCDF4
+        except ImportError:
+            raise ImportError("NetCDFRasterWriter needs netCDF4")
+        self.dataset = netCDF4.Dataset(self.file, 'w')
+        self.dataset.createDimension('time', ndays)
+        self.dataset.createDimension('y', shape[0])
+        self.dataset.createDimension('x', shape[1])
+        self.dataset.createVariable('doy', 'i4', ('time',))[:] = np.arange(startdoy, startdoy + ndays)
+        if self.coordinates is not None:
+            for name in ('y', 'x'):
+                self.dataset.createVariable(name, 'f8', (name,))[:] = self.coordinates[name]
+        chunks = (ndays, min(self.chunkshape[0], shape[0]), min(self.chunkshape[1], shape[1]))
+        for name in self.variables:
+            self.dataset.createVariable(name, 'f8', ('time', 'y', 'x'), chunksizes=chunks, zlib=True, fill_value=np.nan)
+
+    def write(self, window, data):
+        row, col, height, width = window
+        for j, name in enumerate(self.variables):
+            self.dataset[name][:, row:row + height, col:col + width] = data[:, j].reshape(-1, height, width)
+        self.dataset.sync()
+
+    def close(self):
+        if self.dataset is not None:
+            self.dataset.close()
+            self.dataset = None
+
+# Raster writer of each output format
+RASTER_WRITERS = {'npy': NpyRasterWriter, 'tif': GeoTiffWriter, 'nc': NetCDFRasterWriter}
+
+def make_raster_writer(file, format=None):
+    """
+    Return the RasterWriter of an output
+
+    :param file: the output file ('nc') or directory ('npy', 'tif')
+    :param format: one of RASTER_WRITERS, default is the extension of file
+    """
+    if format is None:
+        format = os.path.splitext(file)[1].lstrip('.').lower()
+    if format not in RASTER_WRITERS:
+        raise ValueError("Unknown raster format %r, expected one of %s" % (format, ", ".join(RASTER_WRITERS)))
+    return(RASTER_WRITERS[format](file))
@@ -1,5 +1,9 @@
+import os
+import json
 import numpy as np
 
+from lib_forcing import Forcing, FORCING_COLUMNS
+
 # ModVege is using 4 parts:
 # Green Vegetative  (GV)
 # Green Reproductive(GR)
@@ -92,3 +96,116 @@ def read_weather(file):
     arr = np.genfromtxt(file, delimiter=",", skip_header=0, names=True)
     return(arr)
 
+def read_forcing(file):
+    """
+    Read the weather csv file into a Forcing (one float64 array per column)
+
+    :param file: the input file named weather.csv
+    :return forcing: the Forcing of the file
+    """
+    return(Forcing(read_weather(file)))
+
+#########################################################
+# Binary cache of the input files
+#########################################################
+# A weather store is a directory holding one .npy file per weather column
+# (ncells x ndays for a grid, ndays for a single csv) and a sources.json
+# recording the csv files it was made of and their modification times.
+# It is opened with np.load(mmap_mode='r'): a worker only reads from disk
+# the pages of the cells it simulates.
+
+def _sources(files):
+    """
+    Return the [path, mtime] list of the source csv files
+    """
+    return([[os.path.abspath(f), os.path.getmtime(f)] for f in files])
+
+def convert_weather(files, store):
+    """
+    Write weather csv file(s) into a binary weather store
+
+    :param files: one weather csv file, or a list of them (one per cell, same number of days)
+    :param store: the directory of the store
+    """
+    single = isinstance(files, str)
+    if single:
+        files = [files]
+    weathers = [read_weather(f) for f in files]
+    os.makedirs(store, exist_ok=True)
+    for name in FORCING_COLUMNS:
+        if single:
+            arr = weathers[0][name]
+        else:
+            # one row per cell, so the days of a cell are contiguous on disk
+            arr = np.stack([w[name] for w in weathers], axis=0)
+        np.save(os.path.join(store, name + '.npy'), np.ascontiguousarray(arr, dtype=np.float64))
+    # Written last: a store without sources.json is an unfinished one
+    with open(os.path.join(store, 'sources.json'), 'w') as fp:
+        json.dump({'single': single, 'sources': _sources(files)}, fp)
+
+def is_weather_store_stale(files, store):
+    """
+    Check if the weather store is missing or older than its csv files
+
+    :param files: one weather csv file, or a list of them
+    :param store: the directory of the store
+    :return True if the store has to be (re)built
+    """
+    if isinstance(files, str):
+        files = [files]
+    try:
+        with open(os.path.join(store, 'sources.json')) as fp:
+            manifest = json.load(fp)
+    except (OSError, ValueError):
+        return(True)
+    return(manifest['sources'] != _sources(files))
+
+def read_weather_store(store, cells=None):
+    """
+    Open a binary weather store into a Forcing, memory-mapped
+
+    :param store: the directory of the store
+    :param cells: slice, integer array or boolean mask of the cells to read (grid stores only)
+    :return forcing: the Forcing, (ndays,) for a single csv or (ndays, ncells) for a grid
+    """
+    columns = {}
+    for name in FORCING_COLUMNS:
+        arr = np.load(os.path.join(store, name + '.npy'), mmap_mode='r')
+        if arr.ndim == 2:
+            if cells is not None:
+                arr = arr[cells]
+            # Forcing copies into (ndays, ncells): only the selected cells are read
+            arr = arr.T
+        columns[name] = arr
+    return(Forcing(columns))
+
+def read_weather_cached(files, store=None, cells=None):
+    """
+    Read weather csv file(s) through their binary store, (re)built when a csv changed
+
+    :param files: one weather csv file, or a list of them (one per cell)
+    :param store: the directory of the store (default is the csv file name + '.cache')
+    :param cells: the cells to read (grid stores only)
+    :return forcing: the Forcing of the files
+    """
+    if store is None:
+        if not isinstance(files, str):
+            raise ValueError("A store directory is needed for a list of weather files")
+        store = files + '.cache'
+    if is_weather_store_stale(files, store):
+        convert_weather(files, store)
+    return(read_weather_store(store, cells))
+
+def read_params_cached(file, cache=None):
+    """
+    Read the input parameters file through its .npy copy, rebuilt when the csv changed
+
+    :param file: the input file named param.csv
+    :param cache: the .npy file (default is the csv file name + '.npy')
+    :return arr: the memory-mapped array of parameters
+    """
+    if cache is None:
+        cache = file + '.npy'
+    if not os.path.exists(cache) or os.path.getmtime(cache) < os.path.getmtime(file):
+        np.save(cache, read_params(file))
+    return(np.load(cache, mmap_mode='r'))
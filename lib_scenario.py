@@ -0,0 +1,92 @@
+import numpy as np
+
+#########################################################
+# Management scenarios: the grass cut and grazing columns
+# of weather.csv, one column per scenario
+#########################################################
+#gcut_height                Grass cut event cutHeight (m)
+#grazing_animal_count       Grazing animal count (-)
+#grazing_avg_animal_weight  Grazing average animal weight (kg)
+
+MANAGEMENT_COLUMNS = ('gcut_height', 'grazing_animal_count', 'grazing_avg_animal_weight')
+
+class Management:
+    """
+    Grass cut and grazing calendars of a run, replacing the ones of the weather
+
+    One float64 array per MANAGEMENT_COLUMNS, (ndays, nscenarios), one column per
+    scenario, while the weather columns stay (ndays,) and are shared by all scenarios.
+    """
+    __slots__ = MANAGEMENT_COLUMNS
+
+    def __init__(self, columns):
+        """
+        :param columns: mapping of the MANAGEMENT_COLUMNS to (ndays,) or (ndays, nscenarios) arrays
+        """
+        for name in MANAGEMENT_COLUMNS:
+            setattr(self, name, np.ascontiguousarray(columns[name], dtype=np.float64))
+        for name in MANAGEMENT_COLUMNS[1:]:
+            if getattr(self, name).shape != self.gcut_height.shape:
+                raise ValueError("Management column %s has shape %s instead of %s" % (name, getattr(self, name).shape, self.gcut_height.shape))
+
+    @classmethod
+    def from_events(cls, scenarios, ndays, base=None):
+        """
+        Build the calendars of scenarios from their events
+
+        An event is (day, cut height (m), animal count, average animal weight (kg)),
+        day being a day of year or a (first, last) range of days (a grazing period).
+        A cut height of 0 is no cut, an animal count or weight of 0 is no grazing.
+
+        :param scenarios: list of the list of events of every scenario
+        :param ndays: number of days of the weather
+        :param base: Forcing (or Management) whose calendar the events are added to, default is no cut and no grazing
+        :return the Management, (ndays, len(scenarios))
+        """
+        columns = {}
+        for name in MANAGEMENT_COLUMNS:
+            start = np.zeros(ndays) if base is None else np.asarray(base[name], dtype=np.float64).reshape(ndays, -1)[:, 0]
+            columns[name] = np.repeat(start[:, np.newaxis], len(scenarios), axis=1)
+        for s, events in enumerate(scenarios):
+            for day, cutHeight, count, weight in events:
+                first, last = day if isinstance(day, tuple) else (day, day)
+                if first < 1 or last > ndays or first > last:
+                    raise ValueError("Scenario %d: days %d-%d not in 1-%d" % (s, first, last, ndays))
+                days = slice(first - 1, last)
+                columns['gcut_height'][days, s] = cutHeight
+                columns['grazing_animal_count'][days, s] = count
+                columns['grazing_avg_animal_weight'][days, s] = weight
+        return cls(columns)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __len__(self):
+        return len(self.gcut_height)
+
+    @property
+    def shape(self):
+        """(ndays,) or (ndays, nscenarios)"""
+        return self.gcut_height.shape
+
+    def scenarios(self, index):
+        """
+        Return the Management of a subset of the scenarios
+
+        :param index: slice, integer array or boolean mask over the scenarios
+        """
+        return Management(dict((name, getattr(self, name)[:, index]) for name in MANAGEMENT_COLUMNS))
+
+def run_management(management, forcing):
+    """
+    Management a run reads its cuts and grazing from
+
+    :param management: a Management (checked against the days of the weather), or None for the calendar of the weather
+    :param forcing: the Forcing of the run
+    :return the Management, or the Forcing itself
+    """
+    if management is None:
+        return forcing
+    if len(management) != len(forcing):
+        raise ValueError("The management has %d days, the weather %d" % (len(management), len(forcing)))
+    return management
@@ -0,0 +1,211 @@
+import numpy as np
+
+from lib_params import to_params
+
+#########################################################
+# State of Mod Vege carried from a day to the next
+#########################################################
+STATE_VARIABLES = (
+    'gv_biomass',           # Green Vegetative biomass (kg DM ha-1)
+    'dv_biomass',           # Dead Vegetative biomass (kg DM ha-1)
+    'gr_biomass',           # Green Reproductive biomass (kg DM ha-1)
+    'dr_biomass',           # Dead Reproductive biomass (kg DM ha-1)
+    'gv_avg_age',           # Average age of GV (degreeday)
+    'gr_avg_age',           # Average age of GR (degreeday)
+    'dv_avg_age',           # Average age of DV (degreeday)
+    'dr_avg_age',           # Average age of DR (degreeday)
+    'waterReserve',         # Soil water reserve (mm)
+    'ni',                   # Nutritional index of cell
+    'isCut',                # 1 when the cell was cut or grazed (and the flag not reset since)
+    'a2rFlag',              # 1 when reproduction was permanently stopped by a cut
+    'harvested_biomass',    # Harvested biomass, cumulated (kg DM ha-1)
+    'ingested_biomass',     # Ingested biomass, cumulated (kg DM ha-1)
+    'previousAvBiom4cut',   # Available biomass for cut of the previous day (kg DM ha-1)
+)
+STATE_INDEX = dict((name, k) for k, name in enumerate(STATE_VARIABLES))
+
+# Parameter (params.csv) a state variable starts from, the others start at 0
+STATE_PARAMS = {
+    'gv_biomass': 'W_GV',
+    'dv_biomass': 'W_DV',
+    'gr_biomass': 'W_GR',
+    'dr_biomass': 'W_DR',
+    'gv_avg_age': 'init_AGE_GV',
+    'gr_avg_age': 'init_AGE_GR',
+    'dv_avg_age': 'init_AGE_DV',
+    'dr_avg_age': 'init_AGE_DR',
+    'waterReserve': 'WR',
+    'ni': 'NI',
+}
+
+# Reset to 0 by new_year(): the cut flags (reproductive growth starts again every year) and the annual totals
+ANNUAL_VARIABLES = ('isCut', 'a2rFlag', 'harvested_biomass', 'ingested_biomass')
+
+#Define TEMPERATURE_DAYS 10 days of temperature of the previous year kept by new_year() for the ten days mean
+TEMPERATURE_DAYS = 10
+
+class ModvegeState:
+    """
+    State of Mod Vege between two days, exported by a run and imported by the next one
+
+    Backed by one float64 array, (15,) for a cell or (ncells, 15) for a grid,
+    in the order of STATE_VARIABLES (the flags are stored as 0/1).
+    A run given a state starts from it and updates it in place.
+    Between two years it also holds the temperature of the last days of the
+    previous year (temperatures), read by the ten days mean of the first days.
+    """
+    __slots__ = ('values', 'temperatures')
+
+    def __init__(self, values, temperatures=None):
+        """
+        :param values: the state variables, in the order of STATE_VARIABLES, (15,) or (ncells, 15)
+        :param temperatures: temperature of the days before the first day, (TEMPERATURE_DAYS,) or (TEMPERATURE_DAYS, ncells),
+                             default is None (the ten days mean wraps to the end of the weather)
+        """
+        self.values = np.array(values, dtype=np.float64)
+        if self.values.ndim not in (1, 2) or self.values.shape[-1] != len(STATE_VARIABLES):
+            raise ValueError("Expected (%d,) or (ncells, %d) state, got %s" % (len(STATE_VARIABLES), len(STATE_VARIABLES), self.values.shape))
+        self.temperatures = None if temperatures is None else np.array(temperatures, dtype=np.float64)
+
+    @classmethod
+    def from_params(cls, params, shape=None):
+        """
+        Initial state of a run, from the parameters
+
+        :param params: ModvegeParams or array, (44,) or (ncells, 44)
+        :param shape: () for a cell, (ncells,) for a grid, default is the shape of params
+        """
+        params = to_params(params)
+        if shape is None:
+            shape = params.values.shape[:-1]
+        values = np.zeros(tuple(shape) + (len(STATE_VARIABLES),))
+        for name, param in STATE_PARAMS.items():
+            values[..., STATE_INDEX[name]] = params[param]
+        return cls(values)
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        Import a state exported by as_dict()
+
+        :param values: dictionary of STATE_VARIABLES name: value (a float, or an array over cells), and temperatures if any
+        """
+        missing = [name for name in STATE_VARIABLES if name not in values]
+        if missing:
+            raise ValueError("Missing state variables: %s" % (", ".join(missing)))
+        return cls(np.stack([np.asarray(values[name], dtype=np.float64) for name in STATE_VARIABLES], axis=-1), values.get('temperatures'))
+
+    @classmethod
+    def load(cls, file):
+        """
+        Read a state written by save()
+
+        :param file: the .npz file
+        """
+        with np.load(file) as arr:
+            return cls.from_dict(dict((name, arr[name]) for name in arr.files))
+
+    def save(self, file):
+        """
+        Write the state into a .npz file, one entry per state variable
+
+        :param file: the .npz file
+        """
+        np.savez(file, **self.as_dict())
+
+    def as_dict(self):
+        """
+        Export the state as a dictionary of name: value (a float, or an array over cells), and temperatures if any
+        """
+        values = dict((name, self.values[..., k].copy()) for k, name in enumerate(STATE_VARIABLES))
+        if self.temperatures is not None:
+            values['temperatures'] = self.temperatures.copy()
+        return values
+
+    def __getattr__(self, name):
+        try:
+            k = STATE_INDEX[name]
+        except KeyError:
+            raise AttributeError(name)
+        if self.values.ndim == 1:
+            return self.values[k]
+        return self.values[:, k]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.__getattr__(key)
+        return self.values[..., key]
+
+    @property
+    def ncells(self):
+        """Number of cells, None for a single cell"""
+        if self.values.ndim == 1:
+            return None
+        return self.values.shape[0]
+
+    @property
+    def shape(self):
+        """() for a cell, (ncells,) for a grid"""
+        return self.values.shape[:-1]
+
+    def cells(self, index):
+        """
+        Return a copy of the state of a subset of the cells
+
+        :param index: slice, integer array or boolean mask over the cells
+        """
+        temperatures = self.temperatures
+        if temperatures is not None and temperatures.ndim == 2:
+            temperatures = temperatures[:, index]
+        return ModvegeState(self.values[index], temperatures)
+
+    def copy(self):
+        return ModvegeState(self.values, self.temperatures)
+
+    def fork(self, n):
+        """
+        Clone the state into n children that run on from it, as the cells of one state
+
+        :param n: number of children
+        :return the ModvegeState of the children, (n, 15) for a cell, (n*ncells, 15) for a grid (child k is the cells k*ncells...(k+1)*ncells-1)
+        """
+        temperatures = self.temperatures
+        if temperatures is not None and temperatures.ndim == 2:
+            temperatures = np.tile(temperatures, (1, n))
+        return ModvegeState(np.tile(self.values.reshape(-1, len(STATE_VARIABLES)), (n, 1)), temperatures)
+
+    def update(self, **values):
+        """
+        Set state variables, in place
+
+        :param values: state variable name = value (a float, or an array over cells)
+        """
+        for name, value in values.items():
+            self.values[..., STATE_INDEX[name]] = value
+
+    def new_year(self, temperature=None):
+        """
+        Start a new year: the cut flags and the annual totals (ANNUAL_VARIABLES) go back to 0, the compartments are kept
+
+        :param temperature: the daily temperature of the year that ends, (ndays,) or (ndays, ncells), its last
+                            TEMPERATURE_DAYS days are kept for the ten days mean of the first days of the new year
+        """
+        for name in ANNUAL_VARIABLES:
+            self.values[..., STATE_INDEX[name]] = 0.0
+        if temperature is not None:
+            self.temperatures = np.array(temperature[-TEMPERATURE_DAYS:], dtype=np.float64)
+
+def run_state(state, params, shape):
+    """
+    State a run starts from
+
+    :param state: a ModvegeState (checked against the cells of the run), or None to start from params
+    :param params: the ModvegeParams of the run
+    :param shape: () for a cell, (ncells,) for a grid
+    :return the ModvegeState, updated in place by the run
+    """
+    if state is None:
+        return ModvegeState.from_params(params, shape)
+    if state.shape != tuple(shape):
+        raise ValueError("The state is for cells %s, the run for cells %s" % (state.shape, tuple(shape)))
+    return state
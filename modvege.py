@@ -8,11 +8,16 @@ import copy
 
 #Import libraries of ModVege
 from lib_modvege import *
+from lib_forcing import to_forcing
+from lib_params import to_params
+from lib_output import ModvegeOutput, BlockOutput
+from lib_state import run_state
+from lib_modvege_numba import use_compiled_engine, modvege_numba
 
 #Define DEFAULT_CUT_HEIGHT 0.05
 DEFAULT_CUT_HEIGHT = 0.05
 
-def modvege(params, weather, startdoy, enddoy):
+def modvege(params, weather, startdoy, enddoy, verbose=False, outputs=None, engine='python', sink=None, blocksize=None, state=None):
     """
     **Mod Vege** model as a function
 
@@ -23,10 +28,17 @@ def modvege(params, weather, startdoy, enddoy):
     of herbage in managed permanent pastures. 1. Model description. 
     Grass and forage science, 61(2), pp.112-124.
 
-    :param params: parameters of this run
-    :param weather: weather data (and grass cut and grazing)
+    :param params: parameters of this run, ModvegeParams or read_params() array
+    :param weather: weather data (and grass cut and grazing), Forcing or read_weather() array
     :param startdoy: day of year when the simulation starts
     :param enddoy: day of year when simulation stops
+    :param verbose: print the parameters of the run
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python' (this loop), 'numba' (the compiled loop of lib_modvege_numba) or 'auto' (numba if installed)
+    :param sink: lib_output.OutputSink the outputs are streamed to, block by block, instead of being returned
+    :param blocksize: number of days held in memory before a block is written to the sink
+    :param state: lib_state.ModvegeState to start from (default is the initial values of params), updated in place to the state after the last day
+    :return ModvegeOutput of the daily outputs (the sink when streaming), it unpacks (when all are recorded) as
     :return Green Vegetative biomass (kg DM ha-1) 
     :return Dead Vegetative biomass (kg DM ha-1) 
     :return Green Reproductive biomass (kg DM ha-1) 
@@ -35,142 +47,104 @@ def modvege(params, weather, startdoy, enddoy):
     :return Ingested biomass (kg DM ha-1) 
     :return GRO biomass (kg DM ha-1) 
     :return Available Biomass for (kg DM ha-1) 
+    :return Sum of temperature, ages of GV, GR, DV, DR, fSEA, fTemperature, ENV, PGRO and a2r
     """
     #######################################################
     # Load input parameters into variables
     #######################################################
+    params = to_params(params)
+    if(verbose):
+        params.log()
+    if(use_compiled_engine(engine)):
+        return(modvege_numba(params, weather, startdoy, enddoy, outputs, sink=sink, blocksize=blocksize, state=state))
     #Onset of reproductive growth (degreeday)
-    st1 =              params[0]
-    print("st1=%.2f (=600)" % (st1))
+    st1 = params.ST1
     #End of reproductive growth (degreeday)
-    st2 =              params[1]
-    print("st2=%.2f (=1200)" % (st2))
+    st2 = params.ST2
     #Initial Nutritional index of cell
-    ni =          params[2]
-    print("ni=%.2f (=0.9)" % (ni))
+    ni = params.NI
     #Soil water-holding capacity (mm)
-    waterHoldingCapacity = params[3]
-    print("whc=%.2f (=200)" % (waterHoldingCapacity))
+    waterHoldingCapacity = params.WHC
     #Soil water reserve (mm)
-    waterReserve =  params[4]
-    print("wr=%.2f (=60)" % (waterReserve))
+    waterReserve = params.WR
     #Growth increase in winter
-    minsea =          params[5]
-    print("minsea=%.2f (=0.8)" % (minsea))
+    minsea = params.minSEA
     #Growth increase in summer
-    maxsea =          params[6]
-    print("maxsea=%.2f (=1.2)" % (maxsea))
+    maxsea = params.maxSEA
     #Biomass of GV (kg ha-1)
-    wgv =  params[7]
-    print("ibgv=%.2f (=750)" % (wgv))
+    wgv = params.W_GV
     #Light Use Interception
-    alphapar =          params[8]
-    print("alphapar=%.2f (=0.044)" % (alphapar))
+    alphapar = params.alpha_PAR
     #Temperature threshold: photosynthesis activation (degC)
-    t0 =              params[9]
-    print("t0=%.2f (=4)" % (t0))
+    t0 = params.T0
     #Temp threshold: stable growth (degC)
-    t1 =              params[10]
-    print("t1=%.2f (=10)" % (t1))
+    t1 = params.T1
     #Temp threshold: growth decline (degC)
-    t2 =              params[11]
-    print("t2=%.2f (=20)" % (t2))
+    t2 = params.T2
     #beta_T
-    betaT =              params[12]
-    print("betaT=%.2f (=0.05)" % (betaT))
+    betaT = params.beta_T
     #b_IN
-    b_IN =              params[13]
-    print("b_IN=%.2f (=0.025)" % (b_IN))
+    b_IN = params.b_IN
     #Specific leaf area (m2 g-1)
-    sla =              params[14]
-    print("sla=%.2f (=0.033)" % (sla))
+    sla = params.SLA
     #Leaf lifespan (degreeday)
-    lls =              params[15]
-    print("lls=%.2f (=500)" % (lls))
+    lls = params.LLS
     #Volume GV (g m-3)
-    rhogv =              params[16]
-    print("rhogv=%.2f (=850)" % (rhogv))
+    rhogv = params.rho_GV
     #% leaf of laminae in GV
-    pctlam =      params[17]
-    print("pctlam=%.2f (=0.68)" % (pctlam))
+    pctlam = params.percentLAM
     #Biomass of GR (kg ha-1)
-    wgr =              params[18]
-    print("wgr=%.2f (=0)" % (wgr))
+    wgr = params.W_GR
     #Value of ALLOC at NI=0
-    allocNI =          params[19]
-    print("allocni=%.2f (=0.2)" % (allocNI))
+    allocNI = params.a_IN
     #max of fNI
-    maxFNI =          params[20]
-    print("maxFNI=%.2f (=0.9)" % (maxFNI))
+    maxFNI = params.max_fIN
     #Volume GR (g m-3)
-    rhogr =              params[21]
-    print("rhogr=%.2f (=300)" % (rhogr))
+    rhogr = params.rho_GR
     #Biomass of DV (kg ha-1)
-    wdv =              params[22]
-    print("wdv=%.2f (=1200)" % (wdv))
+    wdv = params.W_DV
     #Senescence coefficient DV (degreeday)
-    kdv =              params[23]
-    print("kdv=%.3f (=0.002)" % (kdv))
+    kdv = params.K_DV
     #Abscission coefficient DV (degreeday)
-    kldv =                  params[24]
-    print("kldv=%.3f (=0.001)" % (kldv))
+    kldv = params.Kl_DV
     #Volume DV (g m-3)
-    rhodv =                 params[25]
-    print("rhodv=%.2f (=500)" % (rhodv))
+    rhodv = params.rho_DV
     #Biomass of DR (kg ha-1)
-    wdr =                   params[26]
-    print("wdr=%.2f (=500)" % (wdr))
+    wdr = params.W_DR
     #Senescence coefficient DR (degreeday)
-    kdr =                   params[27]
-    print("kdr=%.3f (=0.001)" % (kdr))
+    kdr = params.K_DR
     #Abscission coefficient DR (degreeday)
-    kldr =                  params[28]
-    print("kldr=%.4f (=0.0005)" % (kldr))
+    kldr = params.Kl_DR
     #Volume DR (g m-3)
-    rhodr =                 params[29]
-    print("rhodr=%.2f (=150)" % (rhodr))
+    rhodr = params.rho_DR
     #Initial value of age of compartment GV
-    gv_init_age =             params[30]
-    print("initagegv=%.2f (=100)" % (gv_init_age))
+    gv_init_age = params.init_AGE_GV
     #Initial value of age of compartment GR
-    gr_init_age =             params[31]
-    print("initagegr=%.2f (=2000)" % (gr_init_age))
+    gr_init_age = params.init_AGE_GR
     #Initial value of age of compartment DV
-    dv_init_age =             params[32]
-    print("initagedv=%.2f (=300)" % (dv_init_age))
+    dv_init_age = params.init_AGE_DV
     #Initial value of age of compartment DR
-    dr_init_age =             params[33]
-    print("initagedr=%.2f (=500)" % (dr_init_age))
+    dr_init_age = params.init_AGE_DR
     #Max of R.U.E.
-    ruemax =                params[34]
-    print("ruemax=%.2f (=3)" % (ruemax))
+    ruemax = params.RUEmax
     #Respiration of green vegetative
-    gv_gamma =               params[35]
-    print("gv_gamma=%.2f (=0.4)" % (gv_gamma))
+    gv_gamma = params.gammaGV
     #Respiration of green reproductive
-    gr_gamma =               params[36]
-    print("gr_gamma=%.2f (=0.2)" % (gr_gamma))
+    gr_gamma = params.gammaGR
     #maximum OMD green veg
-    maxOMDgv =              params[37]
-    print("maxOMDgv=%.2f (=0.9)" % (maxOMDgv))
+    maxOMDgv = params.maxOMDgv
     #minimum OMD green veg
-    minOMDgv =              params[38]
-    print("minOMDgv=%.2f (=0.75)" % (minOMDgv))
+    minOMDgv = params.minOMDgv
     #maximum OMD green rep
-    maxOMDgr =              params[39]
-    print("maxOMDgr=%.2f (=0.9)" % (maxOMDgr))
+    maxOMDgr = params.maxOMDgr
     #minimum OMD green rep
-    minOMDgr =              params[40]
-    print("minOMDgr=%.2f (=0.65)" % (minOMDgr))
+    minOMDgr = params.minOMDgr
     #mean OMD dry veg
-    meanOMDdv =             params[41]
-    print("meanOMDdv=%.2f (=0.45)" % (meanOMDdv))
+    meanOMDdv = params.meanOMDdv
     #mean OMD dry rep
-    meanOMDdr =             params[42]
-    print("meanOMDdr=%.2f (=0.4)" % (meanOMDdr))
+    meanOMDdr = params.meanOMDdr
     #Pixel area [Ha]
-    cellSurface =           params[43]
-    print("cellSurface=%.2f (=0.01)" % (cellSurface))
+    cellSurface = params.cellSurface
 
     #Pixel area [m2]
     cellSurfaceMeter = 10000*cellSurface
@@ -178,25 +152,26 @@ def modvege(params, weather, startdoy, enddoy):
     # distance minimum between center of the cell and border of the cell
     r = np.sqrt(6*np.sqrt(3)*cellSurfaceMeter)/6
 
-    # Initialize state parameters
+    # Initialize state parameters, from the state of a previous run if any
+    state = run_state(state, params, ())
     # This is a status flag changed in lib_cell.updateCell()
-    isCut = False
+    isCut = bool(state.isCut)
     # This is an actionable flag modified by weather.gcut_height presence
     isHarvested = False
     # This is an actionable flag modified by weather.grazing* presences
     isGrazed = False
     # permanently stop Reproduction after the first Cut (isCut is True)
     # p116, Jouven et al., 2006
-    a2rFlag = False
+    a2rFlag = bool(state.a2rFlag)
     # Harvested biomass
-    harvestedBiomass = 0
+    harvestedBiomass = state.harvested_biomass
     # Harvested biomass
-    ingestedBiomass = 0
+    ingestedBiomass = state.ingested_biomass
     # biomass for compartments
-    gv_biomass = wgv
-    gr_biomass = wgr
-    dv_biomass = wdv
-    dr_biomass = wdr
+    gv_biomass = state.gv_biomass
+    gr_biomass = state.gr_biomass
+    dv_biomass = state.dv_biomass
+    dr_biomass = state.dr_biomass
     # an==gro: biomass growth
     an = 0.0
     # Allocate to reproductive
@@ -205,90 +180,79 @@ def modvege(params, weather, startdoy, enddoy):
     gv_senescent_biomass = 0.0
     gr_senescent_biomass = 0.0
     # Average age of grass
-    gv_avg_age = gv_init_age
-    dv_avg_age = dv_init_age
-    gr_avg_age = gr_init_age
-    dr_avg_age = dr_init_age
+    gv_avg_age = state.gv_avg_age
+    dv_avg_age = state.dv_avg_age
+    gr_avg_age = state.gr_avg_age
+    dr_avg_age = state.dr_avg_age
+    # Soil water reserve and nutritional index
+    waterReserve = state.waterReserve
+    ni = state.ni
 
-    # Outputs
-    # Green Vegetation biomass
-    gvb = []
-    # Dry Vegetation biomass
-    dvb = []
-    # Green Reproductive biomass
-    grb = []
-    # Dry Reproductive biomass
-    drb = []
-    # GRO biomass
-    g = []
-    # harvested Biomass
-    hb = []
-    # ingested Biomass
-    ib = []
-    # available biomass for cut
-    abc = []
-    # sum of temperature
-    stp = []
-    # ages
-    gva = []
-    gra = []
-    dva = []
-    dra = []
-    # fSEA
-    sea = []
-    # fTemperature
-    ftm = []
-    # mk_env
-    env = []
-    # pGRO
-    pgr = []
-    # a2r
-    atr = []
+    # Available biomass for cut of the previous day
+    previousAvBiom4cut = state.previousAvBiom4cut
+
+    # Outputs, preallocated (one row per day), or a block of days streamed to the sink
+    ndays = max(0, enddoy - startdoy)
+    if(sink is None):
+        out = ModvegeOutput(ndays, variables=outputs, startdoy=startdoy)
+    else:
+        out = BlockOutput(sink, ndays, variables=outputs, startdoy=startdoy, blocksize=blocksize)
+    # PGRO is skipped on days without growth when its output is not asked for
+    recordPGRO = out.wants('pgro')
+
+    # Weather columns as plain float64 arrays, converted once
+    forcing = to_forcing(weather)
+    w_temperature = forcing.Temperature
+    w_pari = forcing.PARi
+    w_pp = forcing.PP
+    w_pet = forcing.PET
+    w_eta = forcing.eta
+    w_lai = forcing.lai
+    w_cutHeight = forcing.gcut_height
+    w_animal_count = forcing.grazing_animal_count
+    w_animal_weight = forcing.grazing_avg_animal_weight
+
+    #mk sumTemperature for every day at once, Uses t0=0 and not t0
+    sumTemperature = getSumTemperatureSeries(forcing, 0.55)
+    #mk mean Ten Days Temperature for every day at once
+    meanTenDaysTemperature = getMeanTenDaysTemperatureSeries(forcing, state.temperatures)
 
     # daily loop
     for i in range(startdoy, enddoy, 1):
+        # row of the day in the outputs
+        k = i - startdoy
         #######################################################
         # Load additional input arrays into variables
         #######################################################
-        # arr[0][0] = DOY[0] = 1
-        # arr[0][1] = Temperature[0] = -0.84125
-        temperature = weather[i-1][1]
-        # mean Ten Days Temperature 
-        if (i < 10):
-            listA = [weather[i-j][1] for j in range(1,10,1)]
-            meanTenDaysT = np.mean(listA)
-            #print(i,listA,meanTenDaysT)
-        else:
-            listA = [weather[i-j][1] for j in range(10,1,-1)]
-            meanTenDaysT = np.mean(listA)
-            #print(i,listA,meanTenDaysT)
-        
-        # arr[0][2] = PARi[0] = 2.22092475
-        pari = weather[i-1][2]
-        #print("PARi = %.2f" % (pari))
-        # arr[0][3] = PP[0] = 0.119
-        pmm = weather[i-1][3]
-        # arr[0][4] = PET[0] = 0.602689848
-        pet = weather[i-1][4]
-        # arr[0][5] = ETA[0] = 0.4 [RS data, optional]
-        eta = weather[i-1][5]
-        # arr[0][6] = LAI[0] = 0.02 [RS data, optional]
-        lai = weather[i-1][6]
-        # arr[0][7] = gcut_height[0] = 0.0 [default is 0.05 if cut]
-        cutHeight = weather[i-1][7]
-        # arr[0][8] = grazing_animal_count[0] = 0 [default is 1 for test ]
-        grazing_animal_count = weather[i-1][8]
-        # arr[0][9] = grazing_avg_animal_weight[0] = 0 [ default is 400 for cow ]
-        grazing_avg_animal_weight = weather[i-1][9]
+        # Temperature[0] = -0.84125
+        temperature = w_temperature[i-1]
+        # mean Ten Days Temperature
+        meanTenDaysT = meanTenDaysTemperature[i]
+
+        # PARi[0] = 2.22092475
+        pari = w_pari[i-1]
+        # PP[0] = 0.119
+        pmm = w_pp[i-1]
+        # PET[0] = 0.602689848
+        pet = w_pet[i-1]
+        # eta[0] = 0.4 [RS data, optional]
+        eta = w_eta[i-1]
+        # lai[0] = 0.02 [RS data, optional]
+        lai = w_lai[i-1]
+        # gcut_height[0] = 0.0 [default is 0.05 if cut]
+        cutHeight = w_cutHeight[i-1]
+        # grazing_animal_count[0] = 0 [default is 1 for test ]
+        grazing_animal_count = w_animal_count[i-1]
+        # grazing_avg_animal_weight[0] = 0 [ default is 400 for cow ]
+        grazing_avg_animal_weight = w_animal_weight[i-1]
         #######################################################
         # Prepare additional variables
         #######################################################
-        #mk sumTemperature Uses t0=0 and not t0
-        sumT = getSumTemperature(weather, i, 0.55)
-        # fSEA array for graphs
-        sea.append(fsea(maxsea, minsea, sumT, st2, st1))
-        # fTemperature the array for graphs
-        ftm.append(fTemperature(meanTenDaysT, t0, t1, t2, sumT))
+        sumT = sumTemperature[i]
+        # fSEA, for graphs and growth
+        sea = fsea(maxsea, minsea, sumT, st2, st1)
+        # fTemperature, for graphs and growth
+        ftm = fTemperature(meanTenDaysT, t0, t1, t2, sumT)
 
         # Grass cut flag modification if weather file has grass cut for that day
         if(cutHeight != 0.0):
@@ -340,7 +304,8 @@ def modvege(params, weather, startdoy, enddoy):
                 # Change status flag
                 isCut = True
                 # The Holy Grail: The Holy Hand Grenade: "Thou Shalst be warry of this henceforth wicked rabbit !"
-                isGrazed, ingestedBiomassPart = defoliation(gv_biomass, dv_biomass, gr_biomass, dr_biomass, cutHeight, rhogv, rhodv, rhogr, rhodr, maxAmountToIngest, isGrazed)
+                maxAmountToIngest = getMaxAmountToIngest(grazing_animal_count, grazing_avg_animal_weight, cellSurface)
+                ingestedBiomassPart = defoliation(gv_biomass, dv_biomass, gr_biomass, dr_biomass, cutHeight, rhogv, rhodv, rhogr, rhodr, maxAmountToIngest)
             # Allocation to reproductive
             a2r = rep(ni)
             #TODO When to change NI, and by how much?
@@ -365,20 +330,16 @@ def modvege(params, weather, startdoy, enddoy):
         if(a2rFlag):
             a2r = 0
 
-        atr.append(a2r)
-        # Compute biomass growth
-        env.append(mk_env(meanTenDaysT,t0,t1,t2,sumT,ni,pari,alphapar,pet,waterReserve,waterHoldingCapacity))
-        pgr.append(pgro(pari,ruemax,pctlam,sla,gv_biomass,lai))
-        gro = mk_env(meanTenDaysT,t0,t1,t2,sumT,ni,pari,alphapar,pet,waterReserve,waterHoldingCapacity) \
-                * pgro(pari,ruemax,pctlam,sla,gv_biomass,lai) \
-                * fsea(maxsea, minsea, sumT, st2, st1) \
-                * correctiveFactorForAn
-        #egro = mk_env(meanTenDaysT,t0,t1,t2,sumT,ni,pari,alphapar,pet,waterReserve,waterHoldingCapacity)
-        #ggro = pgro(pari,ruemax,pctlam,sla,gv_biomass,lai)
-        #sgro = fsea(maxsea, minsea, sumT, st2, st1)
-        #cgro = correctiveFactorForAn
-        #gro = egro * ggro * sgro * cgro
-        #print(gro,egro,ggro,sgro,cgro)
+        # Compute biomass growth, every factor evaluated once for the day
+        if(ftm == 0 and not recordPGRO):
+            # No growth on that day, PGRO is only computed for its output
+            env = 0.0
+            pgr = 0.0
+        else:
+            # ENV as mk_env() does, from the fTemperature of the day
+            env = ftm * ni * fPARi(pari, alphapar) * fWaterStress(waterReserve, waterHoldingCapacity, pet)
+            pgr = pgro(pari,ruemax,pctlam,sla,gv_biomass,lai)
+        gro = env * pgr * sea * correctiveFactorForAn
 
         #Update the state of the Vegetative parts 
         # Used t0 = 0 instead of t0 to match output data !
@@ -396,24 +357,21 @@ def modvege(params, weather, startdoy, enddoy):
         ############################################################################################
         # The model stops here really
         ############################################################################################
-        # Accumulate harvestedBiomass
+        # Accumulate harvestedBiomass, from the available biomass for cut of the previous day
         if(isCut):
-            harvestedBiomass += abc[-1]
+            harvestedBiomass += previousAvBiom4cut
+        previousAvBiom4cut = avBiom4cut
         # Accumulate ingestedBiomass
         ingestedBiomass += ingestedBiomassPart
         # Recover output streams
-        gvb.append(gv_biomass)
-        dvb.append(dv_biomass)
-        grb.append(gr_biomass)
-        drb.append(dr_biomass)
-        hb.append(harvestedBiomass)
-        ib.append(ingestedBiomass)
-        g.append(gro)
-        abc.append(avBiom4cut)
-        stp.append(sumT)
-        gva.append(gv_avg_age)
-        gra.append(gr_avg_age)
-        dva.append(dv_avg_age)
-        dra.append(dr_avg_age)
+        out.record(k, (gv_biomass, dv_biomass, gr_biomass, dr_biomass, harvestedBiomass, ingestedBiomass, gro, avBiom4cut, sumT, gv_avg_age, gr_avg_age, dv_avg_age, dr_avg_age, sea, ftm, env, pgr, a2r))
 
-    return(gvb,dvb,grb,drb,hb,ib,g,abc,stp,gva,gra,dva,dra,sea,ftm,env,pgr,atr)
+    # Export the state after the last day
+    state.update(gv_biomass=gv_biomass, dv_biomass=dv_biomass, gr_biomass=gr_biomass, dr_biomass=dr_biomass,
+                 gv_avg_age=gv_avg_age, gr_avg_age=gr_avg_age, dv_avg_age=dv_avg_age, dr_avg_age=dr_avg_age,
+                 waterReserve=waterReserve, ni=ni, isCut=isCut, a2rFlag=a2rFlag, harvested_biomass=harvestedBiomass,
+                 ingested_biomass=ingestedBiomass, previousAvBiom4cut=previousAvBiom4cut)
+    if(sink is not None):
+        out.close(ndays)
+        return(sink)
+    return(out)
@@ -0,0 +1,247 @@
+#!/usr/bin env python3
+
+# Mod Vege regression and benchmark suite, headless
+#   python modvege_bench.py [--output results.json] [--cells 1 1000 100000]
+# The regression part runs weather.csv and weather_with_RS.csv and checks
+# every output of every engine against the golden outputs of the baseline
+# model (GOLDEN), within GOLDEN_RTOL, and the fastforward of modvege_vec()
+# against its daily loop, within FASTFORWARD_RTOL. The agreement with
+# out_cut.csv is checked loosely, the NRMSE of every column within
+# REFERENCE_NRMSE, so a drift away from the reference fails. The benchmark part times cell-years for every engine
+# available. The results are written as JSON, the exit status is 1 when a
+# regression check fails.
+
+import sys
+import time
+import json
+import platform
+import argparse
+import numpy as np
+
+from modvege import modvege
+from modvege_vec import modvege_vec, FASTFORWARD_RTOL
+from modvege_calibration import read_reference, fit_statistics
+from lib_modvege_numba import HAVE_NUMBA
+from lib_params import ModvegeParams
+from lib_output import OUTPUT_VARIABLES
+from lib_read_input_files import read_params, read_forcing
+
+# Golden outputs of a year of the baseline model, per weather file, one column per output variable
+GOLDEN = {
+    'weather.csv': 'golden_weather.csv',
+    'weather_with_RS.csv': 'golden_weather_with_RS.csv',
+}
+
+# Largest relative deviation of an engine from the golden outputs (an output is scaled by its largest value)
+GOLDEN_RTOL = 1e-9
+
+# Largest NRMSE (RMSE / standard deviation of the reference) of a year against out_cut.csv, per weather file
+# and column. The model is not the one that wrote out_cut.csv: these are about 1.5 times the NRMSE of the
+# current code, loose enough for rounding changes, tight enough to catch a drift of the biology.
+REFERENCE_NRMSE = {
+    'weather.csv': {
+        'gv_biomass': 0.2,
+        'gr_biomass': 0.06,
+        'dv_biomass': 0.42,
+        'dr_biomass': 0.06,
+        'harvested_biomass': 0.005,
+        'gro': 0.13,
+        'available_biomass_for_cut': 0.12,
+    },
+    'weather_with_RS.csv': {
+        'gv_biomass': 1.3,
+        'gr_biomass': 0.27,
+        'dv_biomass': 1.9,
+        'dr_biomass': 0.09,
+        'harvested_biomass': 0.63,
+        'gro': 1.1,
+        'available_biomass_for_cut': 1.1,
+    },
+}
+
+# Outputs recorded by the grid benchmarks (all 18 of 100k cells would not fit in memory)
+BENCH_OUTPUTS = ('gv_biomass', 'harvested_biomass')
+
+# The scalar python engine is only timed up to this number of cells
+MAX_SCALAR_CELLS = 1000
+
+def available_engines():
+    """
+    Engines that can run here: 'python' (modvege()), 'vec' (modvege_vec()) and 'numba' if installed
+    """
+    engines = ['python', 'vec']
+    if HAVE_NUMBA:
+        engines.append('numba')
+    return(engines)
+
+def _run(engine, params, forcing, startdoy, enddoy, outputs=None):
+    """
+    Run a year with an engine of available_engines()
+    """
+    if engine == 'python':
+        return(modvege(params, forcing, startdoy, enddoy, outputs=outputs))
+    if engine == 'vec':
+        return(modvege_vec(params, forcing, startdoy, enddoy, outputs=outputs))
+    return(modvege_vec(params, forcing, startdoy, enddoy, outputs=outputs, engine=engine))
+
+def read_golden(golden_csv):
+    """
+    Read golden outputs
+
+    :param golden_csv: the golden output file, a day column then one column per output variable
+    :return dictionary of output name: (ndays,) series, and the first day
+    """
+    arr = np.genfromtxt(golden_csv, delimiter=',', names=True)
+    return(dict((name, np.asarray(arr[name], dtype=np.float64)) for name in OUTPUT_VARIABLES), int(arr['day'][0]))
+
+def write_golden(golden_csv, params_csv='params.csv', weather='weather.csv', startdoy=1, enddoy=365):
+    """
+    Write the outputs of a year of the python engine as golden outputs, when a model change is intended
+
+    :param golden_csv: the golden output file written
+    :param params_csv: the input parameters file
+    :param weather: the weather file
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    """
+    out = modvege(read_params(params_csv), read_forcing(weather), startdoy, enddoy)
+    data = np.column_stack([np.arange(startdoy, enddoy)] + [out[name] for name in OUTPUT_VARIABLES])
+    np.savetxt(golden_csv, data, delimiter=',', fmt='%.17g', header=','.join(('day',) + OUTPUT_VARIABLES), comments='')
+
+def _relative_error(out, base):
+    """
+    Largest deviation of a series from another, relative to the largest value of the other (at least 1)
+    """
+    return(float(np.max(np.abs(out - base))) / max(float(np.max(np.abs(base))), 1.0))
+
+def regression(params_csv='params.csv', weathers=tuple(GOLDEN), engines=None, startdoy=1, enddoy=365):
+    """
+    Check the outputs of a year of every engine against the golden outputs, and of the fastforward against the daily loop
+
+    :param params_csv: the input parameters file
+    :param weathers: the weather files, keys of GOLDEN
+    :param engines: the engines checked, default is available_engines()
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :return list of one dictionary per check (check, weather, engine, column, error, tolerance, passed)
+    """
+    if engines is None:
+        engines = available_engines()
+    params = read_params(params_csv)
+    results = []
+    for weather in weathers:
+        forcing = read_forcing(weather)
+        golden, firstday = read_golden(GOLDEN[weather])
+        days = slice(startdoy - firstday, enddoy - firstday)
+        for engine in engines:
+            out = _run(engine, params, forcing, startdoy, enddoy)
+            for column in OUTPUT_VARIABLES:
+                error = _relative_error(out[column], golden[column][days])
+                results.append({'check': 'golden', 'weather': weather, 'engine': engine, 'column': column,
+                                'error': error, 'tolerance': GOLDEN_RTOL, 'passed': error <= GOLDEN_RTOL})
+        daily = modvege_vec(params, forcing, startdoy, enddoy)
+        out = modvege_vec(params, forcing, startdoy, enddoy, fastforward=True)
+        for column in OUTPUT_VARIABLES:
+            error = _relative_error(out[column], daily[column])
+            results.append({'check': 'fastforward', 'weather': weather, 'engine': 'vec', 'column': column,
+                            'error': error, 'tolerance': FASTFORWARD_RTOL, 'passed': error <= FASTFORWARD_RTOL})
+    return(results)
+
+def reference(params_csv='params.csv', out_csv='out_cut.csv', weathers=tuple(REFERENCE_NRMSE), startdoy=1, enddoy=365):
+    """
+    Check the outputs of a year against out_cut.csv, the NRMSE of every column within REFERENCE_NRMSE
+
+    :param params_csv: the input parameters file
+    :param out_csv: the reference output file
+    :param weathers: the weather files, keys of REFERENCE_NRMSE
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :return list of one dictionary per check (check, weather, engine, column, error (the NRMSE), tolerance, passed, max_deviation (kg DM/ha))
+    """
+    params = read_params(params_csv)
+    series = read_reference(out_csv, startdoy, enddoy)
+    results = []
+    for weather in weathers:
+        out = modvege(params, read_forcing(weather), startdoy, enddoy)
+        for column, tolerance in REFERENCE_NRMSE[weather].items():
+            error = float(fit_statistics(out[column], series[column])['nrmse'])
+            results.append({'check': 'reference', 'weather': weather, 'engine': 'python', 'column': column,
+                            'error': error, 'tolerance': tolerance, 'passed': error <= tolerance,
+                            'max_deviation': float(np.max(np.abs(out[column] - series[column])))})
+    return(results)
+
+def benchmark(params_csv='params.csv', weather='weather.csv', cells=(1, 1000, 100000), engines=None, repeat=3, startdoy=1, enddoy=365):
+    """
+    Time cell-years with every engine
+
+    The cells share the weather and have their own (here identical) row of parameters.
+
+    :param params_csv: the input parameters file
+    :param weather: the weather file
+    :param cells: numbers of cells of the cases
+    :param engines: the engines timed, default is available_engines()
+    :param repeat: number of runs of a case, the best time is kept (a single run above 10k cells)
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :return list of one dictionary per case (engine, cells, seconds, cell_years_per_second), seconds is None when skipped
+    """
+    if engines is None:
+        engines = available_engines()
+    params = ModvegeParams(read_params(params_csv))
+    forcing = read_forcing(weather)
+    results = []
+    for engine in engines:
+        if engine == 'numba':
+            # compile (or load from the cache) out of the timings
+            _run(engine, params, forcing, startdoy, enddoy)
+        for ncells in cells:
+            if engine == 'python' and ncells > MAX_SCALAR_CELLS:
+                results.append({'engine': engine, 'cells': ncells, 'seconds': None, 'cell_years_per_second': None})
+                continue
+            grid = params if ncells == 1 else ModvegeParams(np.tile(params.values, (ncells, 1)))
+            times = []
+            for r in range(repeat if ncells <= 10000 else 1):
+                start = time.perf_counter()
+                if engine == 'python':
+                    for c in range(ncells):
+                        _run(engine, params, forcing, startdoy, enddoy, BENCH_OUTPUTS)
+                else:
+                    _run(engine, grid, forcing, startdoy, enddoy, BENCH_OUTPUTS)
+                times.append(time.perf_counter() - start)
+            seconds = min(times)
+            results.append({'engine': engine, 'cells': ncells, 'seconds': seconds, 'cell_years_per_second': ncells / seconds})
+    return(results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mod Vege regression and benchmark suite")
+    parser.add_argument('--params', default='params.csv', help="input parameters file")
+    parser.add_argument('--out', default='out_cut.csv', help="reference output file")
+    parser.add_argument('--engines', nargs='+', choices=['python', 'vec', 'numba'], help="engines, default is all available")
+    parser.add_argument('--cells', nargs='+', type=int, default=[1, 1000, 100000], help="numbers of cells benchmarked")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark case")
+    parser.add_argument('--no-bench', action='store_true', help="only run the regression checks")
+    parser.add_argument('--output', help="JSON file of the results, default is stdout")
+    args = parser.parse_args(argv)
+
+    engines = args.engines if args.engines else available_engines()
+    checks = regression(args.params, engines=engines) + reference(args.params, args.out)
+    results = {
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform()},
+        'passed': all(check['passed'] for check in checks),
+        'regression': checks,
+    }
+    if not args.no_bench:
+        results['benchmark'] = benchmark(args.params, cells=args.cells, engines=engines, repeat=args.repeat)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    for check in checks:
+        if not check['passed']:
+            print("FAILED %(check)s %(weather)s %(engine)s %(column)s: %(error).6g > %(tolerance)g" % check, file=sys.stderr)
+    return(0 if results['passed'] else 1)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin env python3
+
+# Mod Vege result cache: the outputs of a run are stored on disk under a key
+# hashing everything they depend on (the parameter values, the forcing
+# arrays, the days, the outputs asked for, the runner and its engine), so a
+# run repeated by a later job is read back instead of simulated again.
+#
+# An entry is a compressed .npz file (the output data, its variables and first
+# day) named after its key, in a sub-directory per model version. The version
+# is MODEL_VERSION and a digest of the source of the model (MODEL_SOURCES):
+# editing the model changes it, and the entries of the other versions are
+# never read again (invalidate() removes them). The cache is bounded in size:
+# once it is above max_bytes the least recently used entries are removed, a
+# hit touching its entry.
+
+import os
+import hashlib
+import numpy as np
+
+from modvege import modvege
+from modvege_vec import modvege_vec
+from modvege_grid import run_grid
+from lib_forcing import FORCING_COLUMNS, to_forcing
+from lib_output import ModvegeOutput
+from lib_params import to_params
+from lib_scenario import MANAGEMENT_COLUMNS
+from lib_read_input_files import read_weather_store
+
+#Define MODEL_VERSION to be increased when the model changes outside of MODEL_SOURCES
+MODEL_VERSION = 1
+#Define MODEL_SOURCES modules whose source is part of the model version
+MODEL_SOURCES = ('lib_modvege.py', 'lib_modvege_vec.py', 'lib_modvege_numba.py', 'lib_state.py', 'lib_params.py', 'lib_scenario.py',
+                 'lib_forcing.py', 'lib_output.py', 'lib_read_input_files.py', 'modvege.py', 'modvege_vec.py', 'modvege_grid.py')
+#Define DEFAULT_CACHE_SIZE 1 GB
+DEFAULT_CACHE_SIZE = 1 << 30
+
+# The runners a cache can wrap, by name (the name is part of the key)
+CACHED_RUNNERS = {'modvege': modvege, 'modvege_vec': modvege_vec, 'run_grid': run_grid}
+# The other arguments of every runner, that do not change their outputs
+UNKEYED_ARGUMENTS = {'modvege': ('verbose',), 'modvege_vec': (), 'run_grid': ('chunksize', 'max_workers')}
+
+def model_version():
+    """
+    Version of the model the entries are made with: MODEL_VERSION and a digest of MODEL_SOURCES
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in MODEL_SOURCES:
+        with open(os.path.join(here, name), 'rb') as fp:
+            digest.update(fp.read())
+    return("v%d-%s" % (MODEL_VERSION, digest.hexdigest()))
+
+def _hash_array(digest, arr):
+    """
+    Add the shape and the float64 values of an array to a digest
+    """
+    arr = np.ascontiguousarray(arr, dtype='<f8')
+    digest.update(repr(arr.shape).encode())
+    digest.update(memoryview(arr).cast('B'))
+
+def run_key(runner, params, weather, startdoy, enddoy, outputs=None, engine='python', management=None, fastforward=False):
+    """
+    Key of a run: the hash of everything its outputs depend on
+
+    :param runner: name of the runner (CACHED_RUNNERS)
+    :param params: ModvegeParams or array
+    :param weather: Forcing or read_weather() array, or the directory of a binary weather store
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param outputs: names of the variables recorded
+    :param engine: 'python', 'numba' or 'auto'
+    :param management: lib_scenario.Management of the run, if any
+    :param fastforward: the fastforward flag of modvege_vec()
+    :return the hexadecimal key
+    """
+    forcing = read_weather_store(weather) if isinstance(weather, str) else to_forcing(weather)
+    variables = ModvegeOutput(0, variables=outputs).variables
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((runner, startdoy, enddoy, variables, engine, bool(fastforward), management is not None)).encode())
+    _hash_array(digest, to_params(params).values)
+    for name in FORCING_COLUMNS:
+        _hash_array(digest, forcing[name])
+    if management is not None:
+        for name in MANAGEMENT_COLUMNS:
+            _hash_array(digest, management[name])
+    return(digest.hexdigest())
+
+class ResultCache:
+    """
+    On-disk cache of the outputs of runs, bounded in size, least recently used entries evicted first
+    """
+    __slots__ = ('directory', 'max_bytes', 'version', 'hits', 'misses', 'evictions')
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_SIZE, version=None):
+        """
+        :param directory: the directory of the cache, shared by the jobs using it
+        :param max_bytes: size of the entries kept (bytes)
+        :param version: version of the model the entries are read and written for, default is model_version()
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = model_version() if version is None else version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.join(directory, self.version), exist_ok=True)
+
+    def _path(self, key):
+        return(os.path.join(self.directory, self.version, key + '.npz'))
+
+    def _entries(self):
+        """
+        List of (last use, size, path) of the entries of all versions
+        """
+        entries = []
+        for version in os.scandir(self.directory):
+            if not version.is_dir():
+                continue
+            for entry in os.scandir(version.path):
+                if entry.name.endswith('.npz'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return(entries)
+
+    def get(self, key):
+        """
+        Read an entry
+
+        :param key: the run_key() of the run
+        :return the ModvegeOutput, or None when it is not in the cache
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                out = ModvegeOutput(0, variables=[str(name) for name in npz['variables']], startdoy=int(npz['startdoy']))
+                out.data = npz['data']
+        except (OSError, ValueError, KeyError):
+            # missing, or removed or truncated by another job
+            self.misses += 1
+            return(None)
+        try:
+            # the modification time is the last use
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return(out)
+
+    def put(self, key, output):
+        """
+        Write an entry (atomically), then evict the least recently used ones above max_bytes
+
+        :param key: the run_key() of the run
+        :param output: the ModvegeOutput of the run
+        """
+        path = self._path(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as fp:
+            np.savez_compressed(fp, data=output.data, variables=np.array(output.variables), startdoy=output.startdoy)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self, max_bytes=None):
+        """
+        Remove the least recently used entries until the cache holds at most max_bytes
+
+        :param max_bytes: size to shrink to, default is the max_bytes of the cache
+        :return the number of entries removed
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for mtime, nbytes, path in entries:
+            if size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # already removed by another job
+                pass
+            size -= nbytes
+            removed += 1
+        self.evictions += removed
+        return(removed)
+
+    def invalidate(self, all=False):
+        """
+        Remove the entries of the other model versions (a model change), or of all versions
+
+        :param all: also remove the entries of this version
+        :return the number of entries removed
+        """
+        removed = 0
+        for mtime, nbytes, path in self._entries():
+            if all or os.path.basename(os.path.dirname(path)) != self.version:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return(removed)
+
+    def stats(self):
+        """
+        Statistics of the cache
+
+        :return dictionary of hits, misses, hit_rate, evictions (of this object), entries and bytes (on disk)
+        """
+        entries = self._entries()
+        requests = self.hits + self.misses
+        return({'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / requests if requests else 0.0,
+                'evictions': self.evictions, 'entries': len(entries), 'bytes': sum(entry[1] for entry in entries)})
+
+def cached_run(cache, params, weather, startdoy, enddoy, outputs=None, engine='python', runner='modvege', bypass=False, refresh=False, **kwargs):
+    """
+    **Mod Vege** run through a ResultCache: read back when the same run was cached, otherwise run and cached
+
+    Runs that start from a state or stream to a sink are not cached (their outputs are not
+    a function of the key), run them directly. The management and fastforward arguments of
+    modvege_vec are part of the key, any other argument must be one of the UNKEYED_ARGUMENTS of the runner.
+
+    :param cache: the ResultCache, None runs without cache
+    :param params: ModvegeParams or array
+    :param weather: Forcing or read_weather() array (or the directory of a binary weather store for run_grid)
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python', 'numba' or 'auto'
+    :param runner: 'modvege', 'modvege_vec' or 'run_grid'
+    :param bypass: run without reading nor writing the cache
+    :param refresh: run and overwrite the entry of the cache
+    :param kwargs: other arguments of the runner: management and fastforward (modvege_vec), or its UNKEYED_ARGUMENTS
+    :return ModvegeOutput of the daily outputs
+    """
+    if runner not in CACHED_RUNNERS:
+        raise ValueError("Unknown runner %r, expected one of %s" % (runner, ", ".join(CACHED_RUNNERS)))
+    if kwargs.get('state') is not None or kwargs.get('sink') is not None:
+        raise ValueError("Runs from a state or to a sink are not cached")
+    keyed = ('management', 'fastforward') if runner == 'modvege_vec' else ()
+    unknown = [name for name in kwargs if name not in keyed and name not in UNKEYED_ARGUMENTS[runner]]
+    if unknown:
+        raise ValueError("Arguments %s are not accepted by %s or not part of the cache key" % (", ".join(sorted(unknown)), runner))
+    run = CACHED_RUNNERS[runner]
+    if cache is None or bypass:
+        return(run(params, weather, startdoy, enddoy, outputs=outputs, engine=engine, **kwargs))
+    key = run_key(runner, params, weather, startdoy, enddoy, outputs, engine, kwargs.get('management'), kwargs.get('fastforward', False))
+    if not refresh:
+        out = cache.get(key)
+        if out is not None:
+            return(out)
+    out = run(params, weather, startdoy, enddoy, outputs=outputs, engine=engine, **kwargs)
+    cache.put(key, out)
+    return(out)
@@ -0,0 +1,165 @@
+#!/usr/bin env python3
+
+# Mod Vege calibration: fit a subset of params.csv to reference series
+# (out_cut.csv) with differential evolution. The whole population of a
+# generation is evaluated as one ensemble run (modvege_ensemble), and the
+# loss is computed for all members at once.
+#
+# Storn, R. and Price, K., 1997. Differential evolution - a simple and
+# efficient heuristic for global optimization over continuous spaces.
+# Journal of Global Optimization, 11(4), pp.341-359.
+
+import sys
+import time
+import numpy as np
+
+from modvege_ensemble import modvege_ensemble
+from lib_forcing import to_forcing
+from lib_params import to_params, PARAM_INDEX
+from lib_read_output_files import read_out
+
+# Columns of out_cut.csv (see lib_read_output_files.py) and the output they are compared to
+REFERENCE_COLUMNS = {
+    'gv_biomass': 2,                    # Mean green vegetative biomass (kg DM/ha)
+    'gr_biomass': 3,                    # Mean green reproductive biomass (kg DM/ha)
+    'dv_biomass': 4,                    # Mean dry vegetative biomass (kg DM/ha)
+    'dr_biomass': 5,                    # Mean dry reproductive biomass (kg DM/ha)
+    'harvested_biomass': 6,             # Harvested Biomass (kg DM/ha)
+    'gro': 8,                           # Mean GRO biomass (kg DM/ha)
+    'available_biomass_for_cut': 9,     # Mean available biomass for cut (kg DM/ha)
+}
+
+def read_reference(out_csv, startdoy, enddoy):
+    """
+    Read the reference series of out_cut.csv for the days of a run
+
+    :param out_csv: the reference output file (out_cut.csv)
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :return dictionary of output name: (enddoy-startdoy,) reference series
+    """
+    arr = read_out(out_csv)
+    names = arr.dtype.names
+    day = arr[names[0]]
+    rows = [np.flatnonzero(day == doy) for doy in range(startdoy, enddoy)]
+    missing = [doy for doy, row in zip(range(startdoy, enddoy), rows) if len(row) == 0]
+    if missing:
+        raise ValueError("%s has no row for days %s" % (out_csv, missing))
+    rows = np.array([row[0] for row in rows])
+    return(dict((name, np.asarray(arr[names[j]][rows], dtype=np.float64)) for name, j in REFERENCE_COLUMNS.items()))
+
+def fit_statistics(simulated, observed):
+    """
+    Goodness of fit of simulated series, vectorized over members
+
+    :param simulated: (..., ndays) simulated series
+    :param observed: (ndays,) reference series
+    :return dictionary of rmse, nrmse (rmse / standard deviation of the reference), bias and nse (Nash-Sutcliffe efficiency)
+    """
+    error = simulated - observed
+    rmse = np.sqrt(np.mean(error ** 2, axis=-1))
+    spread = np.std(observed)
+    if spread == 0:
+        # a constant reference (no cut...), the rmse is kept in kg DM/ha
+        spread = 1.0
+    return({'rmse': rmse, 'nrmse': rmse / spread, 'bias': np.mean(error, axis=-1), 'nse': 1 - (rmse / spread) ** 2})
+
+def calibration_loss(cube, reference, variables, weights=None):
+    """
+    Loss of every member: the weighted sum over variables of their nrmse
+
+    :param cube: outputs of modvege_ensemble(), (n_members, ndays, len(variables))
+    :param reference: dictionary of output name: (ndays,) reference series
+    :param variables: the output name of every column of cube
+    :param weights: dictionary of output name: weight, default is 1
+    :return the loss, (n_members,)
+    """
+    loss = np.zeros(cube.shape[0])
+    for j, name in enumerate(variables):
+        weight = 1.0 if weights is None else weights.get(name, 1.0)
+        loss += weight * fit_statistics(cube[:, :, j], reference[name])['nrmse']
+    # a member that diverged never wins
+    return(np.where(np.isfinite(loss), loss, np.inf))
+
+def calibrate(params, weather, reference, bounds, startdoy=1, enddoy=365, variables=None, weights=None, popsize=40, generations=100, mutation=0.7, crossover=0.9, tol=1e-8, seed=None, engine='python', verbose=False, file=None):
+    """
+    Fit parameters to reference series with differential evolution (DE/rand/1/bin)
+
+    :param params: the starting parameters (the ones not in bounds are kept), ModvegeParams or array
+    :param weather: weather data of the site, Forcing or read_weather() array
+    :param reference: dictionary of output name: reference series (read_reference()), or the out_cut.csv file
+    :param bounds: dictionary of parameter name: (low, high) of the parameters fitted
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param variables: the outputs in the loss, default is all of REFERENCE_COLUMNS
+    :param weights: dictionary of output name: weight in the loss
+    :param popsize: number of members of the population
+    :param generations: maximum number of generations
+    :param mutation: differential weight F
+    :param crossover: crossover probability CR
+    :param tol: stop when the spread of the losses of the population is below tol
+    :param seed: seed of the random generator
+    :param engine: 'python', 'numba' or 'auto'
+    :param verbose: print the loss and the wall-clock time of every generation
+    :param file: where to print, default is sys.stdout
+    :return dictionary of params (best ModvegeParams), values (name: value), loss, statistics (output: fit_statistics()) and history (one (generation, best loss, mean loss, seconds) per generation)
+    """
+    params = to_params(params)
+    forcing = to_forcing(weather)
+    if isinstance(reference, str):
+        reference = read_reference(reference, startdoy, enddoy)
+    if variables is None:
+        variables = list(REFERENCE_COLUMNS)
+    unknown = [name for name in bounds if name not in PARAM_INDEX]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+    if popsize < 4:
+        raise ValueError("Differential evolution needs a population of at least 4 members")
+    if file is None:
+        file = sys.stdout
+    names = list(bounds)
+    low = np.array([bounds[name][0] for name in names], dtype=np.float64)
+    high = np.array([bounds[name][1] for name in names], dtype=np.float64)
+    rng = np.random.default_rng(seed)
+
+    def evaluate(population):
+        # one batched run for the whole population
+        members = params.replace(**dict((name, population[:, j]) for j, name in enumerate(names)))
+        cube = modvege_ensemble(members, forcing, startdoy, enddoy, outputs=variables, engine=engine)
+        return(calibration_loss(cube, reference, variables, weights))
+
+    history = []
+    start = time.perf_counter()
+    population = low + rng.random((popsize, len(names))) * (high - low)
+    loss = evaluate(population)
+    history.append((0, loss.min(), loss[np.isfinite(loss)].mean(), time.perf_counter() - start))
+    if verbose:
+        print("generation %d: best loss=%.6g mean loss=%.6g (%.3f s)" % history[-1], file=file)
+    for generation in range(1, generations + 1):
+        start = time.perf_counter()
+        # three distinct members other than the target, for every target
+        others = np.array([rng.choice(popsize - 1, 3, replace=False) for i in range(popsize)])
+        others += others >= np.arange(popsize)[:, np.newaxis]
+        mutant = population[others[:, 0]] + mutation * (population[others[:, 1]] - population[others[:, 2]])
+        mutant = np.clip(mutant, low, high)
+        cross = rng.random(population.shape) < crossover
+        cross[np.arange(popsize), rng.integers(0, len(names), popsize)] = True
+        trial = np.where(cross, mutant, population)
+        trial_loss = evaluate(trial)
+        better = trial_loss <= loss
+        population[better] = trial[better]
+        loss[better] = trial_loss[better]
+        finite = loss[np.isfinite(loss)]
+        history.append((generation, loss.min(), finite.mean(), time.perf_counter() - start))
+        if verbose:
+            print("generation %d: best loss=%.6g mean loss=%.6g (%.3f s)" % history[-1], file=file)
+        if len(finite) == popsize and finite.max() - finite.min() < tol:
+            break
+
+    best = np.argmin(loss)
+    values = dict((name, float(population[best, j])) for j, name in enumerate(names))
+    fitted = params.replace(**values)
+    cube = modvege_ensemble(fitted, forcing, startdoy, enddoy, outputs=variables, engine=engine)
+    statistics = dict((name, dict((key, float(value[0])) for key, value in fit_statistics(cube[:, :, j], reference[name]).items()))
+                      for j, name in enumerate(variables))
+    return({'params': fitted, 'values': values, 'loss': float(loss[best]), 'statistics': statistics, 'history': history})
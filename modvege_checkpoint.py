@@ -0,0 +1,174 @@
+#!/usr/bin env python3
+
+# Mod Vege checkpoint/restart: a run is cut into segments of days, the state
+# of the cells (lib_state.ModvegeState) being written into a checkpoint file
+# after every segment. A run started again with the same checkpoint file
+# resumes from the last day saved, and gives the same outputs, bit for bit,
+# as a run that was never stopped.
+#
+# The checkpoint is a small binary file: a header (magic, version, next day,
+# first and last day of the run, number of cells, shape of the temperatures,
+# CRC32 of the values) and the float64 state values, in the order of
+# lib_state.STATE_VARIABLES, followed by the temperatures of the days before
+# the first day (ModvegeState.temperatures) when the state has them. It is
+# written to a temporary file then renamed, so a crash while writing leaves
+# the previous checkpoint in place.
+
+import os
+import zlib
+import struct
+import numpy as np
+
+from modvege import modvege
+from modvege_vec import modvege_vec
+from modvege_grid import run_grid, _store_shape
+from modvege_years import _read_year
+from lib_output import ModvegeOutput
+from lib_params import to_params
+from lib_state import STATE_VARIABLES, ModvegeState, run_state
+
+CHECKPOINT_MAGIC = b'MVCKPT'
+CHECKPOINT_VERSION = 2
+# magic, version, next day, startdoy, enddoy, number of cells (-1 for a cell), number of state variables,
+# number of days of temperatures (0 for none), number of cells of the temperatures (-1 for a (days,) array), CRC32
+CHECKPOINT_HEADER = struct.Struct('<6sHqqqqIqqI')
+
+#Define DEFAULT_CHECKPOINT_DAYS 30 days between two checkpoints
+DEFAULT_CHECKPOINT_DAYS = 30
+
+def save_checkpoint(file, state, doy, startdoy, enddoy):
+    """
+    Write the state of a run into a checkpoint file, atomically
+
+    :param file: the checkpoint file
+    :param state: the ModvegeState at the start of day doy
+    :param doy: the next day to simulate
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    """
+    values = np.ascontiguousarray(state.values, dtype='<f8')
+    payload = values.tobytes()
+    ncells = -1 if state.ncells is None else state.ncells
+    tdays, tcells = 0, -1
+    if state.temperatures is not None:
+        temperatures = np.ascontiguousarray(state.temperatures, dtype='<f8')
+        tdays = temperatures.shape[0]
+        tcells = -1 if temperatures.ndim == 1 else temperatures.shape[1]
+        payload += temperatures.tobytes()
+    header = CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, doy, startdoy, enddoy, ncells,
+                                    len(STATE_VARIABLES), tdays, tcells, zlib.crc32(payload))
+    tmp = file + '.tmp'
+    with open(tmp, 'wb') as fp:
+        fp.write(header)
+        fp.write(payload)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, file)
+
+def load_checkpoint(file):
+    """
+    Read a checkpoint file written by save_checkpoint()
+
+    :param file: the checkpoint file
+    :return dictionary of state (ModvegeState), doy (the next day to simulate), startdoy and enddoy
+    """
+    with open(file, 'rb') as fp:
+        header = fp.read(CHECKPOINT_HEADER.size)
+        payload = fp.read()
+    if len(header) < CHECKPOINT_HEADER.size:
+        raise ValueError("%s is not a Mod Vege checkpoint" % (file))
+    magic, version = struct.unpack_from('<6sH', header)
+    if magic != CHECKPOINT_MAGIC:
+        raise ValueError("%s is not a Mod Vege checkpoint" % (file))
+    if version != CHECKPOINT_VERSION:
+        raise ValueError("%s is a checkpoint of version %d, expected version %d" % (file, version, CHECKPOINT_VERSION))
+    magic, version, doy, startdoy, enddoy, ncells, nvars, tdays, tcells, crc = CHECKPOINT_HEADER.unpack(header)
+    if nvars != len(STATE_VARIABLES):
+        raise ValueError("%s is a checkpoint with %d state variables, expected %d" % (file, nvars, len(STATE_VARIABLES)))
+    shape = (nvars,) if ncells < 0 else (ncells, nvars)
+    tshape = (tdays,) if tcells < 0 else (tdays, tcells)
+    nvalues = int(np.prod(shape))
+    if len(payload) != 8 * (nvalues + (int(np.prod(tshape)) if tdays else 0)) or zlib.crc32(payload) != crc:
+        raise ValueError("%s is a truncated or corrupted checkpoint" % (file))
+    arr = np.frombuffer(payload, dtype='<f8')
+    values = arr[:nvalues].reshape(shape)
+    temperatures = arr[nvalues:].reshape(tshape) if tdays else None
+    return({'state': ModvegeState(values, temperatures), 'doy': doy, 'startdoy': startdoy, 'enddoy': enddoy})
+
+def run_checkpointed(params, weather, startdoy, enddoy, checkpoint, every=DEFAULT_CHECKPOINT_DAYS, outputs=None, engine='python', sink=None, resume=True, state=None, max_workers=None, chunksize=None):
+    """
+    **Mod Vege** model with checkpoints: the state is saved every few days, and a run
+    stopped before its end is resumed from the last checkpoint when called again
+
+    The days simulated before the checkpoint are not run again: their outputs are the
+    ones written by the stopped run into sink (lib_output.NpySink(directory, resume=True)
+    keeps them), without a sink they are NaN in the returned outputs.
+
+    :param params: ModvegeParams or array, (44,) or (ncells, 44)
+    :param weather: Forcing or read_weather() array, weather csv file or binary weather store
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param checkpoint: the checkpoint file
+    :param every: number of days between two checkpoints
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python', 'numba' or 'auto'
+    :param sink: lib_output.OutputSink the outputs are written to, a segment at a time
+    :param resume: start from checkpoint when it exists, otherwise it is overwritten
+    :param state: lib_state.ModvegeState to start from when not resuming (default is the initial values of params)
+    :param max_workers: run the segments over a pool of processes (modvege_grid.run_grid())
+    :param chunksize: number of cells of a task of the pool
+    :return ModvegeOutput of the daily outputs, or sink
+    """
+    if every < 1:
+        raise ValueError("Checkpoints must be at least a day apart, got every=%r" % (every))
+    params = to_params(params)
+    if max_workers is not None and isinstance(weather, str) and os.path.isdir(weather):
+        # the workers read the store, only its shape is needed here
+        store_shape = _store_shape(weather)
+        weather_cells = store_shape[:1] if len(store_shape) == 2 else ()
+    else:
+        weather = _read_year(weather)
+        weather_cells = weather.shape[1:]
+    shape = np.broadcast_shapes(params.values.shape[:-1], weather_cells)
+
+    doy = startdoy
+    if resume and os.path.exists(checkpoint):
+        saved = load_checkpoint(checkpoint)
+        if (saved['startdoy'], saved['enddoy']) != (startdoy, enddoy):
+            raise ValueError("%s is the checkpoint of a run of days %d-%d, not %d-%d" % (checkpoint, saved['startdoy'], saved['enddoy'], startdoy, enddoy))
+        state = run_state(saved['state'], params, shape)
+        doy = saved['doy']
+    else:
+        state = run_state(state, params, shape)
+
+    ndays = max(0, enddoy - startdoy)
+    if sink is None:
+        out = ModvegeOutput(ndays, shape, variables=outputs, startdoy=startdoy)
+        out.data[:doy - startdoy] = np.nan
+        variables = out.variables
+    else:
+        out = None
+        variables = ModvegeOutput(0, variables=outputs).variables
+        sink.open(variables, shape, startdoy, ndays)
+
+    while doy < enddoy:
+        last = min(doy + every, enddoy)
+        if max_workers is not None and shape:
+            kwargs = {} if chunksize is None else {'chunksize': chunksize}
+            segment = run_grid(params, weather, doy, last, outputs=variables, engine=engine, max_workers=max_workers, state=state, **kwargs)
+        elif shape:
+            segment = modvege_vec(params, weather, doy, last, outputs=variables, engine=engine, state=state)
+        else:
+            segment = modvege(params, weather, doy, last, outputs=variables, engine=engine, state=state)
+        if out is not None:
+            out.data[doy - startdoy:last - startdoy] = segment.data
+        else:
+            sink.write(doy, segment.data)
+        # the outputs of the segment are written before the checkpoint that skips it
+        save_checkpoint(checkpoint, state, last, startdoy, enddoy)
+        doy = last
+
+    if out is None:
+        sink.close()
+        return(sink)
+    return(out)
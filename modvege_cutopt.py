@@ -0,0 +1,210 @@
+#!/usr/bin env python3
+
+# Mod Vege cut-date optimizer: the cut calendar (days and heights) that
+# maximizes the digestible harvest, the biomass taken from every compartment
+# weighted by its organic matter digestibility (getOMDgv(), getOMDgr(), and
+# meanOMDdv/meanOMDdr for the dead compartments), with a minimum gap between
+# two cuts. Cuts are only searched on the days modvege() can cut, when
+# st1 < sumT < st2.
+#
+# Dynamic programming over the number of cuts: the schedules of k cuts are
+# extended by a (k+1)th cut on every later day allowed and at every height,
+# and of the schedules whose last cut is on the same day at the same height
+# only the best one is kept (the state after a cut depends mostly on the
+# cut). The schedules of a level are swept together day by day, as the cells
+# of one modvege_vec() run: the ones that do not cut on the day, and one child
+# per height for the ones that may cut, so every candidate day is evaluated
+# from the state snapshot of its parent without running the season again.
+
+import numpy as np
+
+from modvege_vec import modvege_vec
+from lib_forcing import to_forcing
+from lib_modvege import getSumTemperatureSeries
+from lib_modvege_vec import exeCut, getOMDgv, getOMDgr
+from lib_params import to_params
+from lib_scenario import Management
+from lib_state import ModvegeState, STATE_INDEX
+
+#Define DEFAULT_CUT_HEIGHTS cut heights searched (m)
+DEFAULT_CUT_HEIGHTS = (0.05,)
+
+def cut_window(params, weather, startdoy=1, enddoy=365):
+    """
+    Days a cut can happen, when st1 < sumT < st2 (modvege() ignores the cuts of the other days)
+
+    :param params: ModvegeParams or array of 44 values
+    :param weather: Forcing or read_weather() array, (ndays,)
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :return the days, an array
+    """
+    params = to_params(params)
+    sumT = getSumTemperatureSeries(to_forcing(weather), 0.55)
+    days = np.arange(startdoy, enddoy)
+    return(days[(sumT[days] > params.ST1) & (sumT[days] < params.ST2)])
+
+def digestible_harvest(params, biomass, ages, height):
+    """
+    Digestible biomass taken by a cut
+
+    :param params: ModvegeParams of the cells
+    :param biomass: (gv, dv, gr, dr) biomass before the cut (kg DM ha-1), floats or arrays over cells
+    :param ages: (gv, dv, gr, dr) average ages before the cut (degreeday)
+    :param height: the cut height (m)
+    :return the digestible biomass (kg DM ha-1) and the biomass (kg DM ha-1) taken
+    """
+    gv, dv, gr, dr = biomass
+    gv_h = exeCut(height, params.rho_GV, gv)[0]
+    dv_h = exeCut(height, params.rho_DV, dv)[0]
+    gr_h = exeCut(height, params.rho_GR, gr)[0]
+    dr_h = exeCut(height, params.rho_DR, dr)[0]
+    omdgv = getOMDgv(params.minOMDgv, params.maxOMDgv, ages[0], params.LLS)
+    omdgr = getOMDgr(params.minOMDgr, params.maxOMDgr, ages[2], params.ST1, params.ST2)
+    digestible = gv_h * omdgv + dv_h * params.meanOMDdv + gr_h * omdgr + dr_h * params.meanOMDdr
+    return(digestible, gv_h + dv_h + gr_h + dr_h)
+
+def schedule_value(params, output, schedule):
+    """
+    Digestible harvest of a cut schedule, from the outputs of a run with it
+
+    :param params: ModvegeParams or array of 44 values
+    :param output: ModvegeOutput of the run (with the biomass and ages outputs), from before the first cut
+    :param schedule: list of (day, cut height)
+    :return the digestible biomass (kg DM ha-1) and the biomass (kg DM ha-1) taken by the cuts
+    """
+    params = to_params(params)
+    digestible = harvested = 0.0
+    for day, height in schedule:
+        # the cut takes the biomass of the end of the day before
+        k = day - 1 - output.startdoy
+        biomass = [output[name][k] for name in ('gv_biomass', 'dv_biomass', 'gr_biomass', 'dr_biomass')]
+        ages = [output[name][k] for name in ('gv_avg_age', 'dv_avg_age', 'gr_avg_age', 'dr_avg_age')]
+        d, h = digestible_harvest(params, biomass, ages, height)
+        digestible += float(d)
+        harvested += float(h)
+    return(digestible, harvested)
+
+def _state_value(params, values, height):
+    """
+    digestible_harvest() of states, (n, 15)
+    """
+    biomass = [values[:, STATE_INDEX[name]] for name in ('gv_biomass', 'dv_biomass', 'gr_biomass', 'dr_biomass')]
+    ages = [values[:, STATE_INDEX[name]] for name in ('gv_avg_age', 'dv_avg_age', 'gr_avg_age', 'dr_avg_age')]
+    return(digestible_harvest(params, biomass, ages, height))
+
+def optimize_cuts(params, weather, heights=DEFAULT_CUT_HEIGHTS, min_gap=30, max_cuts=4, startdoy=1, enddoy=365, step=1, engine='python'):
+    """
+    Search the cut calendar of a parcel that maximizes the digestible harvest
+
+    The grazing of the weather is kept, its cuts are replaced by the ones searched.
+
+    :param params: ModvegeParams or array of 44 values
+    :param weather: weather data of the parcel, Forcing or read_weather() array, (ndays,)
+    :param heights: cut heights searched (m)
+    :param min_gap: minimum number of days between two cuts
+    :param max_cuts: maximum number of cuts
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param step: only every step-th day of the cut window is a candidate
+    :param engine: 'python', 'numba' or 'auto'
+    :return dictionary of schedule (list of (day, height)), value (digestible kg DM ha-1), harvested (kg DM ha-1 taken by the cuts) and evaluated (candidate cuts evaluated)
+    """
+    params = to_params(params)
+    forcing = to_forcing(weather)
+    if len(forcing.shape) != 1 or params.values.ndim != 1:
+        raise ValueError("optimize_cuts() optimizes a single parcel, see optimize_parcels()")
+    if min_gap < 1:
+        raise ValueError("The gap between two cuts must be at least a day, got min_gap=%r" % (min_gap))
+    window = cut_window(params, forcing, startdoy, enddoy)[::step]
+    best = {'schedule': [], 'value': 0.0, 'harvested': 0.0, 'evaluated': 0}
+    if len(window) == 0:
+        return(best)
+    candidates = set(window.tolist())
+    lastday = int(window[-1])
+    ndays = len(forcing)
+    grazing = [forcing.grazing_animal_count, forcing.grazing_avg_animal_weight]
+
+    def advance(values, cutHeights, day):
+        # run a day for every row of values (updated in place), each one cut at its height (0 is no cut)
+        n = len(values)
+        columns = {'gcut_height': np.zeros((ndays, n)), 'grazing_animal_count': np.zeros((ndays, n)), 'grazing_avg_animal_weight': np.zeros((ndays, n))}
+        # only the row of the day is read
+        columns['gcut_height'][day - 1] = cutHeights
+        columns['grazing_animal_count'][day - 1] = grazing[0][day - 1]
+        columns['grazing_avg_animal_weight'][day - 1] = grazing[1][day - 1]
+        state = ModvegeState(values)
+        modvege_vec(params, forcing, day, day + 1, outputs=('gv_biomass',), engine=engine, state=state, management=Management(columns))
+        return(state.values)
+
+    # the season without cuts up to the first candidate day
+    state = ModvegeState.from_params(params)
+    first = int(window[0])
+    if first > startdoy:
+        columns = {'gcut_height': np.zeros(ndays), 'grazing_animal_count': grazing[0], 'grazing_avg_animal_weight': grazing[1]}
+        modvege_vec(params, forcing, startdoy, first, outputs=('gv_biomass',), engine=engine, state=state, management=Management(columns))
+    # a schedule: (value, harvested, cuts, state at the start of day, day)
+    parents = [(0.0, 0.0, (), state.values.reshape(1, -1), first)]
+    heights = np.asarray(heights, dtype=np.float64)
+    for level in range(max_cuts):
+        children = {}
+        parents.sort(key=lambda parent: parent[4])
+        active = []
+        values = np.empty((0, len(state.values)))
+        p = 0
+        for day in range(parents[0][4], lastday + 1):
+            while p < len(parents) and parents[p][4] == day:
+                active.append(parents[p])
+                values = np.concatenate([values, parents[p][3]])
+                p += 1
+            if not active:
+                continue
+            if day in candidates:
+                rows = [j for j, parent in enumerate(active) if not parent[2] or day >= parent[2][-1][0] + min_gap]
+            else:
+                rows = []
+            # the schedules that do not cut, then one child per row and height
+            cutHeights = np.concatenate([np.zeros(len(active)), np.repeat(heights[np.newaxis], len(rows), axis=0).ravel()])
+            pre = values[np.repeat(rows, len(heights))] if rows else values[:0]
+            if rows:
+                digestible, harvested = _state_value(params, pre, cutHeights[len(active):])
+                best['evaluated'] += len(pre)
+            values = advance(np.concatenate([values, pre]), cutHeights, day)
+            for k in range(len(pre)):
+                parent = active[rows[k // len(heights)]]
+                height = float(heights[k % len(heights)])
+                child = (parent[0] + float(digestible[k]), parent[1] + float(harvested[k]), parent[2] + ((day, height),),
+                         values[len(active) + k:len(active) + k + 1], day + 1)
+                key = (day, height)
+                if key not in children or child[0] > children[key][0]:
+                    children[key] = child
+            values = values[:len(active)]
+        # the schedules that can still cut again are the parents of the next level
+        for child in children.values():
+            if child[0] > best['value']:
+                best.update(schedule=list(child[2]), value=child[0], harvested=child[1])
+        parents = [child for child in children.values() if child[4] + min_gap - 1 <= lastday]
+        if not parents:
+            break
+    return(best)
+
+def optimize_parcels(params, weathers, **kwargs):
+    """
+    Optimize the cut calendar of every parcel of a farm, see optimize_cuts()
+
+    :param params: ModvegeParams or array, (44,) shared by the parcels or (nparcels, 44)
+    :param weathers: the weather of every parcel (or one shared by all), Forcing or read_weather() array
+    :param kwargs: the arguments of optimize_cuts()
+    :return list of the optimize_cuts() result of every parcel
+    """
+    params = to_params(params)
+    if not isinstance(weathers, (list, tuple)):
+        weathers = [weathers] * (params.ncells or 1)
+    nparcels = len(weathers) if params.values.ndim == 1 else params.ncells
+    if params.values.ndim == 2 and len(weathers) not in (1, nparcels):
+        raise ValueError("%d parcels of parameters and %d weathers" % (nparcels, len(weathers)))
+    results = []
+    for j in range(nparcels):
+        parcel = params if params.values.ndim == 1 else params.cells(j)
+        results.append(optimize_cuts(parcel, weathers[j if len(weathers) > 1 else 0], **kwargs))
+    return(results)
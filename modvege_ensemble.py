@@ -0,0 +1,53 @@
+#!/usr/bin env python3
+
+# Mod Vege ensemble: many parameter sets (members) run on the same weather,
+# for calibration and uncertainty analysis. The members are the cells of a
+# modvege_vec() run on a single weather column, so the weather-only terms
+# (thermal time, 10-day mean temperature) are computed once for all of them.
+
+import numpy as np
+
+from modvege_vec import modvege_vec
+from lib_forcing import to_forcing
+from lib_params import ModvegeParams, to_params, PARAM_INDEX
+
+def sample_params(params, bounds, n_members, seed=None):
+    """
+    Monte-Carlo sample of parameter sets, uniform within bounds
+
+    :param params: the base parameters, ModvegeParams or array of 44 values
+    :param bounds: dictionary of parameter name: (low, high), the other parameters are kept
+    :param n_members: number of members
+    :param seed: seed of the random generator
+    :return ModvegeParams of the members, (n_members, 44)
+    """
+    params = to_params(params)
+    if params.ncells is not None:
+        raise ValueError("sample_params() starts from a single parameter set")
+    unknown = [name for name in bounds if name not in PARAM_INDEX]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+    rng = np.random.default_rng(seed)
+    return(params.replace(**dict((name, rng.uniform(low, high, n_members)) for name, (low, high) in bounds.items())))
+
+def modvege_ensemble(params, weather, startdoy, enddoy, outputs=None, engine='python'):
+    """
+    **Mod Vege** model for an ensemble of parameter sets sharing the same weather
+
+    :param params: ModvegeParams or array of the members, (n_members, 44)
+    :param weather: weather data (and grass cut and grazing) shared by all members, Forcing or read_weather() array
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python' (numpy arrays), 'numba' or 'auto', see modvege_vec()
+    :return the outputs, (n_members, ndays, nvariables) in the order of outputs
+    """
+    params = to_params(params)
+    if params.ncells is None:
+        params = ModvegeParams(params.values[np.newaxis])
+    forcing = to_forcing(weather)
+    if len(forcing.shape) != 1:
+        raise ValueError("The members of an ensemble share one weather, (ndays,) instead of %s" % (forcing.shape,))
+    out = modvege_vec(params, forcing, startdoy, enddoy, outputs=outputs, engine=engine)
+    # (ndays, nvariables, n_members) -> (n_members, ndays, nvariables)
+    return(np.ascontiguousarray(np.moveaxis(out.data, -1, 0)))
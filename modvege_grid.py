@@ -0,0 +1,153 @@
+#!/usr/bin env python3
+
+# Mod Vege grid runner: the cells of a grid are split into chunks and each
+# chunk is simulated by modvege_vec() in a pool of worker processes.
+# The inputs are not pickled to the workers: the parameters and the weather
+# are copied once into shared memory (or read from a binary weather store,
+# memory-mapped), and every worker writes its cells into a shared output cube.
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from modvege_vec import modvege_vec
+from lib_forcing import Forcing, FORCING_COLUMNS, to_forcing
+from lib_params import to_params
+from lib_output import ModvegeOutput
+from lib_state import ModvegeState, run_state
+from lib_read_input_files import read_weather_store
+
+#Define DEFAULT_CHUNK_SIZE 256 cells per task
+DEFAULT_CHUNK_SIZE = 256
+
+def _share(arr):
+    """
+    Copy an array into a new shared memory block
+
+    :param arr: the array
+    :return the SharedMemory and the (name, shape) a worker attaches to
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, dtype=np.float64, buffer=shm.buf)[...] = arr
+    return(shm, (shm.name, arr.shape))
+
+def _attach(block):
+    """
+    Open a shared memory block of _share() as an array
+
+    :param block: the (name, shape) of the block
+    :return the SharedMemory (to close) and the array
+    """
+    name, shape = block
+    shm = shared_memory.SharedMemory(name=name)
+    return(shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf))
+
+def _run_chunk(task):
+    """
+    Simulate a chunk of cells, in a worker process
+
+    :param task: dictionary of the shared blocks and of the run (see run_grid())
+    :return the first and last+1 cell of the chunk
+    """
+    start, stop = task['cells']
+    cells = slice(start, stop)
+    opened = []
+    try:
+        shm, values = _attach(task['params'])
+        opened.append(shm)
+        if values.ndim == 2:
+            values = values[cells]
+        if isinstance(task['weather'], str):
+            forcing = read_weather_store(task['weather'], cells)
+        else:
+            columns = {}
+            for name, block in task['weather'].items():
+                shm, arr = _attach(block)
+                opened.append(shm)
+                columns[name] = arr[:, cells] if arr.ndim == 2 else arr
+            forcing = Forcing(columns)
+        shm, cube = _attach(task['out'])
+        opened.append(shm)
+        shm, states = _attach(task['state'])
+        opened.append(shm)
+        temperatures = task['temperatures']
+        if temperatures is not None and temperatures.ndim == 2:
+            temperatures = temperatures[:, cells]
+        state = ModvegeState(states[cells], temperatures)
+        out = modvege_vec(values, forcing, task['startdoy'], task['enddoy'], outputs=task['outputs'], engine=task['engine'], state=state)
+        cube[:, :, cells] = out.data.reshape(cube.shape[:2] + (-1,))
+        states[cells] = state.values
+    finally:
+        # views on the blocks are released before closing them
+        values = columns = forcing = cube = out = states = None
+        for shm in opened:
+            shm.close()
+    return(start, stop)
+
+def _store_shape(store):
+    """
+    Shape of a binary weather store, (ndays,) or (ncells, ndays)
+    """
+    return(np.load(os.path.join(store, 'DOY.npy'), mmap_mode='r').shape)
+
+def run_grid(params, weather, startdoy, enddoy, outputs=None, engine='python', chunksize=DEFAULT_CHUNK_SIZE, max_workers=None, state=None):
+    """
+    **Mod Vege** model over a grid, the cells shared out to a pool of processes
+
+    :param params: ModvegeParams or array, (44,) shared by all cells or (ncells, 44) one row per cell
+    :param weather: Forcing (ndays, ncells) or (ndays,), or the directory of a binary weather store (convert_weather())
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: engine of modvege_vec() in the workers, 'python', 'numba' or 'auto'
+    :param chunksize: number of cells simulated by a task
+    :param max_workers: number of worker processes, default is the number of CPUs
+    :param state: lib_state.ModvegeState of the cells to start from (default is the initial values of params), updated in place
+    :return ModvegeOutput of the daily outputs, each one a (ndays, ncells) array
+    """
+    params = to_params(params)
+    if isinstance(weather, str):
+        weather_shape = _store_shape(weather)
+        # the store is (ncells, ndays)
+        weather_cells = weather_shape[:1] if len(weather_shape) == 2 else ()
+    else:
+        weather = to_forcing(weather)
+        weather_cells = weather.shape[1:]
+    shape = np.broadcast_shapes(params.values.shape[:-1], weather_cells)
+    if not shape:
+        raise ValueError("run_grid() needs a grid: (ncells, 44) parameters or a (ndays, ncells) weather")
+    ncells = shape[0]
+    state = run_state(state, params, shape)
+
+    ndays = max(0, enddoy - startdoy)
+    out = ModvegeOutput(ndays, shape, variables=outputs, startdoy=startdoy)
+    blocks = []
+    try:
+        shm, params_block = _share(params.values)
+        blocks.append(shm)
+        if isinstance(weather, str):
+            weather_block = weather
+        else:
+            weather_block = {}
+            for name in FORCING_COLUMNS:
+                shm, weather_block[name] = _share(weather[name])
+                blocks.append(shm)
+        shm, state_block = _share(state.values)
+        blocks.append(shm)
+        shm, out_block = _share(out.data)
+        blocks.append(shm)
+
+        tasks = [{'params': params_block, 'weather': weather_block, 'out': out_block, 'state': state_block,
+                  'temperatures': state.temperatures, 'cells': (start, min(start + chunksize, ncells)),
+                  'startdoy': startdoy, 'enddoy': enddoy, 'outputs': out.variables, 'engine': engine}
+                 for start in range(0, ncells, chunksize)]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(_run_chunk, tasks))
+        out.data[...] = np.ndarray(out.data.shape, dtype=np.float64, buffer=blocks[-1].buf)
+        state.values[...] = np.ndarray(state.values.shape, dtype=np.float64, buffer=blocks[-2].buf)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return(out)
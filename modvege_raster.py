@@ -0,0 +1,83 @@
+#!/usr/bin env python3
+
+# Mod Vege over a raster: every pixel is a cell of cellSurface ha. The forcing
+# stacks and parameter layers (lib_raster.py) are read a block of pixels at a
+# time, the block is run over the whole season with modvege_vec(), and its
+# outputs are written into raster time series before the next block is read,
+# so the memory needed is the one of a block whatever the size of the raster.
+
+import numpy as np
+
+from modvege_vec import modvege_vec
+from lib_output import ModvegeOutput
+from lib_raster import DEFAULT_BLOCK_SHAPE, RasterForcing, RasterParams, block_windows, open_layer
+
+def run_window(params, forcing, window, startdoy, enddoy, outputs=None, engine='python', mask=None):
+    """
+    Run the pixels of a window of a raster
+
+    :param params: RasterParams (or ModvegeParams / array shared by all pixels)
+    :param forcing: RasterForcing, or dictionary of forcing layers
+    :param window: (row, col, height, width)
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python', 'numba' or 'auto'
+    :param mask: layer of the pixels simulated (non zero), the others are NaN
+    :return the outputs of the window, (ndays, len(outputs), height*width), as ModvegeOutput.data
+    """
+    if not isinstance(params, RasterParams):
+        params = RasterParams(params)
+    if not isinstance(forcing, RasterForcing):
+        forcing = RasterForcing(forcing)
+    weather = forcing.read(window)
+    values = params.read(window)
+    ncells = window[2] * window[3]
+    cells = None
+    if mask is not None:
+        selected = open_layer(mask).read(window)[0].ravel()
+        cells = np.flatnonzero(np.nan_to_num(selected) != 0)
+        if len(cells) < ncells:
+            weather = weather.cells(cells)
+            if values.values.ndim == 2:
+                values = values.cells(cells)
+    if cells is not None and len(cells) == 0:
+        out = ModvegeOutput(max(0, enddoy - startdoy), (ncells,), variables=outputs, startdoy=startdoy)
+        out.data[...] = np.nan
+        return(out.data)
+    out = modvege_vec(values, weather, startdoy, enddoy, outputs=outputs, engine=engine)
+    if cells is None or len(cells) == ncells:
+        return(out.data)
+    data = np.full(out.data.shape[:2] + (ncells,), np.nan)
+    data[..., cells] = out.data
+    return(data)
+
+def run_raster(params, forcing, startdoy, enddoy, writer, outputs=None, blockshape=DEFAULT_BLOCK_SHAPE, engine='python', mask=None):
+    """
+    **Mod Vege** model over a raster, a block of pixels at a time
+
+    :param params: RasterParams, or ModvegeParams / array shared by all pixels
+    :param forcing: RasterForcing, or dictionary of FORCING_COLUMNS name: layer (lib_raster.open_layer()) or float
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param writer: lib_raster.RasterWriter of the output series
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param blockshape: (height, width) of the blocks of pixels run at once
+    :param engine: 'python', 'numba' or 'auto'
+    :param mask: layer of the pixels simulated (non zero), the others are NaN
+    :return writer
+    """
+    if not isinstance(params, RasterParams):
+        params = RasterParams(params)
+    if not isinstance(forcing, RasterForcing):
+        forcing = RasterForcing(forcing)
+    if mask is not None:
+        mask = open_layer(mask)
+    variables = ModvegeOutput(0, variables=outputs).variables
+    writer.open(variables, forcing.shape, startdoy, max(0, enddoy - startdoy))
+    try:
+        for window in block_windows(forcing.shape, blockshape):
+            writer.write(window, run_window(params, forcing, window, startdoy, enddoy, variables, engine, mask))
+    finally:
+        writer.close()
+    return(writer)
@@ -0,0 +1,39 @@
+#!/usr/bin env python3
+
+# Mod Vege management scenarios: many cut and grazing calendars run against
+# one weather series in a single pass. The scenarios are the cells of a
+# modvege_vec() run whose weather columns stay (ndays,): thermal time, the ten
+# days mean temperature and every weather term are computed once and shared,
+# while the cuts and the defoliation by grazing are applied per scenario,
+# masked by the calendar of each one.
+
+from modvege_vec import modvege_vec
+from lib_forcing import to_forcing
+from lib_scenario import Management
+
+def modvege_scenarios(params, weather, scenarios, startdoy=1, enddoy=365, outputs=None, engine='python', keep_weather=False, sink=None, blocksize=None, state=None):
+    """
+    **Mod Vege** model for many management scenarios on one weather
+
+    :param params: ModvegeParams or array, (44,) shared by all scenarios or (nscenarios, 44)
+    :param weather: weather data of the site, Forcing or read_weather() array, (ndays,)
+    :param scenarios: a lib_scenario.Management, or the list of events of every scenario,
+                      each one (day or (first, last), cut height (m), animal count, average animal weight (kg))
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python', 'numba' or 'auto'
+    :param keep_weather: add the events to the cuts and grazing of weather instead of replacing them
+    :param sink: lib_output.OutputSink the outputs are streamed to, block by block, instead of being returned
+    :param blocksize: number of days held in memory before a block is written to the sink
+    :param state: lib_state.ModvegeState of the scenarios to start from (default is the initial values of params), updated in place
+    :return ModvegeOutput of the daily outputs (the sink when streaming), each one a (ndays, nscenarios) array
+    """
+    forcing = to_forcing(weather)
+    if len(forcing.shape) != 1:
+        raise ValueError("The scenarios share one weather series, got a weather of shape %s" % (forcing.shape,))
+    if isinstance(scenarios, Management):
+        management = scenarios
+    else:
+        management = Management.from_events(scenarios, len(forcing), base=forcing if keep_weather else None)
+    return(modvege_vec(params, forcing, startdoy, enddoy, outputs=outputs, engine=engine, sink=sink, blocksize=blocksize, state=state, management=management))
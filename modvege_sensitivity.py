@@ -0,0 +1,232 @@
+#!/usr/bin env python3
+
+# Mod Vege sensitivity analysis: Morris elementary effects and Sobol indices
+# (Saltelli sampling) of scalar outputs of a year, over ranges of params.csv
+# entries. The samples are evaluated as ensembles, in chunks of members
+# (modvege_ensemble) or over a pool of processes (modvege_grid).
+#
+# Morris, M.D., 1991. Factorial sampling plans for preliminary computational
+# experiments. Technometrics, 33(2), pp.161-174.
+# Saltelli, A. et al., 2010. Variance based sensitivity analysis of model
+# output. Computer Physics Communications, 181(2), pp.259-270.
+
+import sys
+import numpy as np
+
+from modvege_ensemble import modvege_ensemble
+from modvege_grid import run_grid
+from lib_forcing import to_forcing
+from lib_params import to_params, PARAM_INDEX
+
+# Scalar outputs of a run: (variable recorded, reduction over the days)
+SENSITIVITY_OUTPUTS = {
+    'harvested_biomass': ('harvested_biomass', 'last'),  # Annual harvested biomass (kg DM ha-1)
+    'ingested_biomass': ('ingested_biomass', 'last'),    # Annual ingested biomass (kg DM ha-1)
+    'peak_gv_biomass': ('gv_biomass', 'max'),            # Peak of Green Vegetative biomass (kg DM ha-1)
+    'peak_gr_biomass': ('gr_biomass', 'max'),            # Peak of Green Reproductive biomass (kg DM ha-1)
+    'total_gro': ('gro', 'sum'),                         # Sum of the daily growth (kg DM ha-1)
+}
+
+#Define DEFAULT_CHUNK_SIZE 10000 members evaluated at once
+DEFAULT_CHUNK_SIZE = 10000
+
+def scale_sample(bounds, unit):
+    """
+    Map a sample of the unit hypercube to the parameter ranges
+
+    :param bounds: dictionary of parameter name: (low, high)
+    :param unit: the sample, (nsamples, len(bounds)) in [0, 1]
+    :return the parameter values, (nsamples, len(bounds))
+    """
+    low = np.array([low for low, high in bounds.values()], dtype=np.float64)
+    high = np.array([high for low, high in bounds.values()], dtype=np.float64)
+    return(low + unit * (high - low))
+
+def morris_sample(nfactors, ntrajectories, levels=4, seed=None):
+    """
+    Morris trajectories in the unit hypercube, one factor moved at a time
+
+    :param nfactors: number of parameters k
+    :param ntrajectories: number of trajectories r
+    :param levels: number of levels p of the grid
+    :param seed: seed of the random generator
+    :return the sample, (r*(k+1), k)
+    """
+    rng = np.random.default_rng(seed)
+    delta = levels / (2.0 * (levels - 1))
+    b = np.tril(np.ones((nfactors + 1, nfactors)), -1)
+    trajectories = []
+    for r in range(ntrajectories):
+        # base point on the grid, low enough for base + delta to stay in [0, 1]
+        base = rng.integers(0, levels // 2, nfactors) / (levels - 1.0)
+        signs = rng.choice([-1.0, 1.0], nfactors)
+        perm = rng.permutation(nfactors)
+        traj = base + (delta / 2.0) * ((2 * b - 1) * signs + 1)
+        trajectories.append(traj[:, perm])
+    return(np.concatenate(trajectories, axis=0))
+
+def morris_analyze(unit, y, nfactors):
+    """
+    Elementary effects of Morris trajectories
+
+    :param unit: the sample of morris_sample(), (r*(k+1), k)
+    :param y: the output of every sample, (r*(k+1),)
+    :param nfactors: number of parameters k
+    :return dictionary of mu, mu_star and sigma, (k,) each
+    """
+    unit = unit.reshape(-1, nfactors + 1, nfactors)
+    y = np.asarray(y).reshape(-1, nfactors + 1)
+    dx = np.diff(unit, axis=1)
+    # the factor moved at each step of each trajectory
+    factor = np.argmax(np.abs(dx), axis=2)
+    step = np.take_along_axis(dx, factor[..., np.newaxis], axis=2)[..., 0]
+    effects = np.empty((unit.shape[0], nfactors))
+    rows = np.arange(unit.shape[0])[:, np.newaxis]
+    effects[rows, factor] = np.diff(y, axis=1) / step
+    ddof = 1 if len(effects) > 1 else 0
+    return({'mu': effects.mean(axis=0), 'mu_star': np.abs(effects).mean(axis=0), 'sigma': effects.std(axis=0, ddof=ddof)})
+
+def saltelli_sample(nfactors, nbase, seed=None):
+    """
+    Saltelli sample in the unit hypercube: the matrices A, B and every A_B^i
+    (A with the column i taken from B), stacked in that order
+
+    :param nfactors: number of parameters k
+    :param nbase: number of base samples N
+    :param seed: seed of the random generator
+    :return the sample, (N*(k+2), k)
+    """
+    rng = np.random.default_rng(seed)
+    ab = rng.random((nbase, 2 * nfactors))
+    a = ab[:, :nfactors]
+    b = ab[:, nfactors:]
+    blocks = [a, b]
+    for i in range(nfactors):
+        abi = a.copy()
+        abi[:, i] = b[:, i]
+        blocks.append(abi)
+    return(np.concatenate(blocks, axis=0))
+
+def sobol_analyze(y, nfactors):
+    """
+    First order and total Sobol indices of a Saltelli sample
+    (Saltelli 2010 estimator for S1, Jansen estimator for ST)
+
+    :param y: the output of every sample of saltelli_sample(), (N*(k+2),)
+    :param nfactors: number of parameters k
+    :return dictionary of S1 and ST, (k,) each
+    """
+    y = np.asarray(y).reshape(nfactors + 2, -1)
+    fa = y[0]
+    fb = y[1]
+    variance = np.var(np.concatenate([fa, fb]))
+    s1 = np.empty(nfactors)
+    st = np.empty(nfactors)
+    for i in range(nfactors):
+        fabi = y[2 + i]
+        s1[i] = np.mean(fb * (fabi - fa)) / variance
+        st[i] = 0.5 * np.mean((fa - fabi) ** 2) / variance
+    return({'S1': s1, 'ST': st})
+
+def _reduce(series, how):
+    """
+    Reduce daily series over the days (axis 1)
+    """
+    if how == 'last':
+        return(series[:, -1])
+    if how == 'max':
+        return(series.max(axis=1))
+    return(series.sum(axis=1))
+
+def evaluate_sample(params, weather, names, values, outputs, startdoy=1, enddoy=365, engine='python', chunksize=DEFAULT_CHUNK_SIZE, max_workers=None):
+    """
+    Run the model for every sample of parameter values and reduce its outputs
+
+    :param params: the base parameters, ModvegeParams or array of 44 values
+    :param weather: weather data shared by all samples, Forcing or read_weather() array
+    :param names: the names of the parameters varied
+    :param values: their values, (nsamples, len(names))
+    :param outputs: names in SENSITIVITY_OUTPUTS
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param engine: 'python', 'numba' or 'auto'
+    :param chunksize: number of samples run at once
+    :param max_workers: run the chunks over a pool of processes (modvege_grid) instead of in this process
+    :return dictionary of output name: (nsamples,) values
+    """
+    params = to_params(params)
+    forcing = to_forcing(weather)
+    unknown = [name for name in outputs if name not in SENSITIVITY_OUTPUTS]
+    if unknown:
+        raise ValueError("Unknown sensitivity outputs: %s" % (", ".join(unknown)))
+    variables = []
+    for name in outputs:
+        if SENSITIVITY_OUTPUTS[name][0] not in variables:
+            variables.append(SENSITIVITY_OUTPUTS[name][0])
+    result = dict((name, np.empty(len(values))) for name in outputs)
+    for start in range(0, len(values), chunksize):
+        chunk = values[start:start + chunksize]
+        members = params.replace(**dict((name, chunk[:, j]) for j, name in enumerate(names)))
+        if max_workers is None:
+            cube = modvege_ensemble(members, forcing, startdoy, enddoy, outputs=variables, engine=engine)
+        else:
+            out = run_grid(members, forcing, startdoy, enddoy, outputs=variables, engine=engine, max_workers=max_workers)
+            cube = np.moveaxis(out.data, -1, 0)
+        for name in outputs:
+            variable, how = SENSITIVITY_OUTPUTS[name]
+            result[name][start:start + len(chunk)] = _reduce(cube[:, :, variables.index(variable)], how)
+    return(result)
+
+def run_sensitivity(params, weather, bounds, method='morris', nsamples=100, outputs=('harvested_biomass', 'peak_gv_biomass'), startdoy=1, enddoy=365, levels=4, seed=None, engine='python', chunksize=DEFAULT_CHUNK_SIZE, max_workers=None):
+    """
+    Sensitivity analysis of outputs of the year to ranges of parameters
+
+    :param params: the base parameters (the ones not in bounds are kept), ModvegeParams or array
+    :param weather: weather data shared by all samples, Forcing or read_weather() array
+    :param bounds: dictionary of parameter name: (low, high)
+    :param method: 'morris' (elementary effects) or 'sobol' (Sobol indices)
+    :param nsamples: number of trajectories (morris) or of base samples (sobol)
+    :param outputs: names in SENSITIVITY_OUTPUTS
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param levels: number of levels of the Morris grid
+    :param seed: seed of the random generator
+    :param engine: 'python', 'numba' or 'auto'
+    :param chunksize: number of model evaluations run at once
+    :param max_workers: evaluate over a pool of processes
+    :return dictionary of output name: dictionary of indices (mu, mu_star, sigma or S1, ST), in the order of bounds
+    """
+    unknown = [name for name in bounds if name not in PARAM_INDEX]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+    names = list(bounds)
+    if method == 'morris':
+        unit = morris_sample(len(names), nsamples, levels, seed)
+    elif method == 'sobol':
+        unit = saltelli_sample(len(names), nsamples, seed)
+    else:
+        raise ValueError("Unknown sensitivity method %r, expected 'morris' or 'sobol'" % (method))
+    y = evaluate_sample(params, weather, names, scale_sample(bounds, unit), outputs, startdoy, enddoy, engine, chunksize, max_workers)
+    result = {}
+    for name in outputs:
+        if method == 'morris':
+            result[name] = morris_analyze(unit, y[name], len(names))
+        else:
+            result[name] = sobol_analyze(y[name], len(names))
+        result[name]['names'] = names
+    return(result)
+
+def log_sensitivity(result, file=None):
+    """
+    Print the indices of run_sensitivity(), one line per parameter
+
+    :param result: the result of run_sensitivity()
+    :param file: where to print, default is sys.stdout
+    """
+    if file is None:
+        file = sys.stdout
+    for output, indices in result.items():
+        keys = [key for key in indices if key != 'names']
+        print("%s: %s" % (output, " ".join("%12s" % (key) for key in keys)), file=file)
+        for j, name in enumerate(indices['names']):
+            print("  %-12s %s" % (name, " ".join("%12.4g" % (indices[key][j]) for key in keys)), file=file)
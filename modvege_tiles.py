@@ -0,0 +1,150 @@
+#!/usr/bin env python3
+
+# Mod Vege tile scheduler for rasters larger than the memory: the raster is
+# partitioned into tiles, a worker reads the forcing of a tile (windowed reads
+# of the layers, lib_raster.py), runs the whole season on it and sends back
+# its outputs, which are written by this process before the memory of the
+# tile is freed. Layers held in memory are copied once into shared memory,
+# the tasks only carry the names of the blocks. The tile size follows from a memory limit, and no more tiles
+# than workers are in flight at once, so the memory used is bounded by
+# max_memory whatever the size of the raster.
+
+import sys
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from modvege_raster import run_window
+from lib_forcing import FORCING_COLUMNS
+from lib_output import ModvegeOutput
+from lib_raster import RasterForcing, RasterParams, block_windows, open_layer, share_layer
+
+# Per cell memory of a tile besides its daily series: states and temporaries of modvege_vec() (float64 values)
+CELL_OVERHEAD = 100
+
+def tile_memory(ndays, nvars, ncells):
+    """
+    Estimate the memory needed to run a tile
+
+    :param ndays: number of days of the forcing
+    :param nvars: number of outputs recorded
+    :param ncells: number of pixels of the tile
+    :return bytes: the forcing, thermal time, the outputs and their copy sent back, and the engine temporaries
+    """
+    return(8 * ncells * (ndays * (len(FORCING_COLUMNS) + 2 + 2 * nvars) + CELL_OVERHEAD))
+
+def tile_shape(shape, ndays, nvars, max_memory, workers=1):
+    """
+    Largest square tile such that workers tiles fit in max_memory
+
+    :param shape: (height, width) of the raster
+    :param ndays: number of days of the forcing
+    :param nvars: number of outputs recorded
+    :param max_memory: bytes available to the run
+    :param workers: number of tiles run at once
+    :return (height, width) of a tile
+    """
+    ncells = max_memory // (workers * tile_memory(ndays, nvars, 1))
+    if ncells < 1:
+        raise ValueError("%d bytes are not enough to run %d pixel(s) at once" % (max_memory, workers))
+    side = math.isqrt(ncells)
+    if side >= shape[1]:
+        # whole rows
+        return((min(shape[0], ncells // shape[1]), shape[1]))
+    return((min(shape[0], side), side))
+
+def _run_tile(task):
+    """
+    Worker: run a tile, return its window, outputs and timings
+    """
+    start = time.perf_counter()
+    try:
+        data = run_window(task['params'], task['forcing'], task['window'], task['startdoy'], task['enddoy'],
+                          task['outputs'], task['engine'], task['mask'])
+    finally:
+        # the shared memory blocks attached by this task
+        for layer in task['shared']:
+            layer.close()
+    return(task['window'], data, time.perf_counter() - start)
+
+def run_tiles(params, forcing, startdoy, enddoy, writer, outputs=None, tileshape=None, max_memory=None, max_workers=None, engine='python', mask=None, verbose=False, file=None):
+    """
+    **Mod Vege** model over a raster larger than the memory, a tile at a time, over a pool of processes
+
+    :param params: RasterParams, or ModvegeParams / array shared by all pixels
+    :param forcing: RasterForcing, or dictionary of FORCING_COLUMNS name: layer (lib_raster.open_layer()) or float
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param writer: lib_raster.RasterWriter of the output series, written by this process only
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param tileshape: (height, width) of a tile, default is the largest one max_memory allows
+    :param max_memory: bytes the tiles in flight may use (tile_memory()), default is no limit
+    :param max_workers: number of tiles run at once by worker processes, None runs the tiles in this process
+    :param engine: 'python', 'numba' or 'auto'
+    :param mask: layer of the pixels simulated (non zero), the others are NaN
+    :param verbose: print the progress and the timings of every tile
+    :param file: where to print, default is sys.stdout
+    :return list of one dictionary per tile (window, cells, seconds to run, seconds to write), in the order they finished
+    """
+    if not isinstance(params, RasterParams):
+        params = RasterParams(params)
+    if not isinstance(forcing, RasterForcing):
+        forcing = RasterForcing(forcing)
+    if mask is not None:
+        mask = open_layer(mask)
+    if file is None:
+        file = sys.stdout
+    variables = ModvegeOutput(0, variables=outputs).variables
+    workers = 1 if max_workers is None else max_workers
+    if tileshape is None:
+        if max_memory is None:
+            raise ValueError("run_tiles() needs a tileshape or a max_memory")
+        tileshape = tile_shape(forcing.shape, forcing.ndays, len(variables), max_memory, workers)
+    elif max_memory is not None and workers * tile_memory(forcing.ndays, len(variables), tileshape[0] * tileshape[1]) > max_memory:
+        raise ValueError("%d tiles of %s pixels do not fit in %d bytes" % (workers, tuple(tileshape), max_memory))
+
+    # in-memory layers are shared with the workers instead of being pickled with every task
+    shared = []
+    if max_workers is not None:
+        params = params.shared(shared)
+        forcing = forcing.shared(shared)
+        mask = share_layer(mask, shared)
+    windows = list(block_windows(forcing.shape, tileshape))
+    tasks = ({'params': params, 'forcing': forcing, 'window': window, 'startdoy': startdoy, 'enddoy': enddoy,
+              'outputs': variables, 'engine': engine, 'mask': mask, 'shared': shared} for window in windows)
+    timings = []
+    start = time.perf_counter()
+
+    def done(window, data, seconds):
+        tic = time.perf_counter()
+        writer.write(window, data)
+        cells = window[2] * window[3]
+        timings.append({'window': window, 'cells': cells, 'seconds': seconds, 'write': time.perf_counter() - tic})
+        if verbose:
+            elapsed = time.perf_counter() - start
+            print("tile %d/%d %s: %.3f s (%.0f cells/s), written in %.3f s, %.1f s elapsed, %.1f s left" %
+                  (len(timings), len(windows), window, seconds, cells / max(seconds, 1e-9), timings[-1]['write'],
+                   elapsed, elapsed * (len(windows) - len(timings)) / len(timings)), file=file)
+
+    writer.open(variables, forcing.shape, startdoy, max(0, enddoy - startdoy))
+    try:
+        if max_workers is None:
+            for task in tasks:
+                done(*_run_tile(task))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                pending = set()
+                for task in tasks:
+                    # no more tiles in flight than workers: their outputs are what max_memory bounds
+                    if len(pending) >= max_workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            done(*future.result())
+                    pending.add(pool.submit(_run_tile, task))
+                for future in pending:
+                    done(*future.result())
+    finally:
+        writer.close()
+        for layer in shared:
+            layer.unlink()
+    return(timings)
@@ -0,0 +1,158 @@
+#!/usr/bin env python3
+
+# Mod Vege scenario trees: scenarios that share their management up to a day
+# share the simulation of those days. A node of the tree is a segment of days
+# with its cut and grazing events, its children continue from forks of the
+# state of its last day (lib_state.ModvegeState.fork()). Every node is
+# simulated once, and the nodes of the same days (siblings, cousins...) are
+# run together as the scenarios of one modvege_vec() run, so an exhaustive
+# search over cut dates costs about the days of the nodes of the tree instead
+# of scenarios x days.
+
+import numpy as np
+
+from modvege_vec import modvege_vec
+from lib_forcing import to_forcing
+from lib_output import ModvegeOutput
+from lib_params import to_params
+from lib_scenario import Management
+from lib_state import ModvegeState
+
+class ScenarioNode:
+    """
+    A decision of a scenario tree: the events of days startdoy...enddoy-1, its children continue from enddoy
+    """
+    __slots__ = ('enddoy', 'events', 'children', 'name', 'parent', 'startdoy', 'output', 'state')
+
+    def __init__(self, enddoy, events=(), children=(), name=None):
+        """
+        :param enddoy: the day the node stops (its children start)
+        :param events: cut and grazing events of the node, (day or (first, last), cut height (m), animal count, average animal weight (kg))
+        :param children: the ScenarioNode that continue from this one
+        :param name: a label of the decision
+        """
+        self.enddoy = enddoy
+        self.events = list(events)
+        self.children = []
+        self.name = name
+        self.parent = None
+        self.startdoy = None
+        self.output = None
+        self.state = None
+        for child in children:
+            self.add(child)
+
+    def add(self, child):
+        """
+        Add a child and return it
+        """
+        child.parent = self
+        self.children.append(child)
+        return(child)
+
+    def nodes(self):
+        """
+        Generator of the nodes of the subtree, parents before their children
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield(node)
+            stack.extend(reversed(node.children))
+
+    def leaves(self):
+        """
+        List of the leaves of the subtree: the complete scenarios
+        """
+        return([node for node in self.nodes() if not node.children])
+
+    def path(self):
+        """
+        The nodes from the root to this one
+        """
+        nodes = []
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        return(nodes[::-1])
+
+    def path_events(self):
+        """
+        Events of the scenario from the root to this node
+        """
+        return([event for node in self.path() for event in node.events])
+
+    def path_output(self):
+        """
+        Outputs of the scenario from the start of the root to the end of this node, once run by run_tree()
+
+        :return ModvegeOutput, (ndays, nvars)
+        """
+        path = self.path()
+        first = path[0].output
+        out = ModvegeOutput(self.enddoy - path[0].startdoy, variables=first.variables, startdoy=path[0].startdoy)
+        out.data[...] = np.concatenate([node.output.data for node in path], axis=0)
+        return(out)
+
+def run_tree(params, weather, root, startdoy=1, outputs=None, engine='python', keep_weather=False, state=None):
+    """
+    **Mod Vege** model over a tree of management decisions, every node simulated once
+
+    Each node gets its outputs (node.output, ModvegeOutput of its days) and the state
+    of its last day (node.state), leaf.path_output() gives the outputs of a scenario.
+
+    :param params: ModvegeParams or array of 44 values
+    :param weather: weather data of the site, Forcing or read_weather() array, (ndays,)
+    :param root: the ScenarioNode of the first days
+    :param startdoy: day of year when the simulation starts
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python', 'numba' or 'auto'
+    :param keep_weather: add the events to the cuts and grazing of weather instead of replacing them
+    :param state: lib_state.ModvegeState of the cell to start from (default is the initial values of params)
+    :return the number of node-days simulated
+    """
+    params = to_params(params)
+    forcing = to_forcing(weather)
+    if len(forcing.shape) != 1 or params.values.ndim != 1:
+        raise ValueError("run_tree() runs the scenarios of a single cell")
+    if state is None:
+        state = ModvegeState.from_params(params)
+    base = forcing if keep_weather else None
+    root.startdoy = startdoy
+    # the nodes to run, with the state of the cell they start from
+    ready = [(state, [root])]
+    simulated = 0
+    while ready:
+        # the nodes of the same days are run at once
+        groups = {}
+        for start, nodes in ready:
+            siblings = {}
+            for node in nodes:
+                if node.enddoy < node.startdoy:
+                    raise ValueError("Node %r ends on day %d before it starts on day %d" % (node.name, node.enddoy, node.startdoy))
+                for day, cutHeight, count, weight in node.events:
+                    first, last = day if isinstance(day, tuple) else (day, day)
+                    if first < node.startdoy or last >= node.enddoy:
+                        raise ValueError("Node %r has events on days %d-%d, outside its days %d-%d" % (node.name, first, last, node.startdoy, node.enddoy - 1))
+                siblings.setdefault((node.startdoy, node.enddoy), []).append(node)
+            for days, group in siblings.items():
+                groups.setdefault(days, []).append((start, group))
+        ready = []
+        for (first, last), members in groups.items():
+            # the state of a parent is forked into its children of these days
+            nodes = [node for start, group in members for node in group]
+            forks = [start.fork(len(group)) for start, group in members]
+            batch = ModvegeState(np.concatenate([fork.values for fork in forks]), forks[0].temperatures)
+            management = Management.from_events([node.events for node in nodes], len(forcing), base=base)
+            out = modvege_vec(params, forcing, first, last, outputs=outputs, engine=engine, state=batch, management=management)
+            simulated += len(nodes) * (last - first)
+            for j, node in enumerate(nodes):
+                node.output = ModvegeOutput(last - first, variables=out.variables, startdoy=first)
+                node.output.data[...] = out.data[:, :, j]
+                node.state = batch.cells(j)
+                if node.children:
+                    for child in node.children:
+                        child.startdoy = last
+                    ready.append((node.state, node.children))
+    return(simulated)
@@ -0,0 +1,311 @@
+#!/usr/bin env python3
+
+# Mod Vege batched code, the same daily loop as modvege.py
+# but every state variable is an array over cells, so one daily step
+# advances the whole grid at once.
+
+import numpy as np
+
+#Import the array version of the libraries of ModVege
+from lib_modvege_vec import *
+from lib_forcing import to_forcing
+from lib_params import to_params
+from lib_output import ModvegeOutput, BlockOutput
+from lib_state import run_state
+from lib_scenario import run_management
+from lib_modvege_numba import use_compiled_engine, modvege_numba
+
+#Define DEFAULT_CUT_HEIGHT 0.05
+DEFAULT_CUT_HEIGHT = 0.05
+
+#Define FASTFORWARD_MIN_DAYS 3 dormant days at least to skip the daily loop
+FASTFORWARD_MIN_DAYS = 3
+#Define FASTFORWARD_RTOL 1e-9 largest relative deviation of fastforward from the daily loop
+FASTFORWARD_RTOL = 1e-9
+
+def modvege_vec(params, weather, startdoy, enddoy, outputs=None, engine='python', sink=None, blocksize=None, state=None, management=None, fastforward=False):
+    """
+    **Mod Vege** model as a function, over many cells at once
+
+    Cell by cell, it returns the same outputs as modvege.modvege()
+
+    :param params: ModvegeParams or array, (44,) shared by all cells or (ncells, 44) one row per cell
+    :param weather: Forcing or weather structured array, (ndays,) shared by all cells or (ndays, ncells) one column per cell
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python' (numpy arrays), 'numba' (the compiled loop of lib_modvege_numba, cell by cell) or 'auto'
+    :param sink: lib_output.OutputSink the outputs are streamed to, block by block, instead of being returned
+    :param blocksize: number of days held in memory before a block is written to the sink
+    :param state: lib_state.ModvegeState to start from (default is the initial values of params), updated in place to the state after the last day
+    :param management: lib_scenario.Management, (ndays, nscenarios) cut and grazing calendars replacing the ones of weather, one per cell
+    :param fastforward: advance runs of dormant days (no growth, cut or grazing in any cell) with lib_modvege_vec.dormantRun()
+                        instead of day by day, within FASTFORWARD_RTOL of the daily loop (the python engine only)
+    :return ModvegeOutput of the daily outputs of modvege.modvege() (the sink when streaming), each one a (ndays, ncells) array
+    """
+    if(use_compiled_engine(engine)):
+        return(modvege_numba(params, weather, startdoy, enddoy, outputs, sink=sink, blocksize=blocksize, state=state, management=management))
+    params = to_params(params)
+    forcing = to_forcing(weather)
+    management = run_management(management, forcing)
+    # Number of cells of the run, () if params, weather and management are for a single cell
+    shape = np.broadcast_shapes(params.values.shape[:-1], forcing.shape[1:], management.shape[1:])
+
+    #######################################################
+    # Load input parameters into variables (one value per cell)
+    #######################################################
+    #Onset of reproductive growth (degreeday)
+    st1 = params.ST1
+    #End of reproductive growth (degreeday)
+    st2 = params.ST2
+    #Initial Nutritional index of cell
+    ni = params.NI
+    #Soil water-holding capacity (mm)
+    waterHoldingCapacity = params.WHC
+    #Soil water reserve (mm)
+    waterReserve = params.WR
+    #Growth increase in winter
+    minsea = params.minSEA
+    #Growth increase in summer
+    maxsea = params.maxSEA
+    #Biomass of GV (kg ha-1)
+    wgv = params.W_GV
+    #Light Use Interception
+    alphapar = params.alpha_PAR
+    #Temperature threshold: photosynthesis activation (degC)
+    t0 = params.T0
+    #Temp threshold: stable growth (degC)
+    t1 = params.T1
+    #Temp threshold: growth decline (degC)
+    t2 = params.T2
+    #Specific leaf area (m2 g-1)
+    sla = params.SLA
+    #Leaf lifespan (degreeday)
+    lls = params.LLS
+    #Volume GV (g m-3)
+    rhogv = params.rho_GV
+    #% leaf of laminae in GV
+    pctlam = params.percentLAM
+    #Biomass of GR (kg ha-1)
+    wgr = params.W_GR
+    #Volume GR (g m-3)
+    rhogr = params.rho_GR
+    #Biomass of DV (kg ha-1)
+    wdv = params.W_DV
+    #Senescence coefficient DV (degreeday)
+    kdv = params.K_DV
+    #Abscission coefficient DV (degreeday)
+    kldv = params.Kl_DV
+    #Volume DV (g m-3)
+    rhodv = params.rho_DV
+    #Biomass of DR (kg ha-1)
+    wdr = params.W_DR
+    #Senescence coefficient DR (degreeday)
+    kdr = params.K_DR
+    #Abscission coefficient DR (degreeday)
+    kldr = params.Kl_DR
+    #Volume DR (g m-3)
+    rhodr = params.rho_DR
+    #Initial value of age of compartment GV
+    gv_init_age = params.init_AGE_GV
+    #Initial value of age of compartment GR
+    gr_init_age = params.init_AGE_GR
+    #Initial value of age of compartment DV
+    dv_init_age = params.init_AGE_DV
+    #Initial value of age of compartment DR
+    dr_init_age = params.init_AGE_DR
+    #Max of R.U.E.
+    ruemax = params.RUEmax
+    #Respiration of green vegetative
+    gv_gamma = params.gammaGV
+    #Respiration of green reproductive
+    gr_gamma = params.gammaGR
+    #Pixel area [Ha]
+    cellSurface = params.cellSurface
+
+    # Initialize state parameters, one value per cell, from the state of a previous run if any
+    state = run_state(state, params, shape)
+    isCut = state.isCut != 0
+    a2rFlag = state.a2rFlag != 0
+    harvestedBiomass = np.array(state.harvested_biomass)
+    ingestedBiomass = np.array(state.ingested_biomass)
+    waterReserve = np.array(state.waterReserve)
+    ni = np.array(state.ni)
+    gv_biomass = np.array(state.gv_biomass)
+    gr_biomass = np.array(state.gr_biomass)
+    dv_biomass = np.array(state.dv_biomass)
+    dr_biomass = np.array(state.dr_biomass)
+    gv_avg_age = np.array(state.gv_avg_age)
+    dv_avg_age = np.array(state.dv_avg_age)
+    gr_avg_age = np.array(state.gr_avg_age)
+    dr_avg_age = np.array(state.dr_avg_age)
+    # Available biomass for cut of the previous day
+    avBiom4cut = np.array(state.previousAvBiom4cut)
+
+    # Weather columns as plain float64 arrays
+    w_temperature = forcing.Temperature
+    w_pari = forcing.PARi
+    w_pp = forcing.PP
+    w_pet = forcing.PET
+    w_eta = forcing.eta
+    w_lai = forcing.lai
+    # Cut and grazing calendars, of the weather or one per scenario
+    w_cutHeight = management.gcut_height
+    w_animal_count = management.grazing_animal_count
+    w_animal_weight = management.grazing_avg_animal_weight
+
+    #mk sumTemperature for every day at once, Uses t0=0 and not t0
+    sumTemperature = getSumTemperatureSeries(forcing, 0.55)
+    #mk mean Ten Days Temperature for every day at once
+    meanTenDaysTemperature = getMeanTenDaysTemperatureSeries(forcing, state.temperatures)
+
+    # Outputs, preallocated (one row per day and one column per cell), or a block of days streamed to the sink
+    ndays = max(0, enddoy - startdoy)
+    if(sink is None):
+        out = ModvegeOutput(ndays, shape, variables=outputs, startdoy=startdoy)
+    else:
+        out = BlockOutput(sink, ndays, shape, variables=outputs, startdoy=startdoy, blocksize=blocksize)
+    # PGRO is skipped on days without growth when its output is not asked for
+    recordPGRO = out.wants('pgro')
+
+    if fastforward:
+        # Dormant days: no growth (fTemperature is 0) and no cut or grazing event, in every cell
+        def daily(arr):
+            # (ndays, ...) series against the cells
+            return(arr.reshape(arr.shape[:1] + (1,) * (1 + len(shape) - arr.ndim)))
+        days = np.arange(startdoy, enddoy)
+        dormant = (fTemperature(daily(meanTenDaysTemperature[days]), t0, t1, t2, daily(sumTemperature[days])) == 0)
+        dormant = dormant & daily((w_cutHeight[days-1] == 0) & ~((w_animal_count[days-1] != 0) & (w_animal_weight[days-1] != 0)))
+        dormant = dormant.reshape(len(days), -1).all(axis=1)
+        # number of dormant days from each day on: distance to the next day that is not dormant
+        position = np.arange(len(days))
+        nextActive = np.minimum.accumulate(np.where(dormant, len(days), position)[::-1])[::-1]
+        dormantDays = nextActive - position
+    resume = startdoy
+
+    # Divisions by empty compartments are masked out by np.where
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # daily loop
+        for k, i in enumerate(range(startdoy, enddoy, 1)):
+            if i < resume:
+                # advanced by the dormant run
+                continue
+            if fastforward and dormantDays[k] >= FASTFORWARD_MIN_DAYS:
+                last = i + dormantDays[k]
+                n, run = dormantRun(w_temperature[i-1:last-1], kdv, kldv, kdr, kldr, lls, st1, st2, t0, gv_gamma, gr_gamma,
+                                    gv_biomass, dv_biomass, gr_biomass, dr_biomass, gv_avg_age, dv_avg_age, gr_avg_age, dr_avg_age)
+                if n >= FASTFORWARD_MIN_DAYS:
+                    gv_run, dv_run, gr_run, dr_run, gv_ages, dv_ages, gr_ages, dr_ages = run
+                    ni = np.where(ni < 0.35, 0.35, ni)
+                    # no event: the flag is reset on the first day, the totals do not change
+                    isCut = np.zeros_like(isCut)
+                    sumT = daily(sumTemperature[i:i+n])
+                    sea = fsea(maxsea, minsea, sumT, st2, st1)
+                    a2r = np.where((sumT > st1) & (sumT < st2) & ~a2rFlag, rep(ni), 0)
+                    avBiom4cut = getAvailableBiomassForCut(gv_run, dv_run, gr_run, dr_run, DEFAULT_CUT_HEIGHT, rhogv, rhodv, rhogr, rhodr)
+                    # water balance, with the GV biomass of the start of every day
+                    gv_before = np.concatenate([np.broadcast_to(gv_biomass, gv_run.shape[1:])[np.newaxis], gv_run[:-1]])
+                    reserves, lai = dormantWaterReserve(daily(w_pp[i-1:i-1+n]), daily(w_pet[i-1:i-1+n]), daily(w_eta[i-1:i-1+n]), daily(w_lai[i-1:i-1+n]),
+                                                        gv_before, waterReserve, waterHoldingCapacity, pctlam, sla)
+                    pgr = pgro(daily(w_pari[i-1:i-1+n]), ruemax, pctlam, sla, gv_before, lai) if recordPGRO else 0.0
+                    # the days of the run written at once, the totals repeated over them
+                    totals = [np.broadcast_to(total, (n,) + np.shape(total)) for total in (harvestedBiomass, ingestedBiomass)]
+                    out.record_days(k, n, (gv_run, dv_run, gr_run, dr_run, totals[0], totals[1], 0.0, avBiom4cut, sumT,
+                                           gv_ages, gr_ages, dv_ages, dr_ages, sea, 0.0, 0.0, pgr, a2r))
+                    waterReserve = reserves[n-1]
+                    gv_biomass = gv_run[n-1]
+                    dv_biomass, gr_biomass, dr_biomass = dv_run[n-1], gr_run[n-1], dr_run[n-1]
+                    gv_avg_age, dv_avg_age, gr_avg_age, dr_avg_age = gv_ages[n-1], dv_ages[n-1], gr_ages[n-1], dr_ages[n-1]
+                    avBiom4cut = avBiom4cut[n-1]
+                    resume = i + n
+                    continue
+            temperature = w_temperature[i-1]
+            # mean Ten Days Temperature
+            meanTenDaysT = meanTenDaysTemperature[i]
+            pari = w_pari[i-1]
+            pmm = w_pp[i-1]
+            pet = w_pet[i-1]
+            eta = w_eta[i-1]
+            lai = w_lai[i-1]
+            cutHeight = w_cutHeight[i-1]
+            grazing_animal_count = w_animal_count[i-1]
+            grazing_avg_animal_weight = w_animal_weight[i-1]
+
+            sumT = sumTemperature[i]
+            sea = fsea(maxsea, minsea, sumT, st2, st1)
+            ftm = fTemperature(meanTenDaysT, t0, t1, t2, sumT)
+
+            isHarvested = (cutHeight != 0.0)
+            isGrazed = (grazing_animal_count != 0) & (grazing_avg_animal_weight != 0)
+            #Reset the flag isCut
+            isCut = isCut & (isGrazed | isHarvested)
+            correctiveFactorForAn = 1
+            ni = np.where(ni < 0.35, 0.35, ni)
+
+            #If ETA (and LAI) from remote sensing not available, then compute it
+            noEta = (np.trunc(eta) == 0)
+            lai = np.where(noEta & (np.trunc(lai) == 0), fclai(pctlam, sla, gv_biomass), lai)
+            eta = np.where(noEta, aet(pet, pctlam, sla, gv_biomass, waterReserve, waterHoldingCapacity, lai), eta)
+            #Compute WR
+            waterReserve = np.minimum(np.maximum(0, waterReserve + pmm - eta), waterHoldingCapacity)
+
+            #Compute CUT in the vegetative growth period
+            inGrowth = (sumT > st1) & (sumT < st2)
+            isHarvestedNow = inGrowth & isHarvested
+            if isHarvestedNow.any():
+                isCut = isCut | isHarvestedNow
+                cutFlag, harvestedBiomassPart, gv_cut, dv_cut, gr_cut, dr_cut = cut(cutHeight, rhogv, rhodv, rhogr, rhodr, gv_biomass, dv_biomass, gr_biomass, dr_biomass, cellSurface, isHarvested)
+                gv_biomass = np.where(isHarvestedNow, gv_cut, gv_biomass)
+                dv_biomass = np.where(isHarvestedNow, dv_cut, dv_biomass)
+                gr_biomass = np.where(isHarvestedNow, gr_cut, gr_biomass)
+                dr_biomass = np.where(isHarvestedNow, dr_cut, dr_biomass)
+            isGrazedNow = inGrowth & isGrazed
+            ingestedBiomassPart = 0
+            if isGrazedNow.any():
+                isCut = isCut | isGrazedNow
+                maxAmountToIngest = getMaxAmountToIngest(grazing_animal_count, grazing_avg_animal_weight, cellSurface)
+                ingestedBiomassPart = np.where(isGrazedNow, defoliation(gv_biomass, dv_biomass, gr_biomass, dr_biomass, cutHeight, rhogv, rhodv, rhogr, rhodr, maxAmountToIngest), 0)
+            # Allocation to reproductive, permanently stopped after the first cut
+            a2r = np.where(inGrowth, rep(ni), 0)
+            a2rFlag = a2rFlag | isCut
+            a2r = np.where(a2rFlag, 0, a2r)
+
+            # Compute biomass growth, every factor evaluated once for the day
+            if(not recordPGRO and not ftm.any()):
+                # No growth in any cell on that day, PGRO is only computed for its output
+                env = 0.0
+                pgr = 0.0
+            else:
+                # ENV as mk_env() does, from the fTemperature of the day
+                env = ftm * ni * fPARi(pari, alphapar) * fWaterStress(waterReserve, waterHoldingCapacity, pet)
+                pgr = pgro(pari,ruemax,pctlam,sla,gv_biomass,lai)
+            gro = env * pgr * sea * correctiveFactorForAn
+
+            #Update the state of the Vegetative parts
+            # Used t0 = 0 instead of t0 to match output data !
+            gv_biomass, gv_avg_age, gv_senescent_biomass = gv_update(gro, a2r, lls, temperature, kdv, 0, gv_biomass, gv_avg_age)
+            dv_biomass, dv_avg_age = dv_update(gv_gamma,gv_senescent_biomass,lls,kldv,temperature,dv_biomass, dv_avg_age)
+            # Start the Reproductive phase of the vegetation
+            gr_biomass, gr_avg_age, gr_senescent_biomass = gr_update(temperature, a2r, gro, st1, st2, kdr, lls, rhogr, t0, gr_biomass, gr_avg_age)
+            dr_biomass, dr_avg_age = dr_update(gr_gamma,gr_senescent_biomass,st1,st2,temperature,kldr,dr_biomass, dr_avg_age)
+            # If we do not cut the grass, ensure default estimation is created
+            cutHeight = np.where(isCut, cutHeight, DEFAULT_CUT_HEIGHT)
+            # Accumulate harvestedBiomass from the available biomass of the previous day
+            harvestedBiomass = np.where(isCut, harvestedBiomass + avBiom4cut, harvestedBiomass)
+            # Compute available biomass for cut (output comparison requirement)
+            avBiom4cut = getAvailableBiomassForCut(gv_biomass, dv_biomass, gr_biomass, dr_biomass, cutHeight, rhogv, rhodv, rhogr, rhodr)
+            # Accumulate ingestedBiomass
+            ingestedBiomass = ingestedBiomass + ingestedBiomassPart
+
+            # Recover output streams
+            out.record(k, (gv_biomass, dv_biomass, gr_biomass, dr_biomass, harvestedBiomass, ingestedBiomass, gro, avBiom4cut, sumT, gv_avg_age, gr_avg_age, dv_avg_age, dr_avg_age, sea, ftm, env, pgr, a2r))
+
+    # Export the state after the last day
+    state.update(gv_biomass=gv_biomass, dv_biomass=dv_biomass, gr_biomass=gr_biomass, dr_biomass=dr_biomass,
+                 gv_avg_age=gv_avg_age, gr_avg_age=gr_avg_age, dv_avg_age=dv_avg_age, dr_avg_age=dr_avg_age,
+                 waterReserve=waterReserve, ni=ni, isCut=isCut, a2rFlag=a2rFlag, harvested_biomass=harvestedBiomass,
+                 ingested_biomass=ingestedBiomass, previousAvBiom4cut=avBiom4cut)
+    if(sink is not None):
+        out.close(ndays)
+        return(sink)
+    return(out)
@@ -0,0 +1,77 @@
+#!/usr/bin env python3
+
+# Mod Vege over many years: the years are run one after the other, the state
+# of the last day of a year (compartments, ages, water reserve) being the
+# state of the first day of the next one, while the cut flags and the annual
+# totals are reset. The ten days mean temperature of the first days reads the
+# last days of the previous year. Thermal time (sumT) starts again from 0 on
+# 1 January, as it is computed from the weather of the year.
+# The weather is read a year at a time, so a run needs the memory of one year.
+
+import os
+import numpy as np
+
+from modvege import modvege
+from modvege_vec import modvege_vec
+from lib_forcing import to_forcing
+from lib_params import to_params
+from lib_state import run_state
+from lib_read_input_files import read_forcing, read_weather_store
+
+def _read_year(weather):
+    """
+    Load the weather of a year: Forcing, read_weather() array, weather csv file or binary weather store
+    """
+    if isinstance(weather, str):
+        if os.path.isdir(weather):
+            return(read_weather_store(weather))
+        return(read_forcing(weather))
+    return(to_forcing(weather))
+
+def split_years(weather):
+    """
+    Split a weather of several years into its years, a new year starting where DOY goes back to 1
+
+    :param weather: Forcing or read_weather() array of consecutive years
+    :return generator of the Forcing of every year
+    """
+    forcing = to_forcing(weather)
+    doy = forcing.DOY if forcing.DOY.ndim == 1 else forcing.DOY[:, 0]
+    starts = [0] + list(np.flatnonzero(np.diff(doy) < 0) + 1) + [len(doy)]
+    for first, last in zip(starts[:-1], starts[1:]):
+        yield(forcing.days(slice(first, last)))
+
+def modvege_years(params, weathers, state=None, outputs=None, engine='python', sinks=None, blocksize=None):
+    """
+    **Mod Vege** model over consecutive years, the state carried from a year to the next
+
+    The annual totals (harvested and ingested biomass) start again from 0 each year, and so
+    do the cut flags: reproductive growth, stopped by the first cut of a year, resumes the next one.
+
+    :param params: ModvegeParams or array, (44,) or (ncells, 44)
+    :param weathers: the weathers of the years, in order, each a Forcing, read_weather() array, weather csv file
+                     or binary weather store, loaded when its year starts (a generator such as split_years() works)
+    :param state: lib_state.ModvegeState to start from (default is the initial values of params), updated in place
+    :param outputs: names of the variables to record (lib_output.OUTPUT_VARIABLES), default is all
+    :param engine: 'python', 'numba' or 'auto'
+    :param sinks: function year index -> lib_output.OutputSink, to stream the outputs of every year
+    :param blocksize: number of days held in memory before a block is written to a sink
+    :return generator of (year index, ModvegeOutput of the year, or its sink when streaming)
+    """
+    params = to_params(params)
+    for year, weather in enumerate(weathers):
+        forcing = _read_year(weather)
+        shape = np.broadcast_shapes(params.values.shape[:-1], forcing.shape[1:])
+        if year == 0:
+            state = run_state(state, params, shape)
+        else:
+            state.new_year(previous)
+        sink = sinks(year) if sinks is not None else None
+        # every day of the year, from 1 January
+        enddoy = len(forcing) + 1
+        if shape:
+            out = modvege_vec(params, forcing, 1, enddoy, outputs=outputs, engine=engine, sink=sink, blocksize=blocksize, state=state)
+        else:
+            out = modvege(params, forcing, 1, enddoy, outputs=outputs, engine=engine, sink=sink, blocksize=blocksize, state=state)
+        previous = forcing.Temperature
+        yield(year, out)
@@ -1,33 +1,56 @@
 #!/usr/bin env python3
 
 # Mod Vege main code, had to rewrite most of the functions as the Java code was a complete mess
-# This code runs a single geographical "Cell" (as the Java code was trying to do on a grid)
-# This function *should* be self sustaining, nothing else needed.
+# Command line front end of the model, one subcommand per use:
+#   run    runs a single geographical "Cell" and writes its daily outputs to --output
+#          (csv on stdout without --output), --reference prints the fit to out_cut.csv instead
+#   grid   runs many cells (per-cell parameters and/or weather) over a pool of processes
+#   bench  regression and benchmark suite, the arguments are those of modvege_bench.py
+#   plot   runs a cell and plots it, against the reference output if given
+#
+# Command line:
+#   python run_modvege.py run --params params.csv --weather weather.csv --output out.csv
+#   python run_modvege.py run --params params.csv --weather weather.csv --outputs gv_biomass gro > out.csv
+#   python run_modvege.py grid --params params.csv --weather w1.csv w2.csv --output grid.npz --workers 8
+#   python run_modvege.py bench --no-bench
+#   python run_modvege.py plot --params params.csv --weather weather.csv --reference out_cut.csv
+# Plotting (matplotlib) and the comparison to out_cut.csv are only loaded when asked for.
 
+import os
+import sys
+import argparse
 import numpy as np
 
 #Import the model function
-from modvege import *
+from modvege import modvege
 
 # Import ModVege read input files library:
 #   params.csv
 #   weather.csv
-from lib_read_input_files import *
-
-# ONLY FOR DEV
-from lib_read_output_files import *
+from lib_read_input_files import read_params, read_weather, read_forcing
+from lib_params import ModvegeParams
+from lib_forcing import Forcing
+from lib_output import OUTPUT_VARIABLES, SINKS, CsvSink, make_sink, write_sink
 
 # Define the name of the input params file
 input_params_csv='params.csv'
 # Define the name of the input environment file
 input_weather_csv='weather.csv'
+# Define the name of the reference output file (ONLY FOR DEV)
+input_out_csv='out_cut.csv'
+
+OUTPUT_FORMATS = tuple(SINKS) + ('npz',)
 
-def run_modvege(input_params_csv, input_weather_csv):
+def run_modvege(input_params_csv, input_weather_csv, out_csv=input_out_csv, startdoy=1, enddoy=365, engine='python'):
     """
-    Pre-Process the inputs to run Mod Vege model as a function
+    Pre-Process the inputs to run Mod Vege model as a function, and plot it against the reference output
 
     :param input_params_csv: Filename of the csv input parameters
     :param input_weather_csv: Filename of the csv input weather file
+    :param out_csv: Filename of the reference output (out_cut.csv), None to plot the run alone
+    :param startdoy: day of year when the simulation starts
+    :param enddoy: day of year when simulation stops
+    :param engine: 'python', 'numba' or 'auto'
     """
     # Read Parameter files into array
     params = read_params(input_params_csv)
@@ -46,18 +69,26 @@ def run_modvege(input_params_csv, input_weather_csv):
 
     weather = read_weather(input_weather_csv)
 
-    # ONLY FOR DEV
-    out = read_out(out_csv)
-    
-    startdoy = 1
-    enddoy = 365
-
     # Initialize the run and return arrays
-    gv_b, dv_b, gr_b, dr_b, h_b, i_b, gro, abc, sumT, gva, gra, dva, dra, sea, ftm, env, pgr, atr = modvege(params, weather, startdoy, enddoy)
-    
-    # Print the output
-    #print(output)
-    
+    output = modvege(params, weather, startdoy, enddoy, verbose=True, engine=engine)
+
+    out = None
+    if out_csv is not None:
+        # ONLY FOR DEV
+        from lib_read_output_files import read_out
+        out = read_out(out_csv)
+    plot_modvege(output, out)
+
+def plot_modvege(output, out=None, file=None):
+    """
+    Plot the outputs of a run, and the reference output if given
+
+    :param output: the ModvegeOutput of modvege(), all variables recorded
+    :param out: the reference output array of read_out(), or None
+    :param file: save the figure into this image file instead of showing it
+    """
+    gv_b, dv_b, gr_b, dr_b, h_b, i_b, gro, abc, sumT, gva, gra, dva, dra, sea, ftm, env, pgr, atr = output
+
     ################################################  ###################
     # Definition of columns in out_cut.csv            Eq. from output run
     ################################################  ###################
@@ -73,6 +104,11 @@ def run_modvege(input_params_csv, input_weather_csv):
     # 9 Mean available biomass for cut    (kg DM/ha)  abc
 
     #PLOT
+    if out is None:
+        # no reference: the curves of the run only
+        out = np.full((len(output.doy)+1, 10), np.nan)
+        out[:-1, 0] = output.doy
+        out = [tuple(row) for row in out]
     out_doy = [out[i][0] for i in range(len(out)-1) ]
     out_gvb = [out[i][2] for i in range(len(out)-1) ]
     out_grb = [out[i][3] for i in range(len(out)-1) ]
@@ -83,7 +119,10 @@ def run_modvege(input_params_csv, input_weather_csv):
     out_gro = [out[i][8] for i in range(len(out)-1) ]
     out_abc = [out[i][9] for i in range(len(out)-1) ]
 
-    import numpy as np
+    import matplotlib
+    if file is not None:
+        # no display needed to save the figure
+        matplotlib.use('Agg')
     import matplotlib.pyplot as plt
 
     plt.figure(figsize=(15,7))
@@ -159,7 +198,149 @@ def run_modvege(input_params_csv, input_weather_csv):
     plt.grid()
 
     plt.tight_layout()
-    plt.show()
+    if file is None:
+        plt.show()
+    else:
+        plt.savefig(file)
+        plt.close()
+
+def output_format(file, format=None):
+    """
+    Return the format of an output file, default is its extension
+    """
+    if format is None:
+        format = os.path.splitext(file)[1].lstrip('.').lower()
+    if format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format %r, expected one of %s" % (format, ", ".join(OUTPUT_FORMATS)))
+    return(format)
+
+def write_output(output, file, format=None):
+    """
+    Write a ModvegeOutput into a file
+
+    :param output: the ModvegeOutput
+    :param file: the output file (a directory for npy)
+    :param format: one of OUTPUT_FORMATS, default is the extension of file
+    """
+    format = output_format(file, format)
+    if format == 'npz':
+        output.to_npz(file)
+    else:
+        write_sink(output, make_sink(file, format))
+
+def _add_run_arguments(parser):
+    parser.add_argument('--params', default=input_params_csv, help="input parameters file (params.csv)")
+    parser.add_argument('--start', type=int, default=1, help="day of year when the simulation starts")
+    parser.add_argument('--end', type=int, default=365, help="day of year when the simulation stops")
+    parser.add_argument('--engine', default='python', choices=['python', 'numba', 'auto'], help="model engine")
+    parser.add_argument('--outputs', nargs='+', choices=OUTPUT_VARIABLES, help="variables written, default is all")
+    parser.add_argument('-o', '--output', help="output file (run: csv on stdout if neither --output nor --reference is given)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, help="output format, default is the extension of the output file")
+
+def _cmd_run(args):
+    params = read_params(args.params)
+    sink = None
+    if args.output and not args.reference and output_format(args.output, args.format) != 'npz':
+        # streamed to the file, a block of days at a time
+        sink = make_sink(args.output, output_format(args.output, args.format))
+    elif not args.output and not args.reference:
+        # nowhere else to go: csv on stdout
+        sink = CsvSink(sys.stdout)
+    output = modvege(params, read_forcing(args.weather), args.start, args.end, verbose=args.verbose, outputs=args.outputs, engine=args.engine, sink=sink, blocksize=args.blocksize)
+    if args.output and sink is None:
+        write_output(output, args.output, args.format)
+    if args.reference:
+        # Compare to the reference output (opt-in)
+        from modvege_calibration import read_reference, fit_statistics
+        reference = read_reference(args.reference, args.start, args.end)
+        for name, series in reference.items():
+            if output.wants(name):
+                stats = fit_statistics(output[name], series)
+                print("%s: rmse=%.4g nrmse=%.4g bias=%.4g nse=%.4g" % (name, stats['rmse'], stats['nrmse'], stats['bias'], stats['nse']))
+    return(0)
+
+def _cmd_grid(args):
+    from modvege_grid import run_grid
+    if args.params_table:
+        params = ModvegeParams.from_table(args.params_table)
+    else:
+        params = read_params(args.params)
+    if len(args.weather) == 1 and os.path.isdir(args.weather[0]):
+        # a binary weather store, memory-mapped by the workers
+        weather = args.weather[0]
+    elif len(args.weather) == 1:
+        weather = read_forcing(args.weather[0])
+    else:
+        weather = Forcing.stack([read_forcing(f) for f in args.weather])
+    output = run_grid(params, weather, args.start, args.end, outputs=args.outputs, engine=args.engine, chunksize=args.chunksize, max_workers=args.workers)
+    write_output(output, args.output, args.format)
+    return(0)
+
+def _cmd_bench(args, extra):
+    from modvege_bench import main as bench_main
+    return(bench_main(extra))
+
+def _cmd_plot(args):
+    params = read_params(args.params)
+    output = modvege(params, read_forcing(args.weather), args.start, args.end, engine=args.engine)
+    out = None
+    if args.reference:
+        from lib_read_output_files import read_out
+        out = read_out(args.reference)
+    plot_modvege(output, out, args.save)
+    return(0)
+
+def main(argv=None):
+    """
+    Command line entry point, see the header of this file
+    """
+    parser = argparse.ArgumentParser(description="Mod Vege pasture model")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run a cell")
+    _add_run_arguments(run)
+    run.add_argument('--weather', default=input_weather_csv, help="input weather file (weather.csv)")
+    run.add_argument('--reference', help="print the fit statistics against a reference output (out_cut.csv)")
+    run.add_argument('-v', '--verbose', action='store_true', help="print the parameters")
+    run.add_argument('--blocksize', type=int, help="days held in memory before they are written to the output file")
+
+    grid = commands.add_parser('grid', help="run a grid over a pool of processes")
+    _add_run_arguments(grid)
+    grid.add_argument('--params-table', help="per-cell parameters table (one column per parameter name, one row per cell)")
+    grid.add_argument('--weather', nargs='+', required=True, help="weather files (one per cell, or one shared), or a binary weather store directory")
+    grid.add_argument('--workers', type=int, help="number of worker processes, default is the number of CPUs")
+    grid.add_argument('--chunksize', type=int, default=256, help="cells per task")
+
+    commands.add_parser('bench', help="regression and benchmark suite (arguments of modvege_bench.py)", add_help=False)
+
+    plot = commands.add_parser('plot', help="run a cell and plot it")
+    plot.add_argument('--params', default=input_params_csv, help="input parameters file (params.csv)")
+    plot.add_argument('--weather', default=input_weather_csv, help="input weather file (weather.csv)")
+    plot.add_argument('--start', type=int, default=1, help="day of year when the simulation starts")
+    plot.add_argument('--end', type=int, default=365, help="day of year when the simulation stops")
+    plot.add_argument('--engine', default='python', choices=['python', 'numba', 'auto'], help="model engine")
+    plot.add_argument('--reference', help="reference output to plot with the run (out_cut.csv)")
+    plot.add_argument('--save', help="save the figure into this image file instead of showing it")
+
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'bench':
+        return(_cmd_bench(args, extra))
+    if extra:
+        parser.error("unrecognized arguments: %s" % (" ".join(extra)))
+    if args.command == 'grid' and not args.output:
+        parser.error("grid needs an --output file")
+    if args.command == 'run' and not args.output and not args.reference:
+        # the csv goes to stdout, nothing else may be printed there
+        if args.format not in (None, 'csv'):
+            parser.error("run without --output writes csv to stdout, --format %s needs an --output file" % args.format)
+        if args.verbose:
+            parser.error("run without --output writes csv to stdout, --verbose needs an --output file")
+    if args.command == 'run':
+        return(_cmd_run(args))
+    if args.command == 'grid':
+        return(_cmd_grid(args))
+    return(_cmd_plot(args))
 
 # run the main function
-run_modvege(input_params_csv, input_weather_csv)
+if __name__ == '__main__':
+    sys.exit(main())
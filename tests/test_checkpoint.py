@@ -0,0 +1,31 @@
+import os
+import numpy as np
+
+from modvege import modvege
+from modvege_checkpoint import run_checkpointed, save_checkpoint, load_checkpoint
+from lib_state import ModvegeState
+from lib_read_input_files import read_params, read_forcing
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _state(params, forcing):
+    # a state carrying the temperatures of a previous (here shifted) year
+    state = ModvegeState.from_params(params)
+    state.new_year(forcing.Temperature + 5.0)
+    return state
+
+def test_resume_with_temperatures(tmp_path):
+    params = read_params(os.path.join(HERE, 'params.csv'))
+    forcing = read_forcing(os.path.join(HERE, 'weather.csv'))
+    full = modvege(params, forcing, 1, 365, state=_state(params, forcing))
+
+    # a run stopped after its first segment, before DOY 10
+    checkpoint = str(tmp_path / 'run.ckpt')
+    state = _state(params, forcing)
+    modvege(params, forcing, 1, 6, state=state)
+    save_checkpoint(checkpoint, state, 6, 1, 365)
+    saved = load_checkpoint(checkpoint)
+    assert np.array_equal(saved['state'].temperatures, state.temperatures)
+
+    out = run_checkpointed(params, forcing, 1, 365, checkpoint, every=5)
+    assert np.array_equal(out.data[5:], full.data[5:])
@@ -0,0 +1,47 @@
+import os
+import warnings
+import numpy as np
+import pytest
+
+import lib_modvege_numba
+from modvege import modvege
+from modvege_vec import modvege_vec
+from lib_modvege_numba import ENGINE_RTOL, modvege_numba
+from lib_read_input_files import read_params, read_forcing
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WEATHERS = ('weather.csv', 'weather_with_RS.csv')
+
+def _year(weather):
+    return read_params(os.path.join(HERE, 'params.csv')), read_forcing(os.path.join(HERE, weather))
+
+def _assert_close(out, base):
+    # every output within ENGINE_RTOL of the largest value of the python one (at least 1)
+    for name in base.variables:
+        scale = max(float(np.max(np.abs(base[name]))), 1.0)
+        assert float(np.max(np.abs(out[name] - base[name]))) <= ENGINE_RTOL * scale, name
+
+@pytest.mark.parametrize('weather', WEATHERS)
+def test_numba_engine(weather):
+    pytest.importorskip('numba')
+    params, forcing = _year(weather)
+    base = modvege(params, forcing, 1, 365)
+    _assert_close(modvege(params, forcing, 1, 365, engine='numba'), base)
+    _assert_close(modvege_vec(params, forcing, 1, 365, engine='numba'), base)
+
+@pytest.mark.parametrize('weather', WEATHERS)
+def test_uncompiled_kernel(weather):
+    params, forcing = _year(weather)
+    _assert_close(modvege_numba(params, forcing, 1, 365, compiled=False), modvege(params, forcing, 1, 365))
+
+@pytest.mark.parametrize('weather', WEATHERS)
+def test_fallback_without_numba(weather, monkeypatch):
+    params, forcing = _year(weather)
+    base = modvege(params, forcing, 1, 365)
+    monkeypatch.setattr(lib_modvege_numba, 'HAVE_NUMBA', False)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        out = modvege(params, forcing, 1, 365, engine='numba')
+    assert any('numba is not installed' in str(w.message) for w in caught)
+    _assert_close(out, base)
@@ -0,0 +1,38 @@
+import os
+import numpy as np
+import pytest
+
+from modvege_vec import modvege_vec, FASTFORWARD_RTOL
+from lib_forcing import Forcing, FORCING_COLUMNS
+from lib_output import NpySink
+from lib_params import ModvegeParams
+from lib_read_input_files import read_params, read_forcing
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _cold(weather, shift):
+    # the weather of the site, shift degrees colder (longer dormant periods)
+    forcing = read_forcing(os.path.join(HERE, weather))
+    columns = dict((name, np.array(forcing[name])) for name in FORCING_COLUMNS)
+    columns['Temperature'] = columns['Temperature'] - shift
+    return Forcing(columns)
+
+@pytest.mark.parametrize('weather', ('weather.csv', 'weather_with_RS.csv'))
+@pytest.mark.parametrize('shift', (0.0, 4.0))
+def test_fastforward_matches_daily_loop(weather, shift):
+    params = ModvegeParams(np.tile(read_params(os.path.join(HERE, 'params.csv')), (3, 1)))
+    forcing = _cold(weather, shift)
+    daily = modvege_vec(params, forcing, 1, 365)
+    out = modvege_vec(params, forcing, 1, 365, fastforward=True)
+    for name in daily.variables:
+        scale = max(float(np.max(np.abs(daily[name]))), 1.0)
+        assert float(np.max(np.abs(out[name] - daily[name]))) <= FASTFORWARD_RTOL * scale, name
+
+def test_fastforward_streamed(tmp_path):
+    # dormant runs split over blocks of the sink
+    params = read_params(os.path.join(HERE, 'params.csv'))
+    forcing = _cold('weather.csv', 4.0)
+    out = modvege_vec(params, forcing, 1, 365, fastforward=True)
+    modvege_vec(params, forcing, 1, 365, fastforward=True, sink=NpySink(str(tmp_path)), blocksize=7)
+    for name in out.variables:
+        assert np.array_equal(np.load(str(tmp_path / (name + '.npy'))), out[name]), name
@@ -0,0 +1,39 @@
+import os
+import pickle
+import numpy as np
+
+from modvege_tiles import run_tiles
+from lib_raster import NpyRasterWriter, RasterForcing, RasterParams
+from lib_read_input_files import read_params, read_forcing
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _raster(height=4, width=5):
+    forcing = read_forcing(os.path.join(HERE, 'weather.csv'))
+    rng = np.random.default_rng(0)
+    layers = {
+        'Temperature': forcing.Temperature[:, np.newaxis, np.newaxis] + rng.normal(0, 1, (1, height, width)),
+        'PARi': forcing.PARi[:, np.newaxis, np.newaxis] * np.ones((1, height, width)),
+        'PP': forcing.PP[:, np.newaxis, np.newaxis] * np.ones((1, height, width)),
+        'PET': float(np.mean(forcing.PET)),
+    }
+    params = RasterParams(read_params(os.path.join(HERE, 'params.csv')), {'NI': rng.uniform(0.6, 1.0, (height, width))})
+    return params, RasterForcing(layers)
+
+def test_shared_layers_are_not_pickled():
+    params, forcing = _raster()
+    shared = []
+    try:
+        assert len(pickle.dumps(forcing.shared(shared))) < 4096 < len(pickle.dumps(forcing))
+    finally:
+        for layer in shared:
+            layer.unlink()
+
+def test_tiles_over_workers(tmp_path):
+    params, forcing = _raster()
+    outputs = {}
+    for workers in (None, 2):
+        directory = str(tmp_path / str(workers))
+        run_tiles(params, forcing, 1, 365, NpyRasterWriter(directory), outputs=['gv_biomass'], tileshape=(2, 3), max_workers=workers)
+        outputs[workers] = np.load(os.path.join(directory, 'gv_biomass.npy'))
+    assert np.array_equal(outputs[None], outputs[2])
@@ -0,0 +1,18 @@
+import os
+import numpy as np
+
+from modvege_years import modvege_years
+from lib_read_input_files import read_params, read_forcing
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_reproductive_growth_every_year():
+    params = read_params(os.path.join(HERE, 'params.csv'))
+    forcing = read_forcing(os.path.join(HERE, 'weather.csv'))
+    years = [out for year, out in modvege_years(params, [forcing] * 3)]
+    assert len(years) == 3
+    for out in years:
+        # cut during the year, so the flags must have been reset on 1 January
+        assert out['harvested_biomass'][-1] > 0
+        assert out['a2r'].max() > 0
+        assert out['gr_biomass'].max() > 1.0